@@ -2,15 +2,18 @@
 Wenxi网盘 - 数据库配置模块
 作者：Wenxi
 功能：配置数据库连接、会话管理和初始化
+说明：路由使用异步会话（get_async_db），同步引擎只用于建表升级和运维脚本
 """
 
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import BigInteger, Integer, create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from dotenv import load_dotenv
 
 from logger import logger
+from utils.metrics import instrument_engine
 
 # 加载环境变量
 load_dotenv()
@@ -31,41 +34,201 @@ if database_url.startswith('sqlite:///.'):
     # 确保使用正确的路径分隔符
     db_relative_path = db_relative_path.replace('/', os.sep)
     db_path = os.path.join(backend_dir, db_relative_path)
-    DATABASE_URL = f"sqlite:///{db_path.replace('\\\\', '/').replace('\\\\', '/')}"
+    DATABASE_URL = "sqlite:///" + db_path.replace('\\', '/')
 elif database_url.startswith('sqlite:///'):
     # 绝对路径格式: sqlite:///absolute/path/to/file.db
     DATABASE_URL = database_url
 else:
     # 默认使用backend目录
     db_path = os.path.join(backend_dir, 'wenxi_netdisk.db')
-    DATABASE_URL = f"sqlite:///{db_path.replace('\\\\', '/').replace('\\\\', '/')}"
+    DATABASE_URL = "sqlite:///" + db_path.replace('\\', '/')
 
 # 记录实际使用的数据库路径
 logger.info(f"Wenxi - 数据库路径: {DATABASE_URL}")
 
+# 引擎配置档位：auto按URL选择sqlite或server，default保持驱动默认行为（用于对比基准）
+ENGINE_PROFILES = {
+    "default": {},
+    "sqlite": {
+        "pragmas": {
+            "journal_mode": "WAL",          # 读写互不阻塞
+            "synchronous": "NORMAL",        # WAL下仅检查点时fsync，断电最多丢失最近提交
+            "mmap_size": 268435456,         # 256MB内存映射读
+            "cache_size": -65536,           # 64MB页缓存（负数单位为KB）
+            "busy_timeout": 5000,           # 写锁等待5秒而不是立即报database is locked
+            "temp_store": "MEMORY",
+        },
+        "pool": {"pool_size": 10, "max_overflow": 20, "pool_timeout": 30},
+    },
+    "server": {
+        "pool": {"pool_size": 10, "max_overflow": 20, "pool_timeout": 30,
+                 "pool_pre_ping": True, "pool_recycle": 1800},
+    },
+}
+
+
+def resolve_profile(url: str, name: str = "auto") -> str:
+    """
+    Wenxi - 解析引擎配置档位名称
+    auto时SQLite使用sqlite档位，其他数据库使用server档位
+    """
+    name = (name or "auto").lower()
+    if name == "auto":
+        return "sqlite" if url.startswith("sqlite") else "server"
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"未知的数据库配置档位: {name}，可选: auto, {', '.join(ENGINE_PROFILES)}")
+    return name
+
+
+def is_memory_sqlite(url: str) -> bool:
+    """内存SQLite只有单个连接，不能使用WAL和连接池"""
+    scheme, _, rest = url.partition("://")
+    return scheme.startswith("sqlite") and rest in ("", "/", "/:memory:")
+
+
+def engine_options(url: str, profile: str) -> dict:
+    """
+    Wenxi - 生成create_engine/create_async_engine的参数
+    连接池大小可用WENXI_DB_POOL_SIZE和WENXI_DB_MAX_OVERFLOW覆盖
+    """
+    options = {}
+    if url.startswith("sqlite") and "aiosqlite" not in url:
+        options["connect_args"] = {"check_same_thread": False}
+    pool = dict(ENGINE_PROFILES[profile].get("pool", {}))
+    if pool and not is_memory_sqlite(url):
+        pool["pool_size"] = int(os.getenv("WENXI_DB_POOL_SIZE", pool["pool_size"]))
+        pool["max_overflow"] = int(os.getenv("WENXI_DB_MAX_OVERFLOW", pool["max_overflow"]))
+        options.update(pool)
+    return options
+
+
+def apply_sqlite_pragmas(sync_engine, profile: str) -> None:
+    """
+    Wenxi - 每个新连接建立时执行档位中的PRAGMA
+    journal_mode=WAL写入数据库文件本身，其余设置只对当前连接生效
+    """
+    pragmas = ENGINE_PROFILES[profile].get("pragmas")
+    url = str(sync_engine.url)
+    if not pragmas or not url.startswith("sqlite") or is_memory_sqlite(url):
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for key, value in pragmas.items():
+                cursor.execute(f"PRAGMA {key}={value}")
+        finally:
+            cursor.close()
+
+
+def build_engine(url: str, profile: str = "auto"):
+    """Wenxi - 按配置档位创建同步引擎"""
+    profile = resolve_profile(url, profile)
+    sync_engine = create_engine(url, **engine_options(url, profile))
+    apply_sqlite_pragmas(sync_engine, profile)
+    instrument_engine(sync_engine)
+    return sync_engine
+
+
+def build_async_engine(url: str, profile: str = "auto"):
+    """Wenxi - 按配置档位创建异步引擎，PRAGMA挂在其底层同步引擎上"""
+    profile = resolve_profile(url, profile)
+    new_engine = create_async_engine(url, **engine_options(url, profile))
+    apply_sqlite_pragmas(new_engine.sync_engine, profile)
+    instrument_engine(new_engine.sync_engine)
+    return new_engine
+
+
+DB_PROFILE = resolve_profile(DATABASE_URL, os.getenv("WENXI_DB_PROFILE", "auto"))
+logger.info(f"Wenxi - 数据库配置档位: {DB_PROFILE}")
+
 # 创建数据库引擎
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+engine = build_engine(DATABASE_URL, DB_PROFILE)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 同步URL对应的异步驱动（服务器数据库需另行安装asyncpg/aiomysql）
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Wenxi - 将同步数据库URL转换为异步驱动URL
+    例如 sqlite:///a.db -> sqlite+aiosqlite:///a.db，mysql+pymysql -> mysql+aiomysql，已是异步驱动的URL原样返回
+    """
+    scheme, sep, rest = url.partition("://")
+    if scheme in ASYNC_DRIVERS.values():
+        return url
+    dialect = scheme.split("+", 1)[0]
+    return f"{ASYNC_DRIVERS.get(dialect, scheme)}{sep}{rest}"
+
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+# 创建异步引擎与会话工厂：查询在驱动线程/协程中执行，不阻塞事件循环
+async_engine = build_async_engine(ASYNC_DATABASE_URL, DB_PROFILE)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # 导入Base用于创建表
 import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from models import Base
+from utils.search import ensure_search_index
+
+def needs_widening(dialect_name: str, column, existing_type) -> bool:
+    """模型中为BigInteger而数据库中仍是32位整数的列"""
+    return (dialect_name in ("postgresql", "mysql")
+            and isinstance(column.type, BigInteger)
+            and isinstance(existing_type, Integer) and not isinstance(existing_type, BigInteger))
+
+def widen_column(conn, table_name: str, column):
+    """把整数列改为BIGINT，保留是否可空"""
+    if engine.dialect.name == "postgresql":
+        conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {column.name} TYPE BIGINT"))
+    else:
+        nullable = "NULL" if column.nullable else "NOT NULL"
+        conn.execute(text(f"ALTER TABLE {table_name} MODIFY {column.name} BIGINT {nullable}"))
+
+def upgrade_schema():
+    """
+    Wenxi - 升级已有数据库结构
+    功能：create_all不会修改已存在的表，这里为旧表补齐新增的可空列和索引，
+          并把改为BigInteger的旧INTEGER列（如文件大小）加宽为BIGINT（SQLite的INTEGER本就是64位，无需修改）
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    logger.info(f"Wenxi - 数据库升级: {table.name}.{column.name}")
+                elif needs_widening(engine.dialect.name, column, existing[column.name]):
+                    widen_column(conn, table.name, column)
+                    logger.info(f"Wenxi - 数据库升级: {table.name}.{column.name} 改为BIGINT")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 def init_db():
     """
     Wenxi - 初始化数据库
-    功能：创建所有数据库表结构
+    功能：创建所有数据库表结构，并升级旧版本数据库
     """
     try:
         logger.info("Wenxi - 开始初始化数据库...")
         Base.metadata.create_all(bind=engine)
+        upgrade_schema()
+        ensure_search_index(engine)
         logger.info("Wenxi - 数据库初始化成功")
         return True
     except Exception as e:
@@ -81,4 +244,12 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """
+    Wenxi - 获取异步数据库会话
+    功能：为每个请求提供独立的异步会话，等待数据库时事件循环可继续处理其他请求
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
@@ -6,7 +6,7 @@ Wenxi网盘 - FastAPI主应用
 
 import os
 from pathlib import Path
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
@@ -14,6 +14,8 @@ from dotenv import load_dotenv
 
 from logger import logger
 from routers import auth, files
+from utils.metrics import MetricsMiddleware, registry
+from utils.tracing import TracingMiddleware, trace_writer
 
 # 从根目录加载环境变量
 root_dir = Path(__file__).parent.parent
@@ -30,9 +32,27 @@ async def lifespan(app: FastAPI):
     os.makedirs(upload_dir, exist_ok=True)
     logger.info(f"✅ 上传目录已准备: {upload_dir}")
     
+    # 创建缺失的表并升级旧数据库结构
+    from database import init_db
+    init_db()
+    
+    # 预派生加密密钥，首个上传/下载请求无需等待PBKDF2
+    from utils.encryption import warm_key_cache, clear_key_cache
+    warm_key_cache()
+    
     yield
     
     logger.info("📁 Wenxi网盘关闭中...")
+    from utils.crypto_engine import crypto_engine
+    crypto_engine.shutdown()
+    from utils.password_pool import password_hasher
+    password_hasher.shutdown()
+    clear_key_cache()
+    trace_writer.close()
+    from utils.cache import close_cache
+    await close_cache()
+    from database import async_engine
+    await async_engine.dispose()
 
 
 # 创建FastAPI应用
@@ -52,8 +72,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # 文件列表下一页游标
 )
 
+# 分阶段计时（Server-Timing响应头与追踪文件）
+app.add_middleware(TracingMiddleware)
+
+# 请求计数与耗时（最外层，流式响应发送完毕才计为结束）
+app.add_middleware(MetricsMiddleware)
+
 # 挂载静态文件
 uploads_path = os.path.join(os.path.dirname(__file__), "uploads")
 # 确保上传目录存在
@@ -82,6 +109,12 @@ async def health_check():
     return {"status": "healthy", "timestamp": "2025-08-02T13:51:00"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus文本格式指标"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 if __name__ == "__main__":
     import uvicorn
     
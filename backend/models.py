@@ -5,7 +5,7 @@ Wenxi网盘 - 数据库模型
 """
 
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -28,6 +28,29 @@ class User(Base):
     files = relationship("File", back_populates="owner")
 
 
+class FileBlob(Base):
+    """加密内容模型 - 按SHA256内容寻址，多条文件记录共享同一份加密数据"""
+    __tablename__ = "file_blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    checksum = Column(String(64), unique=True, index=True, nullable=False)  # 明文SHA256
+    file_path = Column(String(500), nullable=False)  # 加密文件相对路径
+    file_size = Column(BigInteger, nullable=False)  # 明文字节数（可超过2GB）
+    ref_count = Column(Integer, nullable=False, default=1)  # 引用该内容的文件记录数
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class FileMerkle(Base):
+    """内容的Merkle树 - 叶子为每个加密块明文的哈希，校验任意区间只需读取覆盖它的块"""
+    __tablename__ = "file_merkle"
+    
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), primary_key=True)
+    block_size = Column(Integer, nullable=False)  # 叶子对应的明文块大小（即密文块大小）
+    root = Column(String(64), nullable=False)  # 根哈希十六进制
+    leaves = Column(LargeBinary, nullable=False)  # 叶子哈希依次拼接，每个32字节
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
 class File(Base):
     """文件模型"""
     __tablename__ = "files"
@@ -36,7 +59,7 @@ class File(Base):
     filename = Column(String(255), nullable=False)
     original_filename = Column(String(255), nullable=False)
     file_path = Column(String(500), nullable=False)  # 存储相对路径
-    file_size = Column(Integer, nullable=False)  # 字节
+    file_size = Column(BigInteger, nullable=False)  # 字节（可超过2GB）
     mime_type = Column(String(100))
     
     # 关联用户
@@ -53,4 +76,40 @@ class File(Base):
     
     # 额外信息
     description = Column(Text, nullable=True)
-    checksum = Column(String(64), nullable=True)  # 文件校验和
\ No newline at end of file
+    checksum = Column(String(64), nullable=True, index=True)  # 文件校验和
+    
+    # 内容去重：指向共享的加密内容，旧数据为空
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), nullable=True, index=True)
+    blob = relationship("FileBlob")
+    
+    # 文件列表键集分页：每种排序方式一个(owner_id, 排序列, id)复合索引
+    __table_args__ = (
+        Index("ix_files_owner_created", "owner_id", "created_at", "id"),
+        Index("ix_files_owner_name", "owner_id", "original_filename", "id"),
+        Index("ix_files_owner_size", "owner_id", "file_size", "id"),
+    )
+
+
+class UploadSession(Base):
+    """断点续传上传会话 - 服务器签发ID，记录预期大小、分块大小与已接收的分块区间"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String(32), primary_key=True)  # 会话ID（UUID十六进制）
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    file_name = Column(String(255), nullable=False)
+    file_size = Column(BigInteger, nullable=False)  # 预期明文字节数
+    chunk_size = Column(Integer, nullable=False)  # 分块大小，最后一块可以更短
+    mime_type = Column(String(100), nullable=True)
+    description = Column(Text, nullable=True)
+    checksum = Column(String(64), nullable=True)  # 客户端声明的SHA256，完成时校验
+    
+    # 数据文件的v3加密参数：分块到达即按块加密写入，完成时数据文件就是最终密文
+    file_salt = Column(String(32), nullable=True)  # 文件级HKDF盐值（十六进制）
+    block_size = Column(Integer, nullable=True)  # 加密块大小，整除分块大小
+    
+    # 已接收分块位图（第i位对应第i个分块，低位在前）；version用于乐观并发更新
+    received = Column(LargeBinary, nullable=False, default=b"")
+    version = Column(Integer, nullable=False, default=0)
+    
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = Column(DateTime, nullable=False, index=True)  # UTC，每收到一个分块顺延
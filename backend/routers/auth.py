@@ -4,6 +4,7 @@ Wenxi网盘 - 用户认证模块
 功能：处理用户注册、登录、JWT认证
 """
 
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from pathlib import Path
@@ -11,15 +12,19 @@ from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
-from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 import jwt
 from jwt.exceptions import InvalidTokenError
 from dotenv import load_dotenv
 
 from logger import logger
-from database import get_db
+from database import get_async_db
 from models import User, File as FileModel
+from utils.identity_cache import get_user_by_username, invalidate_file, invalidate_user
+from utils.file_meta import invalidate_file_meta
+from utils.tracing import record_span
+from utils.password_pool import HashPoolBusy, password_hasher
 import os
 
 # 从根目录加载环境变量
@@ -37,8 +42,6 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("WENXI_JWT_EXPIRE_MINUTES"))
 if not os.environ.get("WENXI_JWT_EXPIRE_MINUTES"):
     raise ValueError("环境变量 WENXI_JWT_EXPIRE_MINUTES 未设置")
 
-# 密码加密
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
 router = APIRouter()
@@ -71,14 +74,29 @@ class UserResponse(BaseModel):
     created_at: datetime
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
+def hash_busy_error() -> HTTPException:
+    """哈希线程池繁忙时的响应，客户端稍后重试"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="服务器繁忙，请稍后重试",
+        headers={"Retry-After": "1"},
+    )
+
 
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """验证密码（在哈希线程池中执行）"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HashPoolBusy:
+        raise hash_busy_error()
 
-def get_password_hash(password: str) -> str:
-    """加密密码"""
-    return pwd_context.hash(password)
+
+async def get_password_hash(password: str) -> str:
+    """加密密码（在哈希线程池中执行）"""
+    try:
+        return await password_hasher.hash(password)
+    except HashPoolBusy:
+        raise hash_busy_error()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -94,8 +112,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """获取当前用户 - Wenxi JWT验证增强版"""
+    start = time.perf_counter()
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
@@ -135,17 +154,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
     
     # 验证用户存在
-    user = db.query(User).filter(User.username == username).first()
+    user = await get_user_by_username(db, username)
     if user is None:
         logger.warning(f"JWT令牌中的用户不存在: {username}")
         raise credentials_exception
         
     logger.debug(f"JWT验证成功: {username}")
+    record_span("auth", time.perf_counter() - start)
     return user
 
 
-async def get_current_user_from_token(token: str, db: Session = Depends(get_db)):
+async def get_current_user_from_token(token: str, db: AsyncSession = Depends(get_async_db)):
     """通过token字符串获取当前用户（用于iframe下载）- Wenxi增强版"""
+    start = time.perf_counter()
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无效的认证令牌",
@@ -188,22 +209,23 @@ async def get_current_user_from_token(token: str, db: Session = Depends(get_db))
         raise credentials_exception
     
     # 验证用户存在
-    user = db.query(User).filter(User.username == username).first()
+    user = await get_user_by_username(db, username)
     if user is None:
         logger.warning(f"iframe下载：JWT令牌中的用户不存在: {username}")
         raise credentials_exception
         
     logger.debug(f"iframe下载：JWT验证成功: {username}")
+    record_span("auth", time.perf_counter() - start)
     return user
 
 
 @router.post("/register", response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """用户注册"""
     logger.info(f"注册新用户: {user.username}")
     
     # 检查用户名是否已存在
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = await db.scalar(select(User).where(User.username == user.username))
     if db_user:
         logger.warning(f"用户名已存在: {user.username}")
         raise HTTPException(
@@ -212,7 +234,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # 检查邮箱是否已存在
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await db.scalar(select(User).where(User.email == user.email))
     if db_user:
         logger.warning(f"邮箱已存在: {user.email}")
         raise HTTPException(
@@ -221,7 +243,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # 创建新用户
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -229,21 +251,28 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     logger.info(f"用户注册成功: {user.username} (ID: {db_user.id})")
     return db_user
 
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """用户登录"""
     logger.info(f"用户登录: {form_data.username}")
     
     # 查找用户
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.username == form_data.username))
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+        except HashPoolBusy:
+            logger.warning(f"密码哈希繁忙，拒绝登录: {form_data.username}")
+            raise hash_busy_error()
+    if not valid:
         logger.warning(f"登录失败: {form_data.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -251,6 +280,13 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # 旧哈希成本低于当前配置时透明升级
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        invalidate_user(user.username)
+        logger.info(f"用户 {user.username} 的密码哈希已升级")
+    
     # 创建访问令牌 - Wenxi支持记住我功能
     remember_me = form_data.client_id == "remember_me"
     if remember_me:
@@ -301,16 +337,16 @@ class DeleteAccountRequest(BaseModel):
 async def update_username(
     request: UpdateUsernameRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """修改用户名"""
     logger.info(f"用户 {current_user.username} 尝试修改用户名为: {request.username}")
     
     # 检查新用户名是否已存在
-    existing_user = db.query(User).filter(
+    existing_user = await db.scalar(select(User).where(
         User.username == request.username,
         User.id != current_user.id
-    ).first()
+    ))
     
     if existing_user:
         logger.warning(f"用户名已存在: {request.username}")
@@ -320,8 +356,10 @@ async def update_username(
         )
     
     # 更新用户名
+    old_username = current_user.username
     current_user.username = request.username
-    db.commit()
+    await db.commit()
+    invalidate_user(old_username)
     
     logger.info(f"用户名修改成功: {current_user.id} -> {request.username}")
     return {"message": "用户名修改成功"}
@@ -331,13 +369,13 @@ async def update_username(
 async def update_email(
     request: UpdateEmailRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """修改邮箱"""
     logger.info(f"用户 {current_user.username} 尝试修改邮箱为: {request.email}")
     
     # 验证原密码
-    if not verify_password(request.password, current_user.hashed_password):
+    if not await verify_password(request.password, current_user.hashed_password):
         logger.warning(f"密码验证失败: {current_user.username}")
         raise HTTPException(
             status_code=400,
@@ -345,10 +383,10 @@ async def update_email(
         )
     
     # 检查新邮箱是否已存在
-    existing_user = db.query(User).filter(
+    existing_user = await db.scalar(select(User).where(
         User.email == request.email,
         User.id != current_user.id
-    ).first()
+    ))
     
     if existing_user:
         logger.warning(f"邮箱已存在: {request.email}")
@@ -359,7 +397,8 @@ async def update_email(
     
     # 更新邮箱
     current_user.email = request.email
-    db.commit()
+    await db.commit()
+    invalidate_user(current_user.username)
     
     logger.info(f"邮箱修改成功: {current_user.id} -> {request.email}")
     return {"message": "邮箱修改成功"}
@@ -369,13 +408,13 @@ async def update_email(
 async def update_password(
     request: UpdatePasswordRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """修改密码"""
     logger.info(f"用户 {current_user.username} 尝试修改密码")
     
     # 验证原密码
-    if not verify_password(request.old_password, current_user.hashed_password):
+    if not await verify_password(request.old_password, current_user.hashed_password):
         logger.warning(f"原密码验证失败: {current_user.username}")
         raise HTTPException(
             status_code=400,
@@ -383,8 +422,9 @@ async def update_password(
         )
     
     # 更新密码
-    current_user.hashed_password = get_password_hash(request.new_password)
-    db.commit()
+    current_user.hashed_password = await get_password_hash(request.new_password)
+    await db.commit()
+    invalidate_user(current_user.username)
     
     logger.info(f"密码修改成功: {current_user.username}")
     return {"message": "密码修改成功"}
@@ -394,7 +434,7 @@ async def update_password(
 async def delete_account(
     request: DeleteAccountRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除账户 - 永久删除用户及其所有数据"""
     logger.info(f"用户 {current_user.username} 尝试删除账户")
@@ -416,7 +456,7 @@ async def delete_account(
         )
     
     # 验证密码
-    if not verify_password(request.password, current_user.hashed_password):
+    if not await verify_password(request.password, current_user.hashed_password):
         logger.warning(f"密码验证失败: {current_user.username}")
         raise HTTPException(
             status_code=400,
@@ -424,32 +464,52 @@ async def delete_account(
         )
     
     try:
-        # 获取用户的所有文件
-        user_files = db.query(FileModel).filter(FileModel.owner_id == current_user.id).all()
+        # 获取用户的所有文件；共享内容仅在最后一个引用删除后才删除物理文件
+        from utils.dedup import release_blob
+        user_files = (await db.scalars(select(FileModel).where(FileModel.owner_id == current_user.id))).all()
+        orphan_paths = []
+        for file_record in user_files:
+            if file_record.blob_id is None:
+                orphan_paths.append(file_record.file_path)
+            else:
+                orphan_path = await release_blob(db, file_record.blob_id)
+                if orphan_path:
+                    orphan_paths.append(orphan_path)
         
-        # 删除物理文件
+        # 删除数据库中的文件记录
+        await db.execute(delete(FileModel).where(FileModel.owner_id == current_user.id))
+        
+        # 删除未完成的上传会话
+        from utils.upload_sessions import delete_user_sessions, remove_session_files
+        session_ids = await delete_user_sessions(db, current_user.id)
+        
+        # 删除用户记录
+        await db.delete(current_user)
+        await db.commit()
+        invalidate_user(current_user.username)
         for file_record in user_files:
+            invalidate_file(file_record.id)
+            await invalidate_file_meta(file_record.id, file_record.share_token)
+        
+        for session_id in session_ids:
+            remove_session_files(session_id)
+        
+        # 删除物理文件
+        for relative_path in orphan_paths:
             try:
-                file_path = os.path.join(os.path.dirname(__file__), "..", file_record.file_path)
+                file_path = os.path.join(os.path.dirname(__file__), "..", relative_path)
                 if os.path.exists(file_path):
                     os.remove(file_path)
-                    logger.info(f"已删除文件: {file_record.original_filename}")
+                    logger.info(f"已删除文件: {relative_path}")
             except Exception as e:
-                logger.error(f"删除文件失败: {file_record.file_path}, 错误: {e}")
-        
-        # 删除数据库中的文件记录
-        db.query(FileModel).filter(FileModel.owner_id == current_user.id).delete()
-        
-        # 删除用户记录
-        db.delete(current_user)
-        db.commit()
+                logger.error(f"删除文件失败: {relative_path}, 错误: {e}")
         
         logger.info(f"账户删除成功: {current_user.username} (ID: {current_user.id})")
         
         return {"message": "账户已成功删除"}
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"删除账户失败: {current_user.username}, 错误: {e}")
         raise HTTPException(
             status_code=500,
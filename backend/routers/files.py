@@ -6,24 +6,31 @@ Wenxi网盘 - 文件管理模块
 """
 
 import os
+import time
 import uuid
 import hashlib
 import asyncio
-import aiofiles
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import List, Literal, Optional, Dict
 from concurrent.futures import ThreadPoolExecutor
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import FileResponse, StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Form, BackgroundTasks, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-import redis.asyncio as redis
 
 from logger import logger
-from database import get_db
+from database import get_async_db
 from models import File as FileModel, User
 from routers.auth import get_current_user
+from utils.pagination import CursorError, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, RELEVANCE, SORT_COLUMNS, apply_keyset, page_with_cursor
+from utils.search import apply_search
+from utils.identity_cache import cache_stats, get_owned_file, get_user_by_username, invalidate_file
+from utils import metrics
+from utils.tracing import bind_context, record_span, span, timed_iter
+from utils.file_meta import FileMeta, get_owned_file_meta, get_shared_file_meta, invalidate_file_meta, remember_file_meta
+from utils.merkle import block_range, ensure_tree, new_tree, range_proof, split_leaves, verify_stored_range
 
 
 router = APIRouter()
@@ -39,15 +46,51 @@ class FileUploadResponse(BaseModel):
     upload_speed: Optional[float] = None
 
 
+class InstantUploadResponse(BaseModel):
+    """秒传预检响应"""
+    instant: bool
+    file: Optional[FileUploadResponse] = None
+
+
 class FileListResponse(BaseModel):
-    """文件列表响应"""
+    """文件列表响应，指定fields时只返回所选字段"""
     id: int
-    filename: str
-    original_filename: str
+    filename: Optional[str] = None
+    original_filename: Optional[str] = None
+    file_size: Optional[int] = None
+    mime_type: Optional[str] = None
+    created_at: Optional[datetime] = None
+    is_shared: Optional[bool] = None
+
+
+# 列表可返回的字段 -> 模型列
+LIST_FIELDS = {
+    "id": FileModel.id,
+    "filename": FileModel.filename,
+    "original_filename": FileModel.original_filename,
+    "file_size": FileModel.file_size,
+    "mime_type": FileModel.mime_type,
+    "created_at": FileModel.created_at,
+    "is_shared": FileModel.is_shared,
+}
+
+
+class MerkleResponse(BaseModel):
+    """文件的Merkle树信息，指定区间时附带该区间的叶子与到根的证明（均为十六进制）"""
+    block_size: int
     file_size: int
-    mime_type: Optional[str]
-    created_at: datetime
-    is_shared: bool
+    leaf_count: int
+    root: str
+    first_block: int = 0
+    leaves: List[str] = []
+    proof: List[str] = []
+
+
+class VerifyResponse(BaseModel):
+    """完整性校验结果"""
+    valid: bool
+    blocks: int
+    root: str
 
 
 class FileShareResponse(BaseModel):
@@ -56,12 +99,36 @@ class FileShareResponse(BaseModel):
     share_token: str
 
 
-class ChunkUploadResponse(BaseModel):
-    """分片上传响应"""
-    chunk_id: str
+class UploadSessionCreate(BaseModel):
+    """创建上传会话请求"""
+    file_name: str
+    file_size: int
+    chunk_size: Optional[int] = None  # 默认WENXI_UPLOAD_CHUNK_SIZE
+    file_hash: Optional[str] = None  # 整个文件的SHA256，提供时完成上传前校验
+    mime_type: Optional[str] = None
+    description: Optional[str] = None
+
+
+class UploadSessionResponse(BaseModel):
+    """上传会话状态"""
+    upload_id: str
+    file_name: str
+    file_size: int
+    chunk_size: int
+    total_chunks: int
+    missing: List[List[int]]  # 尚未接收的分块序号半开区间[[start, end), ...]
+    received_chunks: int
+    received_bytes: int
+    expires_at: datetime
+
+
+class UploadPartResponse(BaseModel):
+    """分块上传响应"""
     upload_id: str
-    offset: int
-    status: str
+    index: int
+    size: int
+    received_chunks: int
+    total_chunks: int
 
 
 class PerformanceMetrics(BaseModel):
@@ -70,33 +137,30 @@ class PerformanceMetrics(BaseModel):
     download_speed: float
     compression_ratio: float
     cache_hit_rate: float
+    identity_cache: Dict[str, dict] = {}
+    cache: dict = {}
+    file_meta: dict = {}
+    in_flight: int = 0
+    timings: Dict[str, dict] = {}  # 各阶段耗时（秒）：count/sum/avg/p50/p95/p99
 
 
 # Wenxi全局配置
 CHUNK_SIZE = 16 * 1024 * 1024  # 16MB分片（提升8倍速度）
 MAX_CONCURRENT_UPLOADS = 16  # 并发数提升至16个
-CACHE_TTL = 10800  # 3小时缓存（减少90%数据库查询）
 BUFFER_SIZE = 32 * 1024 * 1024  # 32MB缓冲区（零拷贝传输）
+PIPELINE_BATCH_SIZE = 4 * 1024 * 1024  # 上传流水线每批哈希+加密的数据量
+HASH_BUFFER_SIZE = 4 * 1024 * 1024  # 整文件重新计算哈希时每次读取的数据量
+MAX_RANGES = 16  # 单个Range请求允许的区间数，超过时忽略Range头返回完整文件
 
-# Redis缓存客户端
-redis_client = None
 executor = ThreadPoolExecutor(max_workers=4)
 
 
-async def get_redis_client():
-    """获取Redis缓存客户端"""
-    global redis_client
-    if redis_client is None:
-        redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-    return redis_client
-
-
 def calculate_file_hash(file_path: str) -> str:
-    """计算文件SHA256校验和"""
+    """计算文件SHA256校验和（上传路径已边接收边哈希，这里供离线校验，以大块读取，请在线程池中调用）"""
     sha256_hash = hashlib.sha256()
     try:
         with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
+            for byte_block in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
                 sha256_hash.update(byte_block)
         return sha256_hash.hexdigest()
     except Exception as e:
@@ -104,28 +168,63 @@ def calculate_file_hash(file_path: str) -> str:
         return ""
 
 
+def hash_and_encrypt(hasher, encryptor, data: bytes) -> None:
+    """在线程池中对同一批数据更新SHA256并加密写盘，分别计时（经bind_context提交时计入当前请求）"""
+    start = time.perf_counter()
+    hasher.update(data)
+    hashed = time.perf_counter()
+    encryptor.write(data)
+    encrypt_seconds = time.perf_counter() - hashed
+    metrics.hash_seconds.observe(hashed - start)
+    metrics.crypto_seconds.observe(encrypt_seconds, operation="encrypt")
+    metrics.crypto_bytes_total.inc(len(data), operation="encrypt")
+    record_span("hash", hashed - start)
+    record_span("encrypt", encrypt_seconds)
+
+
+def remove_stored_file(relative_path: str) -> None:
+    """删除已不再被引用的加密文件（路径相对于backend目录）"""
+    file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", relative_path))
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except OSError as e:
+        logger.warning(f"Wenxi - 删除加密文件失败: {file_path}, {e}")
+
+
 @router.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
-    file: UploadFile = File(...),
-    description: Optional[str] = Form(None),
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
     """
-    Wenxi - 高性能文件上传接口（优化版）
-    功能：支持异步流式处理、缓存优化、性能监控、并发优化
+    Wenxi - 高性能文件上传接口（单遍流水线版）
+    表单字段：file（文件）、description（可选描述）
+    功能：请求体边到达边解析，同一遍内完成SHA256计算与ChaCha20-Poly1305加密
     性能提升：
-    - 异步文件写入，减少IO阻塞
-    - 内存缓存，减少重复计算
-    - 压缩传输，减少网络开销
-    - 优化缓冲区大小，提升吞吐量
+    - 明文不落盘：无multipart临时文件、无.tmp文件，磁盘只写一遍密文
+    - 哈希与加密在线程池中执行，事件循环保持响应
+    - 双缓冲：加密上一批数据的同时继续接收下一批
+    - 内容去重：相同内容已存在时只增加引用，丢弃本次密文
     """
+    from utils.encryption import EncryptStream
+    from utils.multipart_stream import StreamingFormParser
+    from utils.dedup import register_blob
+    
+    encryptor = None
+    pending = None
     try:
         start_time = datetime.now()
         
         # 性能监控
-        logger.info(f"Wenxi - 开始高性能文件上传: {file.filename}")
+        logger.info("Wenxi - 开始高性能文件上传")
+        
+        try:
+            parser = StreamingFormParser(request.headers.get("content-type"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # 生成唯一文件名（不带扩展名，统一加密格式）
         unique_filename = uuid.uuid4().hex  # 仅使用UUID作为文件名，不带扩展名
@@ -143,82 +242,83 @@ async def upload_file(
         
         file_path = os.path.join(upload_dir, unique_filename)
         
-        # 上传优化：合理缓冲区设置，减少IO阻塞
-        file_size = 0
-        chunk_count = 0
-        buffer_size = BUFFER_SIZE  # 16MB缓冲区，零拷贝传输
-        
-        # 创建临时文件用于原始数据
-        temp_path = file_path + ".tmp"
-        
-        async with aiofiles.open(temp_path, 'wb') as buffer:
-            while True:
-                chunk = await file.read(buffer_size)
-                if not chunk:
-                    break
-                await buffer.write(chunk)
-                file_size += len(chunk)
-                chunk_count += 1
-                
-                # 每20MB记录一次进度
-                if chunk_count % 20 == 0:
-                    elapsed = (datetime.now() - start_time).total_seconds()
-                    speed = file_size / elapsed / 1024 / 1024 if elapsed > 0 else 0
-                    logger.debug(f"Wenxi - 上传进度: {file.filename} - {file_size / 1024 / 1024:.2f}MB ({speed:.2f}MB/s)")
-        
-        # 计算文件校验和（使用线程池避免阻塞）
         loop = asyncio.get_event_loop()
-        checksum = await loop.run_in_executor(executor, calculate_file_hash, temp_path)
+        hasher = hashlib.sha256()
+        with span("open"):  # 创建密文文件并写入文件头（密钥未缓存时含kdf）
+            encryptor = await loop.run_in_executor(executor, bind_context(EncryptStream), file_path)
         
-        # 保存到数据库
+        # 单遍流水线：解析 -> 哈希 -> 加密写盘
+        batch = bytearray()
+        batch_count = 0
+        try:
+            async for body_chunk in timed_iter(request.stream(), "recv"):
+                with span("parse"):
+                    batch += parser.feed(body_chunk)
+                if len(batch) < PIPELINE_BATCH_SIZE:
+                    continue
+                if pending is not None:
+                    with span("encrypt_wait"):  # 上一批尚未加密完，接收被CPU拖慢
+                        await pending
+                pending = loop.run_in_executor(executor, bind_context(hash_and_encrypt), hasher, encryptor, bytes(batch))
+                batch.clear()
+                batch_count += 1
+                
+                # 每20批记录一次进度
+                if batch_count % 20 == 0:
+                    elapsed = (datetime.now() - start_time).total_seconds()
+                    speed = encryptor.size / elapsed / 1024 / 1024 if elapsed > 0 else 0
+                    logger.debug(f"Wenxi - 上传进度: {parser.filename} - {encryptor.size / 1024 / 1024:.2f}MB ({speed:.2f}MB/s)")
+            batch += parser.finish()
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if pending is not None:
+            with span("encrypt_wait"):
+                await pending
+        await loop.run_in_executor(executor, bind_context(hash_and_encrypt), hasher, encryptor, bytes(batch))
+        with span("encrypt"):
+            file_size = await loop.run_in_executor(executor, encryptor.close)
+        checksum = hasher.hexdigest()
+        description = parser.fields.get("description")
+        
+        # 保存到数据库，相同内容共享同一份密文；新内容顺带保存加密时算好的Merkle树
+        blob, created = await register_blob(db, checksum, file_size, f"uploads/{unique_filename}")
+        if created:
+            db.add(new_tree(blob.id, encryptor.layout.chunk_size, bytes(encryptor.leaves)))
         db_file = FileModel(
-            filename=unique_filename,
-            original_filename=file.filename,
-            file_path=f"uploads/{unique_filename}",
+            filename=os.path.basename(blob.file_path),
+            original_filename=parser.filename,
+            file_path=blob.file_path,
             file_size=file_size,
-            mime_type=file.content_type,
+            mime_type=parser.content_type,
             owner_id=current_user.id,
             checksum=checksum,
-            description=description
+            description=description,
+            blob_id=blob.id
         )
         
         db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
-        
-        # 加密文件
-        from utils.encryption import encrypt_file
-        encrypt_success = encrypt_file(temp_path, file_path, user_id=current_user.id, file_id=db_file.id)
-        
-        # 删除临时文件
-        os.remove(temp_path)
-        
-        if not encrypt_success:
-            # 如果加密失败，删除数据库记录
-            db.delete(db_file)
-            db.commit()
-            raise HTTPException(status_code=500, detail="文件加密失败")
+        with span("commit"):
+            await db.commit()
+        await db.refresh(db_file)
+        cipher = encryptor.layout.version if created else None
+        encryptor = None
+        if created:
+            metrics.stored_bytes_total.inc(os.path.getsize(file_path))
+        else:
+            logger.info(f"Wenxi - 内容已存在，复用加密文件: {blob.file_path}")
+            os.remove(file_path)
         
         # 计算性能指标
         upload_time = (datetime.now() - start_time).total_seconds()
-        upload_speed = file_size / upload_time / 1024 / 1024  # MB/s
+        upload_speed = file_size / upload_time / 1024 / 1024 if upload_time > 0 else 0  # MB/s
+        metrics.record_transfer("upload", file_size, upload_time)
         
-        # 缓存文件元数据（带Redis连接失败处理）
-        try:
-            redis = await get_redis_client()
-            await redis.setex(
-                f"file:meta:{db_file.id}",
-                CACHE_TTL,
-                str({"filename": file.filename, "size": file_size})
-            )
-            
-            # 异步清理任务
-            background_tasks.add_task(cleanup_cache, redis, db_file.id)
-        except Exception as e:
-            # Redis连接失败，跳过缓存
-            logger.warning(f"Wenxi - Redis连接失败，跳过缓存设置: {e}")
+        # 缓存文件元数据，首次下载无需查询数据库（复用已有内容时密文版本待下载时补全）
+        with span("cache"):
+            await remember_file_meta(FileMeta.from_file(db_file, cipher))
         
-        logger.info(f"Wenxi - 文件上传完成: {file.filename} ({file_size} bytes, {upload_speed:.2f}MB/s)")
+        logger.info(f"Wenxi - 文件上传完成: {parser.filename} ({file_size} bytes, {upload_speed:.2f}MB/s)")
         
         return FileUploadResponse(
             id=db_file.id,
@@ -229,232 +329,549 @@ async def upload_file(
             upload_speed=upload_speed
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Wenxi - 文件上传失败: {e}")
         raise HTTPException(status_code=500, detail="文件上传失败")
+    finally:
+        # 未完成入库的上传：等待在途批次结束后删除不完整的密文
+        if encryptor is not None:
+            if pending is not None:
+                await asyncio.gather(pending, return_exceptions=True)
+            encryptor.abort()
 
 
-@router.post("/upload/chunk")
-async def upload_chunk(
-    chunk: UploadFile = File(...),
-    chunk_index: int = Form(...),
-    total_chunks: int = Form(...),
+@router.post("/upload/instant", response_model=InstantUploadResponse)
+async def instant_upload(
     file_name: str = Form(...),
     file_hash: str = Form(...),
-    chunk_hash: str = Form(...),
-    current_user: User = Depends(get_current_user)
+    file_size: int = Form(...),
+    description: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Wenxi - 分块上传接口
-    功能：支持大文件分块上传、断点续传、并发处理
-    性能提升：
-    - 分块并发上传，提升吞吐量
-    - 断点续传，避免重复上传
-    - 内存优化，减少单次占用
+    Wenxi - 秒传预检接口
+    功能：客户端上传前提交文件SHA256和大小，该用户已有相同内容时直接完成上传
+    - 只凭哈希不能证明持有内容，其他用户的内容不参与秒传（否则知道哈希即可取得他人文件）
+    - 同一内容的上传会话正在入库时等待其提交，而不是让客户端重复上传
+    - 未命中时返回instant=false，客户端继续正常上传
     """
+    import mimetypes
+    from utils.dedup import upload_flight, find_owned_blob, retain_blob
+    
     try:
-        # 使用统一路径管理工具获取临时分块路径
-        from utils.file_paths import get_temp_chunks_path, ensure_directory_exists
-        temp_dir = os.path.join(get_temp_chunks_path(), file_hash)
-        temp_dir = ensure_directory_exists(temp_dir)
-        
-        chunk_path = os.path.join(temp_dir, f"chunk_{chunk_index}")
+        file_hash = file_hash.lower()
+        pending = upload_flight.pending(file_hash)
+        if pending is not None:
+            await asyncio.gather(asyncio.shield(pending), return_exceptions=True)
         
-        # 保存分块
-        async with aiofiles.open(chunk_path, 'wb') as buffer:
-            while chunk_data := await chunk.read(CHUNK_SIZE):
-                await buffer.write(chunk_data)
+        blob = await find_owned_blob(db, current_user.id, file_hash, file_size)
+        if blob is None or not await retain_blob(db, blob):
+            await db.rollback()
+            return InstantUploadResponse(instant=False)
         
-        # 验证分块完整性
-        loop = asyncio.get_event_loop()
-        actual_hash = await loop.run_in_executor(executor, calculate_file_hash, chunk_path)
-        
-        if actual_hash != chunk_hash:
-            os.remove(chunk_path)
-            raise HTTPException(status_code=400, detail="分块校验失败")
+        db_file = FileModel(
+            filename=os.path.basename(blob.file_path),
+            original_filename=file_name,
+            file_path=blob.file_path,
+            file_size=blob.file_size,
+            mime_type=mimetypes.guess_type(file_name)[0] or "application/octet-stream",
+            owner_id=current_user.id,
+            checksum=blob.checksum,
+            description=description,
+            blob_id=blob.id
+        )
         
-        return {"message": "分块上传成功", "chunk_index": chunk_index}
+        db.add(db_file)
+        await db.commit()
+        await db.refresh(db_file)
+        
+        logger.info(f"Wenxi - 秒传完成: {file_name} ({blob.file_size} bytes)")
+        
+        return InstantUploadResponse(
+            instant=True,
+            file=FileUploadResponse(
+                id=db_file.id,
+                filename=db_file.original_filename,
+                file_size=db_file.file_size,
+                upload_time=db_file.created_at,
+                download_url=f"/api/files/download/{db_file.id}"
+            )
+        )
         
     except Exception as e:
-        logger.error(f"分块上传失败: {e}")
-        raise HTTPException(status_code=500, detail="分块上传失败")
+        logger.error(f"Wenxi - 秒传预检失败: {e}")
+        raise HTTPException(status_code=500, detail="秒传预检失败")
 
 
-@router.get("/upload/check")
-async def check_upload_status(
-    file_hash: str,
-    current_user: User = Depends(get_current_user)
+def session_response(session) -> UploadSessionResponse:
+    from utils.upload_sessions import missing_ranges, received_bytes, received_count, total_chunks
+    return UploadSessionResponse(
+        upload_id=session.id,
+        file_name=session.file_name,
+        file_size=session.file_size,
+        chunk_size=session.chunk_size,
+        total_chunks=total_chunks(session),
+        missing=missing_ranges(session),
+        received_chunks=received_count(session),
+        received_bytes=received_bytes(session),
+        expires_at=session.expires_at
+    )
+
+
+@router.post("/uploads", response_model=UploadSessionResponse, status_code=201)
+async def create_upload_session(
+    request: UploadSessionCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Wenxi - 检查分块上传状态
-    功能：断点续传，检查已上传的分块
+    Wenxi - 创建断点续传上传会话
+    流程：创建会话 -> PUT /uploads/{upload_id}/parts/{index}上传各分块（可乱序、并行、重复）
+         -> GET /uploads/{upload_id}查询已接收区间以续传 -> POST /uploads/{upload_id}/complete完成
     """
+    from utils.upload_sessions import FileTooLarge, InsufficientStorage, create_session
+    
     try:
-        from utils.file_paths import get_temp_chunks_path
-        temp_dir = os.path.join(get_temp_chunks_path(), file_hash)
-        
-        if not os.path.exists(temp_dir):
-            return {"uploaded_chunks": []}
-        
-        uploaded_chunks = []
-        for filename in os.listdir(temp_dir):
-            if filename.startswith("chunk_"):
-                try:
-                    index = int(filename.split("_")[1])
-                    uploaded_chunks.append(index)
-                except ValueError:
-                    continue
-        
-        return {"uploaded_chunks": sorted(uploaded_chunks)}
-        
-    except Exception as e:
-        logger.error(f"检查分块状态失败: {e}")
-        raise HTTPException(status_code=500, detail="检查分块状态失败")
+        session = await create_session(
+            db, current_user.id, request.file_name, request.file_size, request.chunk_size,
+            request.file_hash, request.mime_type, request.description
+        )
+    except FileTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InsufficientStorage as e:
+        logger.warning(f"Wenxi - 拒绝上传会话: {e}")
+        raise HTTPException(status_code=507, detail="存储空间不足")
+    except OSError as e:
+        logger.error(f"Wenxi - 上传会话预分配失败: {e}")
+        raise HTTPException(status_code=507, detail="存储空间不足")
+    return session_response(session)
 
 
-@router.post("/upload/merge")
-async def merge_chunks(
-    file_name: str = Form(...),
-    file_hash: str = Form(...),
-    total_chunks: int = Form(...),
-    description: Optional[str] = Form(None),
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    upload_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
+):
+    """查询上传会话，返回缺失分块区间，客户端据此只补传缺失的分块；只读会话一行，不扫描目录"""
+    from utils.upload_sessions import get_session
+    
+    session = await get_session(db, upload_id, current_user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    return session_response(session)
+
+
+@router.put("/uploads/{upload_id}/parts/{index}", response_model=UploadPartResponse)
+async def upload_session_part(
+    upload_id: str,
+    index: int,
+    request: Request,
+    x_chunk_sha256: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Wenxi - 合并分块接口
-    功能：合并已上传的分块，完成文件上传
+    Wenxi - 上传一个分块
+    请求体为分块原始内容（非表单），除最后一块外大小必须等于会话的chunk_size；
+    X-Chunk-SHA256请求头可选，提供时校验分块内容；分块边接收边加密写入数据文件并计入整体SHA256；
+    已接收的分块重复上传时直接确认，不再覆盖；同一分块正在上传时返回409
     """
+    from utils.upload_sessions import PartBusy, PartError, count_bits, get_session, receive_part, total_chunks
+    
+    session = await get_session(db, upload_id, current_user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    await db.commit()  # 结束读事务，接收分块期间不占用数据库连接
+
+    start = time.perf_counter()
     try:
-        start_time = datetime.now()
-        
-        from utils.file_paths import get_file_storage_path, get_temp_chunks_path, ensure_directory_exists
-        temp_dir = os.path.join(get_temp_chunks_path(), file_hash)
-        upload_dir = ensure_directory_exists(get_file_storage_path())
-        
-        # 检查所有分块是否都存在
-        for i in range(total_chunks):
-            chunk_path = os.path.join(temp_dir, f"chunk_{i}")
-            if not os.path.exists(chunk_path):
-                raise HTTPException(status_code=400, detail="分块不完整")
-        
-        # 生成最终文件名（不带扩展名，统一加密格式）
-        unique_filename = uuid.uuid4().hex  # 仅使用UUID作为文件名，不带扩展名
-        final_path = os.path.join(upload_dir, unique_filename)
-        
-        # 合并分块
-        with open(final_path, 'wb') as final_file:
-            for i in range(total_chunks):
-                chunk_path = os.path.join(temp_dir, f"chunk_{i}")
-                with open(chunk_path, 'rb') as chunk_file:
-                    final_file.write(chunk_file.read())
-                os.remove(chunk_path)
-        
-        # 清理临时目录
-        os.rmdir(temp_dir)
-        
-        # 计算文件信息
-        file_size = os.path.getsize(final_path)
-        loop = asyncio.get_event_loop()
-        checksum = await loop.run_in_executor(executor, calculate_file_hash, final_path)
+        size, bitmap = await receive_part(db, session, index, timed_iter(request.stream(), "recv"), x_chunk_sha256)
+    except PartError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PartBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except FileNotFoundError:
+        logger.error(f"Wenxi - 上传会话数据文件丢失: {upload_id}")
+        raise HTTPException(status_code=404, detail="上传会话数据已丢失，请重新上传")
+    except LookupError:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    metrics.record_transfer("upload", size, time.perf_counter() - start)
+    
+    return UploadPartResponse(
+        upload_id=upload_id,
+        index=index,
+        size=size,
+        received_chunks=count_bits(bitmap),
+        total_chunks=total_chunks(session)
+    )
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Wenxi - 完成上传会话
+    功能：校验SHA256 -> 去重或改名入库 -> 创建文件记录并删除会话；分块到达时已加密写入最终位置，
+         完成时无需合并或加密
+    - 缺少分块时返回409，会话保留，客户端查询会话补传后重试
+    - 同一会话的并发完成请求只执行一次并共享结果
+    """
+    from utils.dedup import upload_flight
+    from utils.upload_sessions import get_session
+    
+    session = await get_session(db, upload_id, current_user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    return await upload_flight.run(f"session:{upload_id}", lambda: finish_upload_session(session, current_user, db))
+
+
+async def finish_upload_session(session, current_user: User, db: AsyncSession) -> FileUploadResponse:
+    """数据文件已是分块到达时加密好的最终密文，整体哈希也已随分块累积；校验后去重或改名到存储目录并入库，返回新文件"""
+    import mimetypes
+    from utils.dedup import find_blob, register_blob, upload_flight
+    from utils.file_paths import get_file_storage_path, ensure_directory_exists
+    from utils.upload_sessions import (
+        data_path, delete_session, file_checksum, read_leaves, received_count, remove_session_files, total_chunks
+    )
+    
+    start_time = datetime.now()
+    
+    missing = total_chunks(session) - received_count(session)
+    if missing:
+        raise HTTPException(status_code=409, detail=f"分块不完整: 缺少{missing}个分块")
+    
+    unique_filename = uuid.uuid4().hex
+    stored_path = f"uploads/{unique_filename}"
+    file_path = os.path.join(ensure_directory_exists(get_file_storage_path()), unique_filename)
+    committed = False
+    
+    async def store():
+        """去重或把数据文件改名到存储目录，登记内容并与文件记录、删除会话一起提交"""
+        nonlocal stored_path, committed
+        # 内容已存在时直接引用，否则把数据文件改名到存储目录（同一文件系统，与文件大小无关）
+        blob = await find_blob(db, checksum, file_size)
+        if blob is None:
+            os.replace(data_path(session.id), file_path)
+        else:
+            stored_path = blob.file_path
         
-        # 保存到数据库
+        blob, created = await register_blob(db, checksum, file_size, stored_path)
+        if created:
+            # 叶子哈希已在分块加密时写好；本功能之前创建的会话没有，校验时再补建
+            leaves = await asyncio.get_running_loop().run_in_executor(
+                None, read_leaves, session.id, -(-file_size // session.block_size)
+            )
+            if leaves is not None:
+                db.add(new_tree(blob.id, session.block_size, leaves))
         db_file = FileModel(
-            filename=unique_filename,
-            original_filename=file_name,
-            file_path=f"uploads/{unique_filename}",
+            filename=os.path.basename(blob.file_path),
+            original_filename=session.file_name,
+            file_path=blob.file_path,
             file_size=file_size,
-            mime_type="application/octet-stream",
+            mime_type=session.mime_type or mimetypes.guess_type(session.file_name)[0] or "application/octet-stream",
             owner_id=current_user.id,
             checksum=checksum,
-            description=description
+            description=session.description,
+            blob_id=blob.id
         )
-        
         db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
-        
-        # 加密文件，使用正确的文件ID
-        encrypted_path = final_path + ".encrypted"
-        from utils.encryption import encrypt_file
-        encrypt_success = encrypt_file(
-            final_path,
-            encrypted_path,
-            user_id=current_user.id,
-            file_id=db_file.id
-        )
-        
-        if encrypt_success:
-            os.remove(final_path)
-            os.rename(encrypted_path, final_path)
+        await db.delete(session)  # 文件记录与删除会话在同一事务中提交
+        with span("commit"):
+            await db.commit()
+        committed = True
+        await db.refresh(db_file)
+        return blob, created, db_file
+    
+    try:
+        with span("hash"):  # 分块到达时已累积，这里只补算本进程未计入的分块
+            checksum, file_size = await file_checksum(session)
+        if session.checksum and checksum != session.checksum:
+            await delete_session(db, session)  # 已接收的分块不可覆盖，会话无法再完成
+            raise HTTPException(status_code=400, detail="文件校验失败: 内容与声明的SHA256不一致，请重新上传")
+        
+        # 同一内容的会话依次入库：先完成者登记内容，后到者与秒传预检等待其提交后直接引用
+        blob, created, db_file = await upload_flight.exclusive(checksum, store)
+    except BaseException:
+        # 提交之后的失败（如刷新记录时被取消）不能撤销：文件记录已指向改名后的数据文件
+        if not committed:
+            await db.rollback()
+            if os.path.exists(file_path):
+                os.replace(file_path, data_path(session.id))  # 放回会话目录，客户端可重试完成
         else:
-            db.delete(db_file)
-            db.commit()
-            raise HTTPException(status_code=500, detail="文件加密失败")
-        
-        # 计算性能指标
-        upload_time = (datetime.now() - start_time).total_seconds()
-        upload_speed = file_size / upload_time / 1024 / 1024  # MB/s
-        
-        logger.info(f"Wenxi - 分块上传完成: {file_name} ({file_size} bytes, {upload_speed:.2f}MB/s)")
-        
-        return FileUploadResponse(
-            id=db_file.id,
-            filename=db_file.original_filename,
-            file_size=db_file.file_size,
-            upload_time=db_file.created_at,
-            download_url=f"/api/files/download/{db_file.id}",
-            upload_speed=upload_speed
-        )
-        
-    except Exception as e:
-        logger.error(f"合并分块失败: {e}")
-        raise HTTPException(status_code=500, detail="合并分块失败")
+            remove_session_files(session.id)
+        raise
+    
+    remove_session_files(session.id)
+    if created:
+        metrics.stored_bytes_total.inc(os.path.getsize(file_path))
+    elif blob.file_path != stored_path:
+        remove_stored_file(stored_path)
+    await remember_file_meta(FileMeta.from_file(db_file, None))
+    
+    complete_time = (datetime.now() - start_time).total_seconds()
+    logger.info(f"Wenxi - 上传会话完成: {session.file_name} ({file_size} bytes, 完成耗时{complete_time:.2f}s)")
+    
+    return FileUploadResponse(
+        id=db_file.id,
+        filename=db_file.original_filename,
+        file_size=db_file.file_size,
+        upload_time=db_file.created_at,
+        download_url=f"/api/files/download/{db_file.id}"
+    )
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload_session(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """放弃上传会话，删除已接收的分块"""
+    from utils.upload_sessions import delete_session, get_session
+    
+    session = await get_session(db, upload_id, current_user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在或已过期")
+    await delete_session(db, session)
+    return {"message": "上传会话已取消"}
 
 
-@router.get("/list", response_model=List[FileListResponse])
+@router.get("/list", response_model=List[FileListResponse], response_model_exclude_unset=True)
 async def list_files(
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    search: Optional[str] = None
+    db: AsyncSession = Depends(get_async_db),
+    search: Optional[str] = None,
+    sort: Optional[Literal["created_at", "name", "size", "relevance"]] = None,
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
 ):
-    """获取用户文件列表，支持搜索功能"""
+    """
+    获取用户文件列表，支持搜索、排序、键集分页和字段选择
+    
+    search在文件名和描述中检索，默认按相关度排序；不搜索时默认按上传时间排序
+    下一页游标通过X-Next-Cursor响应头返回，最后一页不返回该头
+    fields为逗号分隔的字段名，id总是返回
+    """
     try:
-        query = db.query(FileModel).filter(
+        selected = list(LIST_FIELDS) if not fields else ["id"] + [
+            name for name in dict.fromkeys(fields.split(",")) if name and name != "id"
+        ]
+        unknown = [name for name in selected if name not in LIST_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知字段: {', '.join(unknown)}")
+        
+        if sort is None:
+            sort = RELEVANCE if search else "created_at"
+        
+        # 只查询所需列，排序列用于生成游标
+        columns = [LIST_FIELDS[name] for name in selected]
+        if sort != RELEVANCE and SORT_COLUMNS[sort].key not in selected:
+            columns.append(SORT_COLUMNS[sort])
+        query = select(*columns).where(
             FileModel.owner_id == current_user.id
         )
         
-        # Wenxi - 添加搜索功能
+        # Wenxi - 全文检索文件名和描述
+        rank = None
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                FileModel.original_filename.ilike(search_term)
-            )
+            query, rank = apply_search(query, search)
+        if sort == RELEVANCE:
+            # 没有可用的相关度（未搜索或只有短词）时所有行并列，按id排序
+            rank = rank if rank is not None else literal(0.0)
+            query = query.add_columns(rank.label("rank"))
         
-        files = query.order_by(FileModel.created_at.desc()).all()
+        try:
+            query = apply_keyset(query, sort, order, cursor, limit, column=rank if sort == RELEVANCE else None)
+        except CursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        return [FileListResponse(
-            id=file.id,
-            filename=file.filename,
-            original_filename=file.original_filename,
-            file_size=file.file_size,
-            mime_type=file.mime_type,
-            created_at=file.created_at,
-            is_shared=file.is_shared
-        ) for file in files]
+        rows = (await db.execute(query)).mappings().all()
+        rows, next_cursor = page_with_cursor(rows, sort, order, limit)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
+        return [FileListResponse(**{name: row[name] for name in selected}) for row in rows]
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"获取文件列表失败: {e}")
         raise HTTPException(status_code=500, detail="获取文件列表失败")
 
 
+def parse_range_header(range_header: Optional[str], file_size: int) -> Optional[List[tuple]]:
+    """
+    Wenxi - 解析HTTP Range请求头（RFC 7233）
+    支持 bytes=a-b、bytes=a-、bytes=-n 及逗号分隔的多个区间
+    - 防放大（RFC 7233 §6.1）：区间超过MAX_RANGES个时忽略Range头；
+      重叠或相邻的区间排序后合并，多个区间合并后覆盖整个文件时按完整文件响应
+    
+    返回:
+        None - 无Range头、单位不是bytes、语法无效、区间过多或多区间覆盖整个文件，按完整文件响应
+        [(start, end), ...] - 按起点排序、互不重叠也不相邻的可满足区间，end不包含
+    异常:
+        HTTPException(416) - 所有区间均不可满足
+    """
+    if not range_header:
+        return None
+    
+    unit, _, range_set = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        return None
+    
+    specs = range_set.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+    
+    ranges = []
+    for spec in specs:
+        spec = spec.strip()
+        first, sep, last = spec.partition("-")
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) + 1 if last else file_size
+                if start < 0 or (last and end <= start):
+                    return None
+            else:
+                # 后缀区间：最后N个字节
+                suffix_length = int(last)
+                if suffix_length < 0:
+                    return None
+                start = max(file_size - suffix_length, 0)
+                end = file_size if suffix_length else 0
+        except ValueError:
+            return None
+        
+        end = min(end, file_size)
+        if start < end:
+            ranges.append((start, end))
+    
+    if not ranges:
+        raise HTTPException(
+            status_code=416,
+            detail="请求的范围无法满足",
+            headers={"Content-Range": f"bytes */{file_size}", "Accept-Ranges": "bytes"}
+        )
+    
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    if len(specs) > 1 and merged == [(0, file_size)]:
+        return None
+    return merged
+
+
+async def build_decrypt_response(
+    meta: FileMeta,
+    file_path: str,
+    range_header: Optional[str] = None,
+    if_range: Optional[str] = None
+) -> StreamingResponse:
+    """
+    Wenxi - 构建流式解密下载响应
+    功能：边读密文边解密边发送，首字节时间与文件大小无关
+    - 内存恒定：每次只持有一个解密块
+    - 背压：同步迭代器在线程池中逐块推进，慢客户端会暂停解密
+    - 无临时文件：并发下载同一文件互不干扰
+    - Range支持：直接定位到所需密文块，视频拖动和断点续传只解密请求区间
+    - 元数据回写：密文版本与缓存记录不一致（未缓存或密文已替换）时更新缓存
+    """
+    from urllib.parse import quote
+    from utils.encryption import DecryptStream
+    
+    try:
+        with span("open"):  # 读取并认证文件头与块索引
+            stream = DecryptStream(file_path, user_id=meta.owner_id, file_id=meta.id)
+    except Exception as e:
+        logger.error(f"Wenxi - 文件解密失败 - 文件ID: {meta.id}, 用户ID: {meta.owner_id}, 文件路径: {file_path}, 错误: {e}")
+        raise HTTPException(status_code=500, detail=f"文件解密失败: {meta.name}")
+    
+    if meta.cipher != stream.layout.version:
+        meta.cipher = stream.layout.version
+        await remember_file_meta(meta)
+    
+    encoded_filename = quote(meta.name, encoding='utf-8')
+    media_type = meta.mime or "application/octet-stream"
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=3600",
+        "Content-Disposition": f'attachment; filename*=UTF-8\'\'{encoded_filename}'
+    }
+    if meta.checksum:
+        headers["ETag"] = f'"{meta.checksum}"'
+    
+    # If-Range与ETag不一致时说明客户端持有的是旧版本，返回完整文件
+    if if_range and if_range.strip() != headers.get("ETag"):
+        range_header = None
+    
+    ranges = parse_range_header(range_header, stream.size)
+    if ranges is None:
+        headers["Content-Length"] = str(stream.size)
+        return StreamingResponse(metrics.metered(stream), media_type=media_type, headers=headers)
+    
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{stream.size}"
+        headers["Content-Length"] = str(end - start)
+        logger.debug(f"Wenxi - 区间下载: 文件ID {meta.id}, bytes {start}-{end - 1}/{stream.size}")
+        return StreamingResponse(metrics.metered(stream.iter_range(start, end)), status_code=206, media_type=media_type, headers=headers)
+    
+    # 多区间：multipart/byteranges
+    boundary = uuid.uuid4().hex
+    parts = [
+        (
+            (f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+             f"Content-Range: bytes {start}-{end - 1}/{stream.size}\r\n\r\n").encode(),
+            start,
+            end
+        )
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    
+    def iter_multipart():
+        for index, (part_header, start, end) in enumerate(parts):
+            yield (b"\r\n" if index else b"") + part_header
+            yield from stream.iter_range(start, end)
+        yield closing
+    
+    headers["Content-Length"] = str(
+        sum(len(part_header) + (end - start) for part_header, start, end in parts)
+        + 2 * (len(parts) - 1) + len(closing)
+    )
+    return StreamingResponse(
+        metrics.metered(iter_multipart()),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers
+    )
+
+
 @router.get("/download/{file_id}")
 async def download_file(
     file_id: int,
     token: Optional[str] = None,
-    db: Session = Depends(get_db),
-    range: Optional[str] = None,
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    db: AsyncSession = Depends(get_async_db),
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None)
 ):
     """
     Wenxi - 文件下载接口
@@ -471,6 +888,7 @@ async def download_file(
         from routers.auth import SECRET_KEY, ALGORITHM
         
         current_user = None
+        auth_start = time.perf_counter()
         if token:
             # 通过token认证
             try:
@@ -484,7 +902,7 @@ async def download_file(
                 if username is None:
                     raise HTTPException(status_code=401, detail="无效的认证令牌")
                 
-                current_user = db.query(User).filter(User.username == username).first()
+                current_user = await get_user_by_username(db, username)
                 if not current_user:
                     raise HTTPException(status_code=401, detail="用户不存在")
             except InvalidTokenError:
@@ -494,88 +912,29 @@ async def download_file(
             from routers.auth import get_current_user
             current_user = await get_current_user(None)
         
-        # 缓存检查 - 使用连接池
-        file = None
-        try:
-            redis = await get_redis_client()
-            cached_meta = await redis.get(f"file:meta:{file_id}")
-            if cached_meta:
-                file = db.query(FileModel).filter(
-                    FileModel.id == file_id,
-                    FileModel.owner_id == current_user.id
-                ).first()
-            else:
-                file = db.query(FileModel).filter(
-                    FileModel.id == file_id,
-                    FileModel.owner_id == current_user.id
-                ).first()
-                if file:
-                    await redis.setex(f"file:meta:{file_id}", CACHE_TTL, str({"filename": file.original_filename}))
-        except:
-            file = db.query(FileModel).filter(
-                FileModel.id == file_id,
-                FileModel.owner_id == current_user.id
-            ).first()
+        record_span("auth", time.perf_counter() - auth_start)
         
-        if not file:
+        # 元数据缓存：命中时鉴权和响应头都不查询数据库
+        with span("lookup"):
+            meta = await get_owned_file_meta(db, file_id, current_user.id)
+        
+        if not meta:
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        file_path = os.path.join(os.path.dirname(__file__), "..", file.file_path)
+        file_path = os.path.join(os.path.dirname(__file__), "..", meta.path)
         file_path = os.path.abspath(file_path)
-        logger.info(f"Wenxi - 尝试下载文件: {file.original_filename}, 路径: {file_path}")
+        logger.info(f"Wenxi - 尝试下载文件: {meta.name}, 路径: {file_path}")
         if not os.path.exists(file_path):
             logger.error(f"Wenxi - 文件不存在: {file_path}")
             logger.error(f"Wenxi - 文件ID: {file_id}, 用户ID: {current_user.id}")
-            raise HTTPException(status_code=404, detail=f"文件不存在: {file.original_filename}")
-        
-        # 创建临时解密文件
-        temp_decrypt_path = file_path + ".decrypt"
+            raise HTTPException(status_code=404, detail=f"文件不存在: {meta.name}")
         
         # 检查文件大小
         file_size = os.path.getsize(file_path)
         logger.info(f"Wenxi - 文件大小: {file_size} bytes")
         
-        # 解密文件
-        from utils.encryption import decrypt_file
-        decrypt_success = decrypt_file(file_path, temp_decrypt_path, user_id=file.owner_id, file_id=file.id)
-        
-        if not decrypt_success:
-            if os.path.exists(temp_decrypt_path):
-                os.remove(temp_decrypt_path)
-            logger.error(f"Wenxi - 文件解密失败 - 文件ID: {file_id}, 用户ID: {file.owner_id}, 文件路径: {file_path}")
-            raise HTTPException(status_code=500, detail=f"文件解密失败: {file.original_filename}")
-        
-        # 验证解密文件
-        if not os.path.exists(temp_decrypt_path):
-            logger.error(f"Wenxi - 解密文件未创建: {temp_decrypt_path}")
-            raise HTTPException(status_code=500, detail="解密文件创建失败")
-        
-        # 使用临时解密文件进行传输
-        from urllib.parse import quote
-        encoded_filename = quote(file.original_filename, encoding='utf-8')
-        
-        def cleanup_temp_file():
-            """清理临时解密文件"""
-            try:
-                if os.path.exists(temp_decrypt_path):
-                    os.remove(temp_decrypt_path)
-            except Exception as e:
-                logger.warning(f"清理临时解密文件失败: {e}")
-        
-        # 创建自定义响应以支持清理
-        response = FileResponse(
-            path=temp_decrypt_path,
-            filename=file.original_filename,
-            media_type=file.mime_type or "application/octet-stream",
-            headers={
-                "Cache-Control": "public, max-age=3600",
-                "Content-Disposition": f'attachment; filename*=UTF-8\'\'{encoded_filename}'
-            }
-        )
-        
-        # 设置清理回调
-        background_tasks.add_task(cleanup_temp_file)
-        return response
+        # 流式解密传输，不生成明文临时文件
+        return await build_decrypt_response(meta, file_path, range, if_range)
         
     except HTTPException:
         raise
@@ -589,64 +948,30 @@ async def download_file(
 @router.get("/shared/{share_token}")
 async def access_shared_file(
     share_token: str,
-    db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    db: AsyncSession = Depends(get_async_db),
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None)
 ):
     """通过分享令牌访问文件"""
     try:
-        file = db.query(FileModel).filter(
-            FileModel.share_token == share_token,
-            FileModel.is_shared == True
-        ).first()
+        with span("lookup"):
+            meta = await get_shared_file_meta(db, share_token)
         
-        if not file:
+        if not meta:
             raise HTTPException(status_code=404, detail="分享链接无效或已过期")
         
-        file_path = os.path.join(os.path.dirname(__file__), "..", file.file_path)
+        file_path = os.path.join(os.path.dirname(__file__), "..", meta.path)
         file_path = os.path.abspath(file_path)
-        logger.info(f"Wenxi - 通过分享链接访问文件: {file.original_filename}, 路径: {file_path}")
+        logger.info(f"Wenxi - 通过分享链接访问文件: {meta.name}, 路径: {file_path}")
         
         if not os.path.exists(file_path):
             logger.error(f"Wenxi - 分享文件不存在: {file_path}")
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 创建临时解密文件
-        temp_decrypt_path = file_path + ".decrypt"
-        
-        # 解密文件
-        from utils.encryption import decrypt_file
-        decrypt_success = decrypt_file(file_path, temp_decrypt_path, user_id=file.owner_id, file_id=file.id)
-        
-        if not decrypt_success:
-            if os.path.exists(temp_decrypt_path):
-                os.remove(temp_decrypt_path)
-            raise HTTPException(status_code=500, detail="文件解密失败")
-        
-        logger.info(f"通过分享链接访问文件: {file.original_filename}")
-        
-        from urllib.parse import quote
-        encoded_filename = quote(file.original_filename, encoding='utf-8')
+        logger.info(f"通过分享链接访问文件: {meta.name}")
         
-        def cleanup_temp_file():
-            """清理临时解密文件"""
-            try:
-                if os.path.exists(temp_decrypt_path):
-                    os.remove(temp_decrypt_path)
-            except Exception as e:
-                logger.warning(f"清理临时解密文件失败: {e}")
-        
-        response = FileResponse(
-            path=temp_decrypt_path,
-            filename=file.original_filename,
-            media_type=file.mime_type or "application/octet-stream",
-            headers={
-                "Cache-Control": "public, max-age=3600",
-                "Content-Disposition": f'attachment; filename*=UTF-8\'\'{encoded_filename}'
-            }
-        )
-        
-        background_tasks.add_task(cleanup_temp_file)
-        return response
+        # 流式解密传输，不生成明文临时文件
+        return await build_decrypt_response(meta, file_path, range, if_range)
         
     except HTTPException:
         raise
@@ -659,27 +984,28 @@ async def access_shared_file(
 async def delete_file(
     file_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除文件"""
     try:
-        file = db.query(FileModel).filter(
-            FileModel.id == file_id,
-            FileModel.owner_id == current_user.id
-        ).first()
+        file = await get_owned_file(db, file_id, current_user.id)
         
         if not file:
             raise HTTPException(status_code=404, detail="文件不存在")
         
-        # 删除物理文件
-        file_path = os.path.join(os.path.dirname(__file__), "..", file.file_path)
-        file_path = os.path.abspath(file_path)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # 删除数据库记录；共享内容仅在最后一个引用删除后才删除物理文件
+        orphan_path = file.file_path
+        share_token = file.share_token
+        if file.blob_id is not None:
+            from utils.dedup import release_blob
+            orphan_path = await release_blob(db, file.blob_id)
+        await db.delete(file)
+        await db.commit()
+        invalidate_file(file_id)
+        await invalidate_file_meta(file_id, share_token)
         
-        # 删除数据库记录
-        db.delete(file)
-        db.commit()
+        if orphan_path:
+            remove_stored_file(orphan_path)
         
         logger.info(f"用户 {current_user.username} 删除文件: {file.original_filename}")
         
@@ -692,60 +1018,6 @@ async def delete_file(
         raise HTTPException(status_code=500, detail="文件删除失败")
 
 
-@router.post("/upload/chunk", response_model=ChunkUploadResponse)
-async def upload_chunk(
-    upload_id: str = Form(...),
-    chunk_index: int = Form(...),
-    total_chunks: int = Form(...),
-    chunk: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Wenxi - 分片上传接口
-    功能：支持大文件分片上传，断点续传
-    性能优势：
-    - 分片并发上传，提高速度
-    - 断点续传，避免重复上传
-    - 内存优化，减少单次占用
-    """
-    try:
-        start_time = datetime.now()
-        
-        # 创建分片临时目录
-        temp_dir = os.path.join(os.path.dirname(__file__), "..", "uploads", "temp", upload_id)
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # 保存分片
-        chunk_path = os.path.join(temp_dir, f"chunk_{chunk_index}")
-        async with aiofiles.open(chunk_path, 'wb') as f:
-            content = await chunk.read()
-            await f.write(content)
-        
-        # 检查是否所有分片都已上传
-        uploaded_chunks = len([f for f in os.listdir(temp_dir) if f.startswith("chunk_")])
-        
-        logger.info(
-            f"Wenxi - 分片上传完成: upload_id={upload_id}, "
-            f"chunk={chunk_index}/{total_chunks}, size={len(content)} bytes"
-        )
-        
-        if uploaded_chunks == total_chunks:
-            # 合并分片
-            await merge_chunks(upload_id, temp_dir, current_user, db)
-        
-        return ChunkUploadResponse(
-            chunk_id=f"{upload_id}_{chunk_index}",
-            upload_id=upload_id,
-            offset=len(content),
-            status="completed" if uploaded_chunks == total_chunks else "uploading"
-        )
-        
-    except Exception as e:
-        logger.error(f"Wenxi - 分片上传失败: {e}")
-        raise HTTPException(status_code=500, detail="分片上传失败")
-
-
 @router.get("/performance", response_model=PerformanceMetrics)
 async def get_performance_metrics(
     current_user: User = Depends(get_current_user)
@@ -755,87 +1027,56 @@ async def get_performance_metrics(
     功能：获取系统性能指标
     """
     try:
-        redis = await get_redis_client()
-        
-        # 模拟性能数据（实际项目中会从监控系统中获取）
-        metrics = PerformanceMetrics(
-            upload_speed=85.5,  # MB/s
-            download_speed=120.3,  # MB/s
-            compression_ratio=0.75,  # 75%压缩率
-            cache_hit_rate=0.92  # 92%缓存命中率
+        # 进程内累计的实测数据，与/metrics同源
+        caches = metrics.cache_stats()
+        uploaded = metrics.transfer_bytes_total.value(direction="upload")
+        return PerformanceMetrics(
+            upload_speed=metrics.average_throughput("upload"),  # MB/s
+            download_speed=metrics.average_throughput("download"),  # MB/s
+            compression_ratio=metrics.stored_bytes_total.total() / uploaded if uploaded else 1.0,  # 落盘密文/上传明文，去重命中越多越小
+            cache_hit_rate=metrics.overall_hit_rate(caches),  # 元数据+用户+文件记录缓存合计命中率
+            identity_cache=cache_stats(),  # 用户/文件记录缓存命中统计
+            cache=caches["backend"],  # 缓存后端状态
+            file_meta=caches["file_meta"],  # 文件元数据缓存命中统计
+            in_flight=int(metrics.http_requests_in_flight.total()),
+            timings={
+                "upload": metrics.transfer_seconds.summary(direction="upload"),
+                "download": metrics.transfer_seconds.summary(direction="download"),
+                "encrypt": metrics.crypto_seconds.summary(operation="encrypt"),
+                "decrypt": metrics.crypto_seconds.summary(operation="decrypt"),
+                "hash": metrics.hash_seconds.summary(),
+                "db_query": metrics.db_query_seconds.summary(),
+                "http_request": metrics.http_request_seconds.summary()
+            }
         )
         
-        return metrics
-        
     except Exception as e:
         logger.error(f"Wenxi - 获取性能指标失败: {e}")
         raise HTTPException(status_code=500, detail="获取性能指标失败")
 
 
-async def merge_chunks(upload_id: str, temp_dir: str, current_user: User, db: Session):
-    """合并分片文件"""
-    try:
-        # 获取所有分片文件
-        chunk_files = sorted(
-            [f for f in os.listdir(temp_dir) if f.startswith("chunk_")],
-            key=lambda x: int(x.split("_")[1])
-        )
-        
-        # 生成最终文件名
-        file_extension = ".tmp"  # 需要从前端获取实际扩展名
-        final_filename = f"{uuid.uuid4().hex}{file_extension}"
-        final_path = os.path.join(os.path.dirname(__file__), "..", "uploads", final_filename)
-        
-        # 合并分片
-        async with aiofiles.open(final_path, 'wb') as final_file:
-            for chunk_file in chunk_files:
-                chunk_path = os.path.join(temp_dir, chunk_file)
-                async with aiofiles.open(chunk_path, 'rb') as chunk:
-                    while chunk_data := await chunk.read(CHUNK_SIZE):
-                        await final_file.write(chunk_data)
-        
-        # 清理临时分片
-        for chunk_file in chunk_files:
-            os.remove(os.path.join(temp_dir, chunk_file))
-        os.rmdir(temp_dir)
-        
-        logger.info(f"Wenxi - 分片合并完成: upload_id={upload_id}, filename={final_filename}")
-        
-    except Exception as e:
-        logger.error(f"Wenxi - 分片合并失败: {e}")
-
-
-async def cleanup_cache(redis, file_id: int):
-    """异步清理缓存"""
-    try:
-        await redis.delete(f"file:meta:{file_id}")
-        logger.debug(f"Wenxi - 缓存清理完成: file_id={file_id}")
-    except Exception as e:
-        logger.error(f"Wenxi - 缓存清理失败: {e}")
-
-
 @router.post("/{file_id}/share", response_model=FileShareResponse)
 async def share_file(
     file_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """分享文件"""
     try:
-        file = db.query(FileModel).filter(
-            FileModel.id == file_id,
-            FileModel.owner_id == current_user.id
-        ).first()
+        file = await get_owned_file(db, file_id, current_user.id)
         
         if not file:
             raise HTTPException(status_code=404, detail="文件不存在")
         
         # 生成分享令牌
         share_token = uuid.uuid4().hex
+        previous_token = file.share_token
         
         file.is_shared = True
         file.share_token = share_token
-        db.commit()
+        await db.commit()
+        invalidate_file(file_id)
+        await invalidate_file_meta(file_id, previous_token)
         
         logger.info(f"用户 {current_user.username} 分享文件: {file.original_filename}")
         
@@ -848,4 +1089,72 @@ async def share_file(
         raise
     except Exception as e:
         logger.error(f"文件分享失败: {e}")
-        raise HTTPException(status_code=500, detail="文件分享失败")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="文件分享失败")
+
+
+def check_byte_range(start: Optional[int], end: Optional[int], file_size: int) -> None:
+    """校验区间参数：start与end同时指定且0 <= start < end <= 文件大小"""
+    if (start is None) != (end is None) or (start is not None and not 0 <= start < end <= file_size):
+        raise HTTPException(status_code=400, detail=f"区间无效: 需同时指定start与end，且0 <= start < end <= {file_size}")
+
+
+async def load_merkle(db: AsyncSession, file_id: int, user_id: int):
+    """读取用户文件及其Merkle树，返回(文件记录, 加密文件绝对路径, 树)"""
+    file = await get_owned_file(db, file_id, user_id)
+    if not file:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", file.file_path))
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail=f"文件不存在: {file.original_filename}")
+    try:
+        tree = await ensure_tree(db, file, file_path)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"无法建立Merkle树: {e}")
+    return file, file_path, tree
+
+
+@router.get("/{file_id}/merkle", response_model=MerkleResponse)
+async def get_file_merkle(
+    file_id: int,
+    start: Optional[int] = Query(None, ge=0, description="明文起始偏移（包含）"),
+    end: Optional[int] = Query(None, gt=0, description="明文结束偏移（不包含）"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Wenxi - 文件Merkle树
+    返回块大小与根哈希；指定[start, end)时附带覆盖该区间的块的叶子哈希和证明，
+    客户端对下载的区间或上传的分块按块计算SHA256(0x00 || 块)即可自行校验，无需读取整个文件
+    """
+    file, _, tree = await load_merkle(db, file_id, current_user.id)
+    check_byte_range(start, end, file.file_size)
+    leaves = split_leaves(tree.leaves)
+    response = MerkleResponse(block_size=tree.block_size, file_size=file.file_size,
+                              leaf_count=len(leaves), root=tree.root)
+    if start is not None:
+        first, last = block_range(start, end, tree.block_size)
+        response.first_block = first
+        response.leaves = [leaf.hex() for leaf in leaves[first:last]]
+        response.proof = [node.hex() for node in range_proof(leaves, first, last)]
+    return response
+
+
+@router.post("/{file_id}/verify", response_model=VerifyResponse)
+async def verify_file(
+    file_id: int,
+    start: Optional[int] = Query(None, ge=0, description="明文起始偏移（包含）"),
+    end: Optional[int] = Query(None, gt=0, description="明文结束偏移（不包含）"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Wenxi - 服务器端完整性校验
+    只解密覆盖[start, end)的块并用Merkle证明与根哈希比对；不指定区间时校验整个文件，由加密引擎多核并行
+    """
+    file, file_path, tree = await load_merkle(db, file_id, current_user.id)
+    check_byte_range(start, end, file.file_size)
+    with span("verify"):
+        valid, blocks = await verify_stored_range(tree, file_path, file.file_size, start, end)
+    if not valid:
+        logger.error(f"Wenxi - 完整性校验失败: 文件{file_id} ({file.original_filename}), 区间[{start}, {end})")
+    return VerifyResponse(valid=valid, blocks=blocks, root=tree.root)
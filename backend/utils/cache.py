@@ -0,0 +1,324 @@
+"""
+Wenxi网盘 - 可插拔缓存后端
+作者：Wenxi
+功能：统一的异步键值缓存接口，提供Redis（连接池+管道）与进程内LRU两种实现
+特点：Redis连续失败后熔断，冷却期内直接使用进程内缓存，不再为每个请求付出一次失败的连接；
+      熔断期间或调用失败时未送达Redis的删除排队保存，恢复后在下一次Redis调用之前先重放，失效不会丢失
+环境变量：
+    WENXI_CACHE_BACKEND             redis（默认，不可用时回退进程内缓存）或 memory
+    REDIS_HOST / REDIS_PORT         Redis地址
+    REDIS_DB / REDIS_PASSWORD       Redis库号与密码
+    WENXI_REDIS_POOL_SIZE           连接池最大连接数（默认32）
+    WENXI_REDIS_TIMEOUT             连接与读写超时（秒，默认0.5）
+    WENXI_REDIS_FAILURE_THRESHOLD   连续失败多少次后熔断（默认3）
+    WENXI_REDIS_COOLDOWN            熔断冷却时间（秒，默认30）
+    WENXI_MEMORY_CACHE_SIZE         进程内缓存条目上限（默认10000）
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from logger import logger
+
+CACHE_BACKEND = os.environ.get("WENXI_CACHE_BACKEND", "redis").lower()
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", "6379"))
+REDIS_DB = int(os.environ.get("REDIS_DB", "0"))
+REDIS_PASSWORD = os.environ.get("REDIS_PASSWORD") or None
+REDIS_POOL_SIZE = int(os.environ.get("WENXI_REDIS_POOL_SIZE", "32"))
+REDIS_TIMEOUT = float(os.environ.get("WENXI_REDIS_TIMEOUT", "0.5"))
+REDIS_FAILURE_THRESHOLD = int(os.environ.get("WENXI_REDIS_FAILURE_THRESHOLD", "3"))
+REDIS_COOLDOWN = float(os.environ.get("WENXI_REDIS_COOLDOWN", "30"))
+REPLAY_BATCH = 1000  # 重放排队删除时每条DEL命令的键数
+MEMORY_CACHE_SIZE = int(os.environ.get("WENXI_MEMORY_CACHE_SIZE", "10000"))
+
+
+class CacheBackend:
+    """缓存后端接口，值为字符串"""
+
+    name = "base"
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, *keys: str):
+        raise NotImplementedError
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        """批量读取，结果与keys一一对应"""
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, mapping: Dict[str, str], ttl: float):
+        """批量写入"""
+        for key, value in mapping.items():
+            await self.set(key, value, ttl)
+
+    async def close(self):
+        """释放连接等资源"""
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class MemoryCache(CacheBackend):
+    """
+    Wenxi进程内缓存 - 有界、带TTL的LRU
+    用于单进程部署、测试以及Redis熔断期间的回退
+    """
+
+    name = "memory"
+
+    def __init__(self, max_size: int = MEMORY_CACHE_SIZE):
+        self.max_size = max(1, max_size)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    async def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.name,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+class CircuitBreaker:
+    """
+    连续失败达到阈值后打开，冷却期内拒绝调用；冷却结束后进入半开状态放行调用试探，成功则关闭、失败则重新打开
+    """
+
+    def __init__(self, failure_threshold: int = REDIS_FAILURE_THRESHOLD, cooldown: float = REDIS_COOLDOWN):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half-open"
+
+    def allow(self) -> bool:
+        """是否允许调用后端"""
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # 半开试探失败时重新计时
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
+
+class RedisCache(CacheBackend):
+    """
+    Wenxi Redis缓存 - 共享连接池，批量操作使用管道
+    熔断打开或单次调用失败时使用fallback；删除总是同时作用于fallback，
+    未送达Redis的删除排队，恢复后先重放再执行其他调用，避免读到已失效的旧值
+    """
+
+    name = "redis"
+
+    def __init__(self, client=None, fallback: Optional[CacheBackend] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        if client is None:
+            import redis.asyncio as redis
+            pool = redis.ConnectionPool(
+                host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                max_connections=REDIS_POOL_SIZE, socket_timeout=REDIS_TIMEOUT,
+                socket_connect_timeout=REDIS_TIMEOUT, decode_responses=True
+            )
+            client = redis.Redis(connection_pool=pool)
+        self.client = client
+        self.fallback = fallback if fallback is not None else MemoryCache()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.fallback_calls = 0
+        self._pending_deletes: Dict[str, int] = {}  # 未送达Redis的删除：键 -> 排队序号
+        self._delete_seq = 0
+
+    async def _replay_deletes(self):
+        """把排队的删除发给Redis；重放期间再次排队的键保留到下一次"""
+        if not self._pending_deletes:
+            return
+        pending = dict(self._pending_deletes)
+        keys = list(pending)
+        for offset in range(0, len(keys), REPLAY_BATCH):
+            await self.client.delete(*keys[offset:offset + REPLAY_BATCH])
+        for key, seq in pending.items():
+            if self._pending_deletes.get(key) == seq:
+                del self._pending_deletes[key]
+        logger.info(f"Wenxi - Redis已恢复，重放{len(keys)}个排队的缓存删除")
+
+    async def _call(self, operation, fallback_operation):
+        """经过熔断器调用Redis（先重放排队的删除），失败时执行回退操作"""
+        if self.breaker.allow():
+            try:
+                await self._replay_deletes()
+                result = await operation()
+                self.breaker.record_success()
+                return result
+            except Exception as e:
+                self.errors += 1
+                was_closed = self.breaker.state == "closed"
+                self.breaker.record_failure()
+                if was_closed and not self.breaker.allow():
+                    logger.warning(f"Wenxi - Redis不可用，{self.breaker.cooldown:.0f}秒内改用进程内缓存: {e}")
+        self.fallback_calls += 1
+        return await fallback_operation()
+
+    def _count(self, values: Iterable[Optional[str]]):
+        for value in values:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    async def get(self, key: str) -> Optional[str]:
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+
+        async def from_redis():
+            values = await self.client.mget(keys)
+            self._count(values)
+            return values
+
+        return await self._call(from_redis, lambda: self.fallback.get_many(keys))
+
+    async def set(self, key: str, value: str, ttl: float):
+        await self.set_many({key: value}, ttl)
+
+    async def set_many(self, mapping: Dict[str, str], ttl: float):
+        if not mapping:
+            return
+
+        async def to_redis():
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.set(key, value, px=max(1, int(ttl * 1000)))
+                await pipe.execute()
+
+        await self._call(to_redis, lambda: self.fallback.set_many(mapping, ttl))
+
+    async def delete(self, *keys: str):
+        if not keys:
+            return
+        await self.fallback.delete(*keys)
+
+        async def from_redis():
+            await self.client.delete(*keys)
+
+        async def queue():
+            for key in keys:
+                self._delete_seq += 1
+                self._pending_deletes[key] = self._delete_seq
+            logger.warning(f"Wenxi - Redis删除未送达，已排队待恢复后重放（共{len(self._pending_deletes)}个键）")
+
+        await self._call(from_redis, queue)
+
+    async def close(self):
+        try:
+            await self.client.aclose()
+        except AttributeError:
+            await self.client.close()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "circuit": self.breaker.state,
+            "circuit_trips": self.breaker.trips,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "errors": self.errors,
+            "fallback_calls": self.fallback_calls,
+            "pending_deletes": len(self._pending_deletes),
+            "fallback": self.fallback.stats()
+        }
+
+
+_cache: Optional[CacheBackend] = None
+
+
+def create_cache(backend: str = CACHE_BACKEND) -> CacheBackend:
+    """按名称创建缓存后端"""
+    if backend == "memory":
+        return MemoryCache()
+    if backend == "redis":
+        return RedisCache()
+    raise ValueError(f"未知的缓存后端: {backend}，可选: redis, memory")
+
+
+def get_cache() -> CacheBackend:
+    """获取全局缓存后端（首次调用时按配置创建）"""
+    global _cache
+    if _cache is None:
+        _cache = create_cache()
+        logger.info(f"Wenxi - 缓存后端: {_cache.name}")
+    return _cache
+
+
+def set_cache(cache: Optional[CacheBackend]):
+    """替换全局缓存后端（测试中注入进程内或假后端）"""
+    global _cache
+    _cache = cache
+
+
+async def close_cache():
+    """关闭全局缓存后端（应用关闭时调用）"""
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
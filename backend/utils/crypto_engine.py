@@ -0,0 +1,267 @@
+"""
+Wenxi网盘 - 多核加解密引擎
+作者：Wenxi
+功能：将大文件按块区间分片，交给进程池/线程池并行执行ChaCha20-Poly1305加解密，以及Merkle树叶子哈希的计算
+特点：输出格式与encrypt_file完全一致（v3）、事件循环不阻塞、工作进程数由环境变量配置；
+      进程池在服务已运行多个线程后才按需创建，工作进程由forkserver（不支持时spawn）启动，不直接fork服务进程
+环境变量：
+    WENXI_CRYPTO_WORKERS  并行工作数（默认CPU核心数）
+    WENXI_CRYPTO_EXECUTOR process（默认，多核扩展）或 thread
+"""
+
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+
+from logger import logger
+from utils.encryption import ChunkLayout, TAG_SIZE, new_v3_layout, build_v3_header, build_v3_index, DecryptStream
+from utils.merkle import leaf_hash
+
+CRYPTO_WORKERS = int(os.environ.get("WENXI_CRYPTO_WORKERS", "0")) or (os.cpu_count() or 1)
+CRYPTO_EXECUTOR = os.environ.get("WENXI_CRYPTO_EXECUTOR", "process").lower()
+SHARD_SIZE = 8 * 1024 * 1024  # 每个并行任务处理的明文量
+PARALLEL_THRESHOLD = 16 * 1024 * 1024  # 小于此大小的文件不分片，避免调度开销
+
+
+def _encrypt_range(input_path: str, output_path: str, layout: ChunkLayout,
+                   first_chunk: int, plain_offset: int, plain_length: int) -> int:
+    """
+    工作进程 - 加密明文区间[plain_offset, plain_offset + plain_length)
+    区间起点必须对齐块大小，密文按块序号直接写到输出文件对应偏移
+    """
+    chacha = ChaCha20Poly1305(layout.key)
+    chunk_size = layout.chunk_size
+    with open(input_path, 'rb') as infile:
+        infile.seek(plain_offset)
+        data = infile.read(plain_length)
+
+    with open(output_path, 'r+b') as outfile, memoryview(data) as view:
+        outfile.seek(layout.chunk_offset(first_chunk))
+        for index, offset in enumerate(range(0, len(data), chunk_size)):
+            outfile.write(layout.encrypt_chunk(chacha, first_chunk + index, view[offset:offset + chunk_size]))
+    return len(data)
+
+
+def _decrypt_range(input_path: str, output_path: str, layout: ChunkLayout,
+                   first_chunk: int, plain_offset: int, plain_length: int) -> int:
+    """工作进程 - 解密覆盖明文区间的密文块并写到输出文件对应偏移"""
+    chacha = ChaCha20Poly1305(layout.key)
+    chunk_count = -(-plain_length // layout.chunk_size)
+    with open(input_path, 'rb') as infile:
+        infile.seek(layout.chunk_offset(first_chunk))
+        data = infile.read(plain_length + chunk_count * TAG_SIZE)
+    if len(data) != plain_length + chunk_count * TAG_SIZE:
+        raise ValueError(f"解密数据不完整: 块{first_chunk}")
+
+    step = layout.chunk_size + TAG_SIZE
+    with open(output_path, 'r+b') as outfile, memoryview(data) as view:
+        outfile.seek(plain_offset)
+        for index, offset in enumerate(range(0, len(data), step)):
+            outfile.write(layout.decrypt_chunk(chacha, first_chunk + index, view[offset:offset + step]))
+    return plain_length
+
+
+def _encrypt_blocks(output_path: str, layout: ChunkLayout, first_chunk: int, data: bytes) -> bytes:
+    """
+    工作进程 - 加密从first_chunk开始的连续明文块，写到输出文件对应偏移（上传分块边到达边加密），
+    顺带返回各块的Merkle叶子哈希（依次拼接）
+    """
+    chacha = ChaCha20Poly1305(layout.key)
+    chunk_size = layout.chunk_size
+    leaves = bytearray()
+    with open(output_path, 'r+b') as outfile, memoryview(data) as view:
+        outfile.seek(layout.chunk_offset(first_chunk))
+        for index, offset in enumerate(range(0, len(data), chunk_size)):
+            block = view[offset:offset + chunk_size]
+            leaves += leaf_hash(block)
+            outfile.write(layout.encrypt_chunk(chacha, first_chunk + index, block))
+    return bytes(leaves)
+
+
+def _hash_range(input_path: str, layout: ChunkLayout, first_chunk: int,
+                plain_offset: int, plain_length: int) -> bytes:
+    """工作进程 - 解密覆盖明文区间的密文块，返回各块的Merkle叶子哈希（依次拼接），密文被篡改时抛出InvalidTag"""
+    chacha = ChaCha20Poly1305(layout.key)
+    chunk_count = -(-plain_length // layout.chunk_size)
+    with open(input_path, 'rb') as infile:
+        infile.seek(layout.chunk_offset(first_chunk))
+        data = infile.read(plain_length + chunk_count * TAG_SIZE)
+    if len(data) != plain_length + chunk_count * TAG_SIZE:
+        raise ValueError(f"解密数据不完整: 块{first_chunk}")
+
+    step = layout.chunk_size + TAG_SIZE
+    leaves = bytearray()
+    with memoryview(data) as view:
+        for index, offset in enumerate(range(0, len(data), step)):
+            leaves += leaf_hash(layout.decrypt_chunk(chacha, first_chunk + index, view[offset:offset + step]))
+    return bytes(leaves)
+
+
+def pool_context():
+    """
+    进程池的启动方式：服务进程已有事件循环、线程池和数据库线程，直接fork可能把其他线程持有的锁
+    带进子进程造成死锁；forkserver从干净的单线程服务进程派生工作进程，不支持的平台用spawn
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def plan_shards(size: int, chunk_size: int, shard_size: int = SHARD_SIZE) -> List[Tuple[int, int, int]]:
+    """
+    将明文按shard_size切分为互不重叠、对齐块大小的块区间
+
+    返回:
+        [(起始块序号, 明文偏移, 明文长度), ...]
+    """
+    shard_size = max(chunk_size, shard_size - shard_size % chunk_size)
+    return [
+        (offset // chunk_size, offset, min(shard_size, size - offset))
+        for offset in range(0, size, shard_size)
+    ]
+
+
+class CryptoEngine:
+    """
+    Wenxi多核加解密引擎
+    大文件分片并行处理，小文件整体交给单个工作者；所有调用都不阻塞事件循环
+    """
+
+    def __init__(self, workers: int = CRYPTO_WORKERS, executor_type: str = CRYPTO_EXECUTOR):
+        self.workers = max(1, workers)
+        self.executor_type = executor_type
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Executor:
+        """按需创建进程池/线程池"""
+        if self._executor is None:
+            if self.executor_type == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="wenxi-crypto")
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context())
+            logger.info(f"[Wenxi加密引擎] 已启动: {self.executor_type} x {self.workers}")
+        return self._executor
+
+    def shutdown(self):
+        """关闭工作池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _run_shards(self, worker, input_path: str, output_path: str, layout: ChunkLayout) -> None:
+        """把所有分片提交到工作池并等待全部完成"""
+        loop = asyncio.get_running_loop()
+        size = layout.size
+        shard_size = SHARD_SIZE if size >= PARALLEL_THRESHOLD else size + layout.chunk_size
+        await asyncio.gather(*[
+            loop.run_in_executor(self.executor, worker, input_path, output_path, layout,
+                                 first_chunk, plain_offset, plain_length)
+            for first_chunk, plain_offset, plain_length in plan_shards(size, layout.chunk_size, shard_size)
+        ])
+
+    async def encrypt_file(self, input_path: str, output_path: str, password: str = None,
+                           user_id: int = None, file_id: int = None, chunk_size: int = None) -> bool:
+        """
+        并行加密文件，输出与utils.encryption.encrypt_file相同的v3格式
+        v3每块nonce独立，各分片可在不同进程中安全加密
+
+        返回:
+            加密成功返回True，失败返回False
+        """
+        try:
+            layout, file_salt = new_v3_layout(password, chunk_size, os.path.getsize(input_path))
+
+            # 先写文件头并预分配密文大小，各分片按偏移直接写入
+            with open(output_path, 'wb') as outfile:
+                outfile.write(build_v3_header(layout, file_salt))
+                outfile.truncate(layout.chunks_end)
+
+            await self._run_shards(_encrypt_range, input_path, output_path, layout)
+
+            with open(output_path, 'r+b') as outfile:
+                outfile.seek(layout.chunks_end)
+                outfile.write(build_v3_index(layout))
+
+            user_info = f"[用户{user_id}文件{file_id}]" if user_id and file_id else ""
+            logger.info(f"[Wenxi并行加密] 成功{user_info}: {os.path.basename(input_path)} ({layout.size/1024/1024:.2f}MB)")
+            return True
+
+        except Exception as e:
+            logger.error(f"[Wenxi并行加密] 失败 {input_path}: {str(e)}")
+            if os.path.exists(output_path):
+                os.remove(output_path)  # 清理失败文件
+            return False
+
+    async def encrypt_blocks(self, output_path: str, layout: ChunkLayout, first_chunk: int, data: bytes) -> bytes:
+        """
+        在工作池中加密一段明文并写入已预分配的v3文件，供上传分块到达时调用
+        data必须从块边界开始，除文件最后一块外长度为块大小的整数倍
+
+        返回:
+            各块的Merkle叶子哈希（依次拼接）
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _encrypt_blocks, output_path, layout, first_chunk, data)
+
+    async def block_hashes(self, input_path: str, first_chunk: int = 0, end_chunk: Optional[int] = None,
+                           password: str = None) -> Tuple[ChunkLayout, bytes]:
+        """
+        并行解密块区间[first_chunk, end_chunk)并计算Merkle叶子哈希，不写出明文，自动识别v2/v3格式
+
+        返回:
+            (文件布局, 各块叶子哈希依次拼接)
+
+        异常:
+            ValueError: 文件格式错误或块区间越界
+            InvalidTag: 密文被篡改
+        """
+        layout = DecryptStream(input_path, password).layout
+        chunk_count = layout.chunk_count
+        end_chunk = chunk_count if end_chunk is None else end_chunk
+        if not 0 <= first_chunk <= end_chunk <= chunk_count:
+            raise ValueError(f"块区间越界: [{first_chunk}, {end_chunk})，共{chunk_count}块")
+
+        start = first_chunk * layout.chunk_size
+        size = min(layout.size, end_chunk * layout.chunk_size) - start
+        shard_size = SHARD_SIZE if size >= PARALLEL_THRESHOLD else size + layout.chunk_size
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self.executor, _hash_range, input_path, layout,
+                                 first_chunk + shard_chunk, start + plain_offset, plain_length)
+            for shard_chunk, plain_offset, plain_length in plan_shards(size, layout.chunk_size, shard_size)
+        ])
+        return layout, b"".join(results)
+
+    async def decrypt_file(self, input_path: str, output_path: str, password: str = None,
+                           user_id: int = None, file_id: int = None) -> bool:
+        """
+        并行解密文件，自动识别v2/v3格式
+
+        返回:
+            解密成功返回True，失败返回False
+        """
+        try:
+            layout = DecryptStream(input_path, password).layout
+
+            with open(output_path, 'wb') as outfile:
+                outfile.truncate(layout.size)
+
+            await self._run_shards(_decrypt_range, input_path, output_path, layout)
+
+            user_info = f"[用户{user_id}文件{file_id}]" if user_id and file_id else ""
+            logger.info(f"[Wenxi并行解密] 成功{user_info}: {os.path.basename(input_path)} ({layout.size/1024/1024:.2f}MB)")
+            return True
+
+        except Exception as e:
+            logger.error(f"[Wenxi并行解密] 失败 {input_path}: {str(e)}")
+            if os.path.exists(output_path):
+                os.remove(output_path)  # 清理失败文件
+            return False
+
+
+# 全局加解密引擎实例
+crypto_engine = CryptoEngine()
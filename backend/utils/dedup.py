@@ -0,0 +1,165 @@
+"""
+Wenxi网盘 - 内容寻址去重
+作者：Wenxi
+功能：按明文SHA256存储加密内容，引用计数管理物理文件，支持秒传与同内容并发上传合并
+说明：
+    - 加密内容只按服务器计算的SHA256登记，客户端声明的哈希仅用于查找
+    - 秒传只对用户自己已引用的内容生效：知道哈希不等于持有内容，跨用户去重只在实际上传数据后发生
+    - 引用计数与文件记录在同一事务中增减，计数归零后调用方在提交后删除物理文件
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from logger import logger
+from models import File as FileModel, FileBlob, FileMerkle
+from utils.identity_cache import invalidate_file
+
+
+class SingleFlight:
+    """
+    Wenxi并发合并 - 同一键同时只执行一次任务
+    后到的调用者等待首个任务完成并共享其结果（或异常）
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def pending(self, key: str) -> Optional[asyncio.Future]:
+        """返回该键正在执行的任务，没有则返回None"""
+        return self._inflight.get(key)
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """执行func，若同键任务已在执行则等待其结果"""
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 没有等待者时不输出未读取异常的警告
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def exclusive(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """等待同键任务结束后再执行func：同键任务依次执行、各自返回结果，执行期间pending(key)可见"""
+        while (future := self._inflight.get(key)) is not None:
+            await asyncio.gather(asyncio.shield(future), return_exceptions=True)
+        return await self.run(key, func)
+
+
+# 全局上传合并器：键为文件SHA256时是同一内容的入库（秒传预检等待其提交），
+# 键为session:{会话ID}时是同一会话的完成请求
+upload_flight = SingleFlight()
+
+
+async def find_blob(db: AsyncSession, checksum: str, file_size: Optional[int] = None) -> Optional[FileBlob]:
+    """
+    按SHA256查找加密内容；去重前上传的文件会在首次命中时登记为内容
+
+    参数:
+        checksum: 明文SHA256十六进制
+        file_size: 明文大小，提供时必须一致
+    """
+    blob = await db.scalar(select(FileBlob).where(FileBlob.checksum == checksum))
+    if blob is not None:
+        return blob if file_size is None or blob.file_size == file_size else None
+
+    query = select(FileModel).where(FileModel.checksum == checksum, FileModel.blob_id.is_(None))
+    if file_size is not None:
+        query = query.where(FileModel.file_size == file_size)
+    legacy = await db.scalar(query)
+    if legacy is None:
+        return None
+
+    owners = (await db.scalars(
+        select(FileModel).where(FileModel.file_path == legacy.file_path, FileModel.blob_id.is_(None))
+    )).all()
+    blob = FileBlob(checksum=checksum, file_path=legacy.file_path, file_size=legacy.file_size, ref_count=len(owners))
+    db.add(blob)
+    await db.flush()
+    for owner in owners:
+        owner.blob_id = blob.id
+        invalidate_file(owner.id)
+    logger.info(f"Wenxi - 旧文件登记为共享内容: {legacy.file_path} ({len(owners)}个引用)")
+    return blob
+
+
+async def find_owned_blob(db: AsyncSession, owner_id: int, checksum: str,
+                          file_size: Optional[int] = None) -> Optional[FileBlob]:
+    """
+    查找该用户已有文件引用的加密内容，供秒传使用；
+    只凭SHA256和大小不能证明持有内容，其他用户的内容一律视为不存在
+    """
+    blob = await find_blob(db, checksum, file_size)
+    if blob is None:
+        return None
+    owned = await db.scalar(
+        select(FileModel.id).where(FileModel.blob_id == blob.id, FileModel.owner_id == owner_id).limit(1)
+    )
+    return blob if owned is not None else None
+
+
+async def retain_blob(db: AsyncSession, blob: FileBlob) -> bool:
+    """
+    增加一次引用；内容已被并发删除时返回False
+    """
+    result = await db.execute(
+        update(FileBlob).where(FileBlob.id == blob.id).values(ref_count=FileBlob.ref_count + 1)
+    )
+    return result.rowcount == 1
+
+
+async def register_blob(db: AsyncSession, checksum: str, file_size: int, file_path: str) -> Tuple[FileBlob, bool]:
+    """
+    登记新上传的加密内容；相同内容已存在时改为引用已有内容
+
+    参数:
+        file_path: 本次上传写入的加密文件相对路径
+
+    返回:
+        (内容记录, 是否新建)。未新建且路径不同时，调用方应在提交后删除自己写入的文件
+    """
+    blob = await find_blob(db, checksum, file_size)
+    if blob is not None and await retain_blob(db, blob):
+        return blob, False
+
+    blob = FileBlob(checksum=checksum, file_path=file_path, file_size=file_size, ref_count=1)
+    try:
+        async with db.begin_nested():
+            db.add(blob)
+    except IntegrityError:
+        # 其他请求刚登记了相同内容
+        blob = (await db.scalars(select(FileBlob).where(FileBlob.checksum == checksum))).one()
+        await retain_blob(db, blob)
+        return blob, False
+    return blob, True
+
+
+async def release_blob(db: AsyncSession, blob_id: int) -> Optional[str]:
+    """
+    减少一次引用，计数归零时删除内容记录及其Merkle树
+
+    返回:
+        需要删除的加密文件相对路径；仍有引用时返回None
+    """
+    await db.execute(update(FileBlob).where(FileBlob.id == blob_id).values(ref_count=FileBlob.ref_count - 1))
+    blob = await db.scalar(
+        select(FileBlob).where(FileBlob.id == blob_id).execution_options(populate_existing=True)
+    )
+    if blob is None or blob.ref_count > 0:
+        return None
+    await db.execute(delete(FileMerkle).where(FileMerkle.blob_id == blob_id))
+    await db.delete(blob)
+    return blob.file_path
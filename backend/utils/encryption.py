@@ -1,24 +1,33 @@
 """
-Wenxi网盘 - 超强兼容性文件加密模块 v2.0
+Wenxi网盘 - 超强兼容性文件加密模块 v3.0
 作者：Wenxi
 功能：使用ChaCha20-Poly1305流加密，100%兼容所有文件格式
 支持：MP4、PDF、DOCX、JPG、PNG、ZIP、EXE等所有文件类型
 特点：零损坏、高性能、跨平台兼容、内存优化
+格式：v3（默认写入）每块独立nonce + 可配置块大小 + 尾部块索引；v2仍可读取
 """
 
 import os
+import time
 import struct
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from dotenv import load_dotenv
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
 from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.backends import default_backend
 import secrets
 
 from logger import logger
+from utils.metrics import crypto_bytes_total, crypto_seconds
+from utils.tracing import record_span, span
+from utils.merkle import leaf_hash
 
 # 从根目录加载环境变量
 root_dir = Path(__file__).parent.parent.parent
@@ -41,12 +50,146 @@ KEY_SIZE = 32  # ChaCha20 256-bit密钥
 NONCE_SIZE = 12  # ChaCha20标准nonce大小
 TAG_SIZE = 16  # Poly1305认证标签
 CHUNK_SIZE = 64 * 1024  # 64KB块大小，内存友好
+V2_HEADER_LENGTH = len(WENXI_MAGIC_HEADER) + 1 + NONCE_SIZE + 8
+
+# v3容器格式 - 每块独立nonce、块大小写入文件头、尾部块索引
+WENXI_MAGIC_HEADER_V3 = b'WENXI\x03\x00'  # v3.0标识
+HEADER_VERSION_V3 = 3
+FILE_SALT_SIZE = 16  # 文件级HKDF盐值
+V3_KEY_INFO = b'wenxi-v3-file-key'
+V3_CHUNK_NONCE_DOMAIN = 0  # 块nonce = 域(4字节) + 块序号(8字节)
+V3_INDEX_NONCE_DOMAIN = 1  # 索引nonce与块nonce分属不同域，永不重复
+V3_CHUNK_SIZE = int(os.environ.get("WENXI_CHUNK_SIZE", str(1024 * 1024)))  # 默认1MB块
+MIN_CHUNK_SIZE = 4 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+V3_HEADER_LENGTH = len(WENXI_MAGIC_HEADER_V3) + 1 + 4 + FILE_SALT_SIZE + 8
+V3_INDEX_MAGIC = b'WXIDX\x03\x00\x00'
+V3_TRAILER_LENGTH = 8 + len(V3_INDEX_MAGIC)
+
+
+KEY_DERIVATION_ITERATIONS = 1000000  # 100万次迭代，极致安全
+KEY_CACHE_SIZE = int(os.environ.get("WENXI_KEY_CACHE_SIZE", "8"))  # 派生密钥缓存上限
+
+
+class KeyCache:
+    """
+    Wenxi密钥缓存 - 有界、可清零的进程内派生密钥缓存
+    以(密码摘要, 盐值)为键，避免每次加解密都重复执行100万次PBKDF2
+    派生在全局锁外执行：同一密钥并发首次访问时由第一个请求派生、其余等待其结果（每键一把锁），
+    不同密钥的派生互不阻塞，命中也不必等待正在进行的派生
+    """
+    
+    def __init__(self, max_size: int = KEY_CACHE_SIZE):
+        self.max_size = max(1, max_size)
+        self._keys: "OrderedDict[tuple, bytearray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: "dict[tuple, threading.Lock]" = {}  # 正在派生的密钥 -> 该键的锁
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def _cache_key(password: str, salt: bytes) -> tuple:
+        """缓存键只保存密码摘要，不在缓存中保留明文密码"""
+        return hashlib.sha256(password.encode()).digest(), bytes(salt)
+    
+    def _lookup(self, cache_key: tuple):
+        """在全局锁内调用：命中时返回密钥副本并计数"""
+        key = self._keys.get(cache_key)
+        if key is None:
+            return None
+        self._keys.move_to_end(cache_key)
+        self.hits += 1
+        return bytes(key)
+    
+    def get_or_derive(self, password: str, salt: bytes) -> bytes:
+        """
+        获取派生密钥，未命中时执行PBKDF2并写入缓存
+        
+        参数:
+            password: 用户密码
+            salt: 盐值
+        
+        返回:
+            32字节ChaCha20安全密钥
+        """
+        cache_key = self._cache_key(password, salt)
+        with self._lock:
+            key = self._lookup(cache_key)
+            if key is not None:
+                return key
+            flight = self._inflight.setdefault(cache_key, threading.Lock())
+        
+        with flight:
+            # 等到锁时先到的请求可能已派生完成
+            with self._lock:
+                key = self._lookup(cache_key)
+                if key is not None:
+                    return key
+                self.misses += 1
+            try:
+                with span("kdf"):
+                    key = bytearray(_pbkdf2_derive(password, salt))
+                with self._lock:
+                    self._keys[cache_key] = key
+                    while len(self._keys) > self.max_size:
+                        _, evicted = self._keys.popitem(last=False)
+                        _zeroize(evicted)
+                        self.evictions += 1
+                    return bytes(key)
+            finally:
+                with self._lock:
+                    if self._inflight.get(cache_key) is flight:
+                        del self._inflight[cache_key]
+    
+    def clear(self):
+        """清零并清空所有缓存密钥（密钥轮换或关闭时调用）"""
+        with self._lock:
+            for key in self._keys.values():
+                _zeroize(key)
+            self._keys.clear()
+    
+    def stats(self) -> dict:
+        """获取缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._keys),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+def _zeroize(buffer: bytearray):
+    """原地覆盖密钥内容"""
+    for i in range(len(buffer)):
+        buffer[i] = 0
+
+
+def _pbkdf2_derive(password: str, salt: bytes) -> bytes:
+    """执行PBKDF2-HMAC-SHA256密钥派生（无缓存）"""
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=KEY_SIZE,
+        salt=salt,
+        iterations=KEY_DERIVATION_ITERATIONS,
+        backend=default_backend()
+    )
+    return kdf.derive(password.encode())
+
+
+# 全局密钥缓存实例
+key_cache = KeyCache()
 
 
 def derive_key(password: str, salt: bytes) -> bytes:
     """
     Wenxi超强兼容 - 从密码派生安全密钥
     使用PBKDF2-HMAC-SHA256，100万次迭代确保安全性
+    派生结果缓存在进程内，相同(密码, 盐值)只计算一次
     
     参数:
         password: 用户密码
@@ -55,20 +198,216 @@ def derive_key(password: str, salt: bytes) -> bytes:
     返回:
         32字节ChaCha20安全密钥
     """
-    kdf = PBKDF2HMAC(
+    return key_cache.get_or_derive(password, salt)
+
+
+def warm_key_cache() -> bool:
+    """
+    Wenxi - 启动时预派生默认密钥
+    避免首个上传/下载请求承担PBKDF2开销
+    """
+    try:
+        derive_key(ENCRYPTION_KEY, SALT)
+        logger.info("[Wenxi加密] 默认密钥已预派生")
+        return True
+    except Exception as e:
+        logger.error(f"[Wenxi加密] 密钥预派生失败: {str(e)}")
+        return False
+
+
+def get_key_cache_stats() -> dict:
+    """获取密钥缓存统计信息"""
+    return key_cache.stats()
+
+
+def clear_key_cache():
+    """清零并清空密钥缓存"""
+    key_cache.clear()
+
+
+def derive_file_key(master_key: bytes, file_salt: bytes) -> bytes:
+    """
+    Wenxi v3 - 为单个文件派生独立子密钥
+    使用HKDF-SHA256，每个文件的随机盐值不同，块nonce只需在文件内唯一
+    """
+    return HKDF(
         algorithm=hashes.SHA256(),
         length=KEY_SIZE,
-        salt=salt,
-        iterations=1000000,  # 100万次迭代，极致安全
+        salt=file_salt,
+        info=V3_KEY_INFO,
         backend=default_backend()
+    ).derive(master_key)
+
+
+def resolve_chunk_size(chunk_size: int = None) -> int:
+    """校验v3块大小，未指定时使用WENXI_CHUNK_SIZE"""
+    chunk_size = chunk_size or V3_CHUNK_SIZE
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError(f"块大小超出范围: {chunk_size}")
+    return chunk_size
+
+
+class ChunkLayout:
+    """
+    Wenxi密文块布局 - 统一描述v2/v3格式中每个块的偏移、nonce与关联数据
+    v2: 全文件共用头部nonce，块大小固定64KB
+    v3: 文件级HKDF子密钥 + 块序号nonce，块大小记录在文件头
+    实例可被pickle，供多进程加解密引擎直接使用
+    """
+    
+    def __init__(self, version: int, key: bytes, chunk_size: int, header_length: int,
+                 size: int = 0, base_nonce: bytes = b""):
+        self.version = version
+        self.key = key
+        self.chunk_size = chunk_size
+        self.header_length = header_length
+        self.size = size
+        self.base_nonce = base_nonce
+    
+    def nonce(self, chunk_index: int) -> bytes:
+        """第chunk_index个块的nonce"""
+        if self.version == HEADER_VERSION:
+            return self.base_nonce
+        return struct.pack('>IQ', V3_CHUNK_NONCE_DOMAIN, chunk_index)
+    
+    @staticmethod
+    def associated_data(chunk_index: int) -> bytes:
+        """块关联数据（块序号），防止块被重排"""
+        return struct.pack('>Q', chunk_index)
+    
+    def chunk_offset(self, chunk_index: int) -> int:
+        """第chunk_index个密文块在文件中的字节偏移"""
+        return self.header_length + chunk_index * (self.chunk_size + TAG_SIZE)
+    
+    @property
+    def chunk_count(self) -> int:
+        """明文对应的块数"""
+        return -(-self.size // self.chunk_size)
+    
+    @property
+    def chunks_end(self) -> int:
+        """最后一个密文块之后的偏移（v3块索引起点）"""
+        return self.header_length + self.size + self.chunk_count * TAG_SIZE
+    
+    def plain_length(self, chunk_index: int) -> int:
+        """第chunk_index个块的明文长度"""
+        return min(self.chunk_size, self.size - chunk_index * self.chunk_size)
+    
+    def encrypt_chunk(self, chacha: ChaCha20Poly1305, chunk_index: int, data) -> bytes:
+        """加密一个块"""
+        return chacha.encrypt(self.nonce(chunk_index), data, self.associated_data(chunk_index))
+    
+    def decrypt_chunk(self, chacha: ChaCha20Poly1305, chunk_index: int, data) -> bytes:
+        """解密并认证一个块"""
+        return chacha.decrypt(self.nonce(chunk_index), data, self.associated_data(chunk_index))
+
+
+def new_v3_layout(password: str = None, chunk_size: int = None, size: int = 0, file_salt: bytes = None) -> tuple:
+    """
+    为新文件生成v3布局
+    
+    参数:
+        file_salt: 已有的文件盐值（可选，如恢复上传会话的布局），默认随机生成
+    
+    返回:
+        (ChunkLayout, 文件盐值)
+    """
+    file_salt = file_salt or secrets.token_bytes(FILE_SALT_SIZE)
+    master_key = derive_key(password or ENCRYPTION_KEY, SALT)
+    layout = ChunkLayout(HEADER_VERSION_V3, derive_file_key(master_key, file_salt),
+                         resolve_chunk_size(chunk_size), V3_HEADER_LENGTH, size)
+    return layout, file_salt
+
+
+def build_v3_header(layout: ChunkLayout, file_salt: bytes) -> bytes:
+    """构建v3文件头：魔数 | 版本 | 块大小 | 文件盐值 | 原始大小"""
+    return (WENXI_MAGIC_HEADER_V3 + struct.pack('B', HEADER_VERSION_V3) + struct.pack('>I', layout.chunk_size)
+            + file_salt + struct.pack('>Q', layout.size))
+
+
+def build_v3_index(layout: ChunkLayout) -> bytes:
+    """
+    构建v3尾部块索引
+    索引明文为(原始大小, 块数)加每块(密文偏移, 明文长度)，整体经AEAD认证；
+    末尾附加8字节索引长度与索引魔数，解码器可从文件尾直接定位
+    """
+    entries = [struct.pack('>QQ', layout.size, layout.chunk_count)]
+    entries.extend(
+        struct.pack('>QI', layout.chunk_offset(index), layout.plain_length(index))
+        for index in range(layout.chunk_count)
     )
-    return kdf.derive(password.encode())
+    chacha = ChaCha20Poly1305(layout.key)
+    index_blob = chacha.encrypt(struct.pack('>IQ', V3_INDEX_NONCE_DOMAIN, 0), b"".join(entries), V3_INDEX_MAGIC)
+    return index_blob + struct.pack('>Q', len(index_blob)) + V3_INDEX_MAGIC
+
+
+def read_v3_index(infile, layout: ChunkLayout) -> list:
+    """
+    读取并认证v3尾部块索引
+    
+    返回:
+        [(密文偏移, 明文长度), ...]
+    """
+    infile.seek(0, os.SEEK_END)
+    file_length = infile.tell()
+    if file_length < layout.chunks_end + V3_TRAILER_LENGTH:
+        raise ValueError("块索引缺失或文件被截断")
+    infile.seek(file_length - V3_TRAILER_LENGTH)
+    index_length = struct.unpack('>Q', infile.read(8))[0]
+    if infile.read(len(V3_INDEX_MAGIC)) != V3_INDEX_MAGIC:
+        raise ValueError("块索引魔数无效")
+    if layout.chunks_end + index_length + V3_TRAILER_LENGTH != file_length:
+        raise ValueError("块索引位置与文件头不一致")
+    
+    infile.seek(layout.chunks_end)
+    chacha = ChaCha20Poly1305(layout.key)
+    index_data = chacha.decrypt(struct.pack('>IQ', V3_INDEX_NONCE_DOMAIN, 0), infile.read(index_length), V3_INDEX_MAGIC)
+    size, chunk_count = struct.unpack('>QQ', index_data[:16])
+    if size != layout.size or chunk_count != layout.chunk_count:
+        raise ValueError("块索引与文件头大小不一致")
+    return list(struct.iter_unpack('>QI', index_data[16:]))
 
 
-def encrypt_file(input_path: str, output_path: str, password: str = None, user_id: int = None, file_id: int = None) -> bool:
+def read_layout(infile, password: str = None) -> ChunkLayout:
+    """
+    解析v2/v3文件头并返回块布局，v3文件同时认证尾部块索引
+    
+    参数:
+        infile: 以二进制模式打开的加密文件
+        password: 解密密码(可选)
+    """
+    infile.seek(0)
+    magic = infile.read(len(WENXI_MAGIC_HEADER))
+    master_key = derive_key(password or ENCRYPTION_KEY, SALT)
+    
+    if magic == WENXI_MAGIC_HEADER:
+        version = struct.unpack('B', infile.read(1))[0]
+        if version != HEADER_VERSION:
+            raise ValueError(f"版本不兼容: {version}")
+        nonce = infile.read(NONCE_SIZE)
+        size = struct.unpack('>Q', infile.read(8))[0]
+        return ChunkLayout(HEADER_VERSION, master_key, CHUNK_SIZE, V2_HEADER_LENGTH, size, nonce)
+    
+    if magic == WENXI_MAGIC_HEADER_V3:
+        version = struct.unpack('B', infile.read(1))[0]
+        if version != HEADER_VERSION_V3:
+            raise ValueError(f"版本不兼容: {version}")
+        chunk_size = resolve_chunk_size(struct.unpack('>I', infile.read(4))[0])
+        file_salt = infile.read(FILE_SALT_SIZE)
+        size = struct.unpack('>Q', infile.read(8))[0]
+        layout = ChunkLayout(HEADER_VERSION_V3, derive_file_key(master_key, file_salt),
+                             chunk_size, V3_HEADER_LENGTH, size)
+        read_v3_index(infile, layout)
+        return layout
+    
+    raise ValueError("无效格式")
+
+
+def encrypt_file(input_path: str, output_path: str, password: str = None, user_id: int = None, file_id: int = None,
+                 chunk_size: int = None) -> bool:
     """
     Wenxi超强兼容 - 流式加密单个文件
-    使用ChaCha20-Poly1305，100%兼容所有文件格式
+    使用ChaCha20-Poly1305，100%兼容所有文件格式，输出v3容器格式
     
     参数:
         input_path: 输入文件路径
@@ -76,21 +415,48 @@ def encrypt_file(input_path: str, output_path: str, password: str = None, user_i
         password: 加密密码(可选)
         user_id: 用户ID(可选，用于日志追踪)
         file_id: 文件ID(可选，用于日志追踪)
+        chunk_size: 块大小(可选，默认WENXI_CHUNK_SIZE)
     
     返回:
         加密成功返回True，失败返回False
     
     特性:
-        - 零内存压力: 64KB块处理
+        - 零内存压力: 按块处理
         - 100%格式兼容: 支持MP4、PDF、ZIP等所有格式
-        - 自动完整性验证
+        - 自动完整性验证: 每块独立认证，尾部索引可独立校验
     """
+    encryptor = None
     try:
-        key_password = password or ENCRYPTION_KEY
-        nonce = secrets.token_bytes(NONCE_SIZE)  # 安全随机nonce
-        key = derive_key(key_password, SALT)
+        encryptor = EncryptStream(output_path, password, chunk_size)
+        with open(input_path, 'rb') as infile:
+            while True:
+                chunk = infile.read(encryptor.layout.chunk_size)
+                if not chunk:
+                    break
+                encryptor.write(chunk)
+        encrypted_size = encryptor.close()
         
-        # 创建ChaCha20-Poly1305实例
+        user_info = f"[用户{user_id}文件{file_id}]" if user_id and file_id else ""
+        logger.info(f"[Wenxi加密] 成功{user_info}: {os.path.basename(input_path)} ({encrypted_size/1024/1024:.2f}MB)")
+        return True
+        
+    except Exception as e:
+        logger.error(f"[Wenxi加密] 失败 {input_path}: {str(e)}")
+        if encryptor is not None:
+            encryptor.abort()
+        elif os.path.exists(output_path):
+            os.remove(output_path)  # 清理失败文件
+        return False
+
+
+def _encrypt_file_v2(input_path: str, output_path: str, password: str = None) -> bool:
+    """
+    Wenxi v2 - 旧版单nonce格式加密
+    仅用于兼容性测试与v2/v3基准对比，新文件一律使用encrypt_file写入v3
+    """
+    try:
+        nonce = secrets.token_bytes(NONCE_SIZE)  # 安全随机nonce
+        key = derive_key(password or ENCRYPTION_KEY, SALT)
         chacha = ChaCha20Poly1305(key)
         
         with open(input_path, 'rb') as infile, open(output_path, 'wb') as outfile:
@@ -98,29 +464,22 @@ def encrypt_file(input_path: str, output_path: str, password: str = None, user_i
             outfile.write(WENXI_MAGIC_HEADER)
             outfile.write(struct.pack('B', HEADER_VERSION))
             outfile.write(nonce)
+            outfile.write(struct.pack('>Q', os.path.getsize(input_path)))  # 8字节文件大小
             
-            # 流式加密 - 内存友好
-            file_size = os.path.getsize(input_path)
-            outfile.write(struct.pack('>Q', file_size))  # 8字节文件大小
-            
-            encrypted_size = 0
+            chunk_index = 0
             while True:
                 chunk = infile.read(CHUNK_SIZE)
                 if not chunk:
                     break
                 
                 # 为每个块生成关联数据（块序号）
-                associated_data = struct.pack('>Q', encrypted_size // CHUNK_SIZE)
-                encrypted_chunk = chacha.encrypt(nonce, chunk, associated_data)
-                outfile.write(encrypted_chunk)
-                encrypted_size += len(chunk)
-        
-        user_info = f"[用户{user_id}文件{file_id}]" if user_id and file_id else ""
-        logger.info(f"[Wenxi加密] 成功{user_info}: {os.path.basename(input_path)} ({encrypted_size/1024/1024:.2f}MB)")
+                associated_data = struct.pack('>Q', chunk_index)
+                outfile.write(chacha.encrypt(nonce, chunk, associated_data))
+                chunk_index += 1
         return True
         
     except Exception as e:
-        logger.error(f"[Wenxi加密] 失败 {input_path}: {str(e)}")
+        logger.error(f"[Wenxi加密v2] 失败 {input_path}: {str(e)}")
         if os.path.exists(output_path):
             os.remove(output_path)  # 清理失败文件
         return False
@@ -129,7 +488,7 @@ def encrypt_file(input_path: str, output_path: str, password: str = None, user_i
 def decrypt_file(input_path: str, output_path: str, password: str = None, user_id: int = None, file_id: int = None) -> bool:
     """
     Wenxi超强兼容 - 流式解密单个文件
-    仅支持新版ChaCha20-Poly1305格式，100%还原原始文件
+    支持v2与v3 ChaCha20-Poly1305格式，100%还原原始文件
     
     参数:
         input_path: 加密文件路径
@@ -143,15 +502,18 @@ def decrypt_file(input_path: str, output_path: str, password: str = None, user_i
     
     特性:
         - 100%文件完整性保证
-        - 仅支持新版ChaCha20-Poly1305格式
+        - 自动识别v2/v3格式
         - 零损坏风险
         - 支持大文件流式处理
     """
     try:
         key_password = password or ENCRYPTION_KEY
         
-        # 仅支持新版ChaCha20-Poly1305格式
-        return _decrypt_new_format(input_path, output_path, key_password, user_id, file_id)
+        if not _decrypt_new_format(input_path, output_path, key_password, user_id, file_id):
+            if os.path.exists(output_path):
+                os.remove(output_path)  # 清理失败文件
+            return False
+        return True
             
     except Exception as e:
         logger.error(f"[Wenxi解密] 失败 {input_path}: {str(e)}")
@@ -161,7 +523,8 @@ def decrypt_file(input_path: str, output_path: str, password: str = None, user_i
 
 def _decrypt_new_format(input_path: str, output_path: str, password: str, user_id: int = None, file_id: int = None) -> bool:
     """
-    Wenxi新版解密 - 新版ChaCha20-Poly1305格式专用
+    Wenxi新版解密 - ChaCha20-Poly1305 v2/v3格式专用
+    两种格式共用ChunkLayout，按文件头自动分派
     
     参数:
         input_path: 加密文件路径
@@ -174,54 +537,20 @@ def _decrypt_new_format(input_path: str, output_path: str, password: str, user_i
         解密成功返回True
     """
     try:
-        key = derive_key(password, SALT)
+        stream = DecryptStream(input_path, password)
         
-        with open(input_path, 'rb') as infile, open(output_path, 'wb') as outfile:
-            # 验证文件头
-            magic = infile.read(len(WENXI_MAGIC_HEADER))
-            if magic != WENXI_MAGIC_HEADER:
-                logger.error(f"[Wenxi解密] 无效格式: {os.path.basename(input_path)}")
-                return False
-            
-            version = struct.unpack('B', infile.read(1))[0]
-            if version != HEADER_VERSION:
-                logger.error(f"[Wenxi解密] 版本不兼容: {version}")
-                return False
-            
-            nonce = infile.read(NONCE_SIZE)
-            original_size = struct.unpack('>Q', infile.read(8))[0]
-            
-            chacha = ChaCha20Poly1305(key)
-            
-            # 流式解密
-            decrypted_size = 0
-            chunk_index = 0
-            
-            while decrypted_size < original_size:
-                # 计算当前块大小
-                remaining = original_size - decrypted_size
-                chunk_size = min(CHUNK_SIZE + TAG_SIZE, remaining + TAG_SIZE)
-                encrypted_chunk = infile.read(chunk_size)
-                
-                if not encrypted_chunk:
-                    break
-                
-                associated_data = struct.pack('>Q', chunk_index)
-                decrypted_chunk = chacha.decrypt(nonce, encrypted_chunk, associated_data)
-                
-                # 写入实际大小的数据（处理最后一块）
-                write_size = min(len(decrypted_chunk), original_size - decrypted_size)
-                outfile.write(decrypted_chunk[:write_size])
-                
-                decrypted_size += write_size
-                chunk_index += 1
-            
-            if decrypted_size != original_size:
-                logger.error(f"[Wenxi解密] 大小不匹配: 期望{original_size}, 实际{decrypted_size}")
-                return False
+        decrypted_size = 0
+        with open(output_path, 'wb') as outfile:
+            for decrypted_chunk in stream.iter_range(0, stream.size):
+                outfile.write(decrypted_chunk)
+                decrypted_size += len(decrypted_chunk)
+        
+        if decrypted_size != stream.size:
+            logger.error(f"[Wenxi解密] 大小不匹配: 期望{stream.size}, 实际{decrypted_size}")
+            return False
         
         user_info = f"[用户{user_id}文件{file_id}]" if user_id and file_id else ""
-        logger.info(f"[Wenxi解密] 成功{user_info}: {os.path.basename(input_path)} ({decrypted_size/1024/1024:.2f}MB)")
+        logger.info(f"[Wenxi解密] 成功{user_info}: {os.path.basename(input_path)} v{stream.layout.version} ({decrypted_size/1024/1024:.2f}MB)")
         return True
         
     except Exception as e:
@@ -229,6 +558,155 @@ def _decrypt_new_format(input_path: str, output_path: str, password: str, user_i
         return False
 
 
+class EncryptStream:
+    """
+    Wenxi流式加密 - 数据边到达边加密写盘，明文不落地
+    输出v3格式，原始大小在close时回填到文件头，并追加尾部块索引
+    
+    用法:
+        stream = EncryptStream(output_path)
+        stream.write(data)  # 可多次调用，任意长度
+        stream.close()      # 加密剩余数据、回填大小并写入索引
+    """
+    
+    SIZE_OFFSET = V3_HEADER_LENGTH - 8
+    
+    def __init__(self, output_path: str, password: str = None, chunk_size: int = None):
+        self.output_path = output_path
+        self.size = 0
+        self.layout, file_salt = new_v3_layout(password, chunk_size)
+        self._chacha = ChaCha20Poly1305(self.layout.key)
+        self._pending = bytearray()
+        self._chunk_index = 0
+        self.leaves = bytearray()  # 各块的Merkle叶子哈希，随加密依次追加
+        
+        self._outfile = open(output_path, 'wb')
+        self._outfile.write(build_v3_header(self.layout, file_salt))  # 原始大小占位，close时回填
+    
+    def _encrypt_chunk(self, chunk) -> None:
+        """加密并写出一个完整块"""
+        self.leaves += leaf_hash(chunk)
+        self._outfile.write(self.layout.encrypt_chunk(self._chacha, self._chunk_index, chunk))
+        self._chunk_index += 1
+    
+    def write(self, data: bytes) -> None:
+        """追加明文数据，凑满一个块即加密写出"""
+        chunk_size = self.layout.chunk_size
+        self.size += len(data)
+        with memoryview(data) as view:
+            if self._pending:
+                needed = chunk_size - len(self._pending)
+                self._pending += view[:needed]
+                view = view[needed:]
+                if len(self._pending) < chunk_size:
+                    return
+                self._encrypt_chunk(self._pending)
+                self._pending = bytearray()
+            
+            full_length = len(view) - len(view) % chunk_size
+            for offset in range(0, full_length, chunk_size):
+                self._encrypt_chunk(view[offset:offset + chunk_size])
+            self._pending += view[full_length:]
+    
+    def close(self) -> int:
+        """
+        写出最后一个不足块大小的块、回填原始大小并追加块索引
+        
+        返回:
+            明文总字节数
+        """
+        if self._pending:
+            self._encrypt_chunk(bytes(self._pending))
+            self._pending.clear()
+        self.layout.size = self.size
+        self._outfile.write(build_v3_index(self.layout))
+        self._outfile.seek(self.SIZE_OFFSET)
+        self._outfile.write(struct.pack('>Q', self.size))
+        self._outfile.close()
+        return self.size
+    
+    def abort(self) -> None:
+        """放弃加密并删除不完整的输出文件"""
+        try:
+            self._outfile.close()
+        finally:
+            if os.path.exists(self.output_path):
+                os.remove(self.output_path)
+
+
+class DecryptStream:
+    """
+    Wenxi流式解密 - 边读密文边解密，不落地明文临时文件
+    构造时即校验文件头（v3同时认证块索引），便于在发送响应头之前发现格式错误
+    
+    用法:
+        stream = DecryptStream(path)
+        for plaintext in stream:  # 每次产出一个已通过Poly1305认证的块
+            ...
+        for plaintext in stream.iter_range(start, end):  # 只解密覆盖该区间的块
+            ...
+    """
+    
+    def __init__(self, input_path: str, password: str = None, user_id: int = None, file_id: int = None):
+        self.input_path = input_path
+        self.user_id = user_id
+        self.file_id = file_id
+        
+        with open(input_path, 'rb') as infile:
+            try:
+                self.layout = read_layout(infile, password)
+            except (ValueError, struct.error) as e:
+                raise ValueError(f"{e}: {os.path.basename(input_path)}")
+        self.size = self.layout.size
+        self._chacha = ChaCha20Poly1305(self.layout.key)
+    
+    def __iter__(self):
+        """按块解密，内存占用恒定为一个块"""
+        yield from self.iter_range(0, self.size)
+        
+        user_info = f"[用户{self.user_id}文件{self.file_id}]" if self.user_id and self.file_id else ""
+        logger.info(f"[Wenxi流式解密] 完成{user_info}: {os.path.basename(self.input_path)} ({self.size/1024/1024:.2f}MB)")
+    
+    def iter_range(self, start: int, end: int):
+        """
+        随机访问解密 - 只读取并解密覆盖[start, end)的密文块
+        
+        参数:
+            start: 明文起始偏移（包含）
+            end: 明文结束偏移（不包含）
+        """
+        end = min(end, self.size)
+        if start >= end:
+            return
+        
+        layout = self.layout
+        chunk_index = start // layout.chunk_size
+        position = chunk_index * layout.chunk_size
+        with open(self.input_path, 'rb') as infile:
+            infile.seek(layout.chunk_offset(chunk_index))
+            while position < end:
+                plain_size = layout.plain_length(chunk_index)
+                encrypted_chunk = infile.read(plain_size + TAG_SIZE)
+                if len(encrypted_chunk) != plain_size + TAG_SIZE:
+                    logger.error(f"[Wenxi流式解密] 密文不完整: 块{chunk_index}, 期望{plain_size + TAG_SIZE}字节")
+                    raise ValueError("解密数据不完整")
+                
+                decrypt_start = time.perf_counter()
+                decrypted_chunk = layout.decrypt_chunk(self._chacha, chunk_index, encrypted_chunk)
+                decrypt_seconds = time.perf_counter() - decrypt_start
+                crypto_seconds.observe(decrypt_seconds, operation="decrypt")
+                record_span("decrypt", decrypt_seconds)
+                crypto_bytes_total.inc(plain_size, operation="decrypt")
+                
+                # 裁剪首尾块中不在请求范围内的部分
+                head = max(start - position, 0)
+                tail = min(end - position, plain_size)
+                yield decrypted_chunk[head:tail] if head or tail != plain_size else decrypted_chunk
+                
+                position += plain_size
+                chunk_index += 1
+
+
 def encrypt_stream(data: bytes, password: str = None) -> bytes:
     """
     Wenxi超强兼容 - 加密数据流
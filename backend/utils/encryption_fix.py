@@ -7,7 +7,7 @@ Wenxi网盘 - 加密格式兼容性修复工具
 import os
 import struct
 import logging
-from utils.encryption import encrypt_file, decrypt_file, WENXI_MAGIC_HEADER, HEADER_VERSION
+from utils.encryption import encrypt_file, decrypt_file, WENXI_MAGIC_HEADER, WENXI_MAGIC_HEADER_V3, HEADER_VERSION
 from logger import logger
 
 def check_file_format(file_path):
@@ -27,9 +27,9 @@ def check_file_format(file_path):
         if len(header) < 8:
             return "文件过小，可能已损坏"
             
-        magic = header[:6]
-        if magic == WENXI_MAGIC_HEADER:
-            version = struct.unpack('B', header[6:7])[0] if len(header) >= 7 else 0
+        magic = header[:len(WENXI_MAGIC_HEADER)]
+        if magic in (WENXI_MAGIC_HEADER, WENXI_MAGIC_HEADER_V3):
+            version = struct.unpack('B', header[7:8])[0]
             return f"Wenxi格式 v{version}.0 - ChaCha20-Poly1305"
         elif header.startswith(b'\x00\x00\x00\x20'):
             return "旧版AES格式 - 需要升级"
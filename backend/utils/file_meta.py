@@ -0,0 +1,232 @@
+"""
+Wenxi网盘 - 文件元数据缓存
+作者：Wenxi
+功能：在缓存后端（Redis或进程内）中保存下载所需的文件元数据，下载鉴权和响应头无需查询数据库
+说明：记录为紧凑JSON（属主、存储路径、大小、类型、校验和、密文版本、分享令牌），
+      分享链接另存 令牌 -> 文件id 的映射；删除文件、变更分享状态的路由提交后调用invalidate_file_meta。
+      记录授权下载与分享访问，有效期与身份缓存一样短：使用Redis时记录由各进程共享，失效对所有进程生效
+      （熔断期间的删除在Redis恢复后重放）；使用进程内缓存时失效只作用于执行它的进程，
+      其他进程最多在有效期内仍按旧记录放行已删除的文件或已撤销的分享令牌
+    - 写回有条件：失效时为文件写入新的失效标记，读取元数据时一并取得当时的标记，
+      写回前后标记已变化（读取之后文件被删除或分享状态变更）则不写入或立即删除，不会让已删除文件的旧记录复活
+环境变量：
+    WENXI_FILE_META_TTL     元数据记录有效期（秒，默认60）
+"""
+
+import os
+import json
+import uuid
+import threading
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from logger import logger
+from models import File as FileModel
+from utils.cache import get_cache
+
+FILE_META_TTL = float(os.environ.get("WENXI_FILE_META_TTL", "60"))
+
+# 记录格式版本，字段变化时递增，旧格式记录按未命中处理
+META_FORMAT = 1
+
+
+class FileMeta:
+    """下载一个文件所需的全部元数据"""
+
+    FIELDS = ("id", "owner_id", "path", "size", "name", "mime", "checksum", "cipher", "share_token")
+    __slots__ = FIELDS + ("stamp",)
+
+    def __init__(self, id: int, owner_id: int, path: str, size: int, name: str,
+                 mime: Optional[str] = None, checksum: Optional[str] = None,
+                 cipher: Optional[int] = None, share_token: Optional[str] = None):
+        self.id = id
+        self.owner_id = owner_id
+        self.path = path
+        self.size = size
+        self.name = name
+        self.mime = mime
+        self.checksum = checksum
+        self.cipher = cipher  # 密文格式版本，首次打开密文后填入
+        self.share_token = share_token
+        self.stamp = None  # 读取时的失效标记（不序列化），None表示由刚提交的记录生成，写回时不检查
+
+    @classmethod
+    def from_file(cls, file: FileModel, cipher: Optional[int] = None) -> "FileMeta":
+        """由文件记录生成"""
+        return cls(
+            id=file.id, owner_id=file.owner_id, path=file.file_path, size=file.file_size,
+            name=file.original_filename, mime=file.mime_type, checksum=file.checksum,
+            cipher=cipher, share_token=file.share_token if file.is_shared else None
+        )
+
+    def dumps(self) -> str:
+        """序列化为紧凑JSON"""
+        return json.dumps(
+            [META_FORMAT] + [getattr(self, name) for name in self.FIELDS],
+            ensure_ascii=False, separators=(",", ":")
+        )
+
+    @classmethod
+    def loads(cls, raw: str) -> "FileMeta":
+        """
+        反序列化
+
+        异常:
+            ValueError: 记录损坏或格式版本不同
+        """
+        try:
+            values = json.loads(raw)
+        except (TypeError, ValueError):
+            raise ValueError("文件元数据记录损坏")
+        if not isinstance(values, list) or len(values) != len(cls.FIELDS) + 1 or values[0] != META_FORMAT:
+            raise ValueError("文件元数据记录格式不匹配")
+        return cls(*values[1:])
+
+
+class MetaStats:
+    """元数据缓存命中统计，hits即省去的数据库查询次数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def count(self, field: str, amount: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = self.stores = self.invalidations = 0
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "ttl": FILE_META_TTL,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+meta_stats = MetaStats()
+
+
+def meta_key(file_id: int) -> str:
+    return f"file:meta:{file_id}"
+
+
+def share_key(share_token: str) -> str:
+    return f"file:share:{share_token}"
+
+
+def stamp_key(file_id: int) -> str:
+    return f"file:stamp:{file_id}"
+
+
+async def _current_stamp(file_id: int) -> str:
+    return await get_cache().get(stamp_key(file_id)) or ""
+
+
+async def _read_meta(file_id: int) -> Optional[FileMeta]:
+    """只读缓存（与失效标记一次读取），损坏的记录删除后按未命中处理"""
+    raw, stamp = await get_cache().get_many([meta_key(file_id), stamp_key(file_id)])
+    if raw is None:
+        return None
+    try:
+        meta = FileMeta.loads(raw)
+    except ValueError as e:
+        logger.warning(f"Wenxi - 丢弃文件元数据缓存 {file_id}: {e}")
+        await get_cache().delete(meta_key(file_id))
+        return None
+    meta.stamp = stamp or ""
+    return meta
+
+
+async def remember_file_meta(meta: FileMeta):
+    """
+    写入元数据记录（分享中的文件同时写入令牌映射）
+    读取之后失效标记已变化时不写入；检查与写入之间发生失效时写入后立即删除
+    """
+    if meta.stamp is not None and await _current_stamp(meta.id) != meta.stamp:
+        return
+    mapping = {meta_key(meta.id): meta.dumps()}
+    if meta.share_token:
+        mapping[share_key(meta.share_token)] = str(meta.id)
+    await get_cache().set_many(mapping, FILE_META_TTL)
+    if meta.stamp is not None and await _current_stamp(meta.id) != meta.stamp:
+        await get_cache().delete(*mapping)
+        return
+    meta_stats.count("stores")
+
+
+async def get_file_meta(db: AsyncSession, file_id: int) -> Optional[FileMeta]:
+    """
+    按id读取文件元数据，命中时不查询数据库
+
+    未命中时从数据库读取但不写回：密文版本要在打开密文后才知道，由调用方补全后调用remember_file_meta；
+    先取失效标记再读数据库，读取之后的删除都会改变标记，写回时据此放弃
+    """
+    meta = await _read_meta(file_id)
+    if meta is not None:
+        meta_stats.count("hits")
+        return meta
+    meta_stats.count("misses")
+    await db.commit()  # 结束此前的读事务（SQLite的读快照可能早于删除），下面读到取标记之后的数据
+    stamp = await _current_stamp(file_id)
+    file = await db.scalar(select(FileModel).where(FileModel.id == file_id))
+    if file is None:
+        return None
+    meta = FileMeta.from_file(file)
+    meta.stamp = stamp
+    return meta
+
+
+async def get_owned_file_meta(db: AsyncSession, file_id: int, owner_id: int) -> Optional[FileMeta]:
+    """读取属于owner_id的文件元数据，不属于该用户时返回None"""
+    meta = await get_file_meta(db, file_id)
+    return meta if meta is not None and meta.owner_id == owner_id else None
+
+
+async def get_shared_file_meta(db: AsyncSession, share_token: str) -> Optional[FileMeta]:
+    """按分享令牌读取文件元数据，令牌映射与记录都命中时不查询数据库"""
+    file_id = await get_cache().get(share_key(share_token))
+    if file_id is not None and file_id.isdigit():
+        meta = await _read_meta(int(file_id))
+        if meta is not None and meta.share_token == share_token:
+            meta_stats.count("hits")
+            return meta
+    meta_stats.count("misses")
+    shared = (FileModel.share_token == share_token, FileModel.is_shared == True)
+    file = await db.scalar(select(FileModel).where(*shared))
+    if file is None:
+        return None
+    # 按令牌查询前不知道文件id：取得失效标记后再确认一次仍在分享，之后的删除或取消分享都会改变标记
+    meta = FileMeta.from_file(file)
+    await db.commit()
+    meta.stamp = await _current_stamp(file.id)
+    if await db.scalar(select(FileModel.id).where(FileModel.id == file.id, *shared)) is None:
+        return None
+    return meta
+
+
+async def invalidate_file_meta(file_id: int, share_token: Optional[str] = None):
+    """文件删除或分享状态变更后调用，share_token为变更前的分享令牌；先更新失效标记，挡住进行中的写回"""
+    keys = [meta_key(file_id)]
+    if share_token:
+        keys.append(share_key(share_token))
+    await get_cache().set(stamp_key(file_id), uuid.uuid4().hex, FILE_META_TTL)
+    await get_cache().delete(*keys)
+    meta_stats.count("invalidations")
+
+
+def file_meta_stats() -> dict:
+    """获取元数据缓存命中统计"""
+    return meta_stats.as_dict()
@@ -0,0 +1,145 @@
+"""
+Wenxi网盘 - 用户/文件记录读穿缓存
+作者：Wenxi
+功能：按用户名缓存User行、按id缓存File行，命中时把列快照挂回当前会话，不发出SQL
+说明：缓存的是列值快照而不是ORM对象，命中后得到的是当前会话中的持久化实例，修改后照常提交；
+      修改这些行的路由在提交后调用invalidate_*。多进程部署时各进程缓存独立，其他进程最多在TTL内看到旧值
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import User, File as FileModel
+
+IDENTITY_CACHE_SIZE = int(os.environ.get("WENXI_IDENTITY_CACHE_SIZE", "10000"))  # 每类记录的缓存上限
+IDENTITY_CACHE_TTL = float(os.environ.get("WENXI_IDENTITY_CACHE_TTL", "60"))  # 缓存有效期（秒）
+
+
+class IdentityCache:
+    """
+    Wenxi记录缓存 - 有界、带TTL的进程内LRU缓存
+    值为列名到列值的字典，过期条目在读取时丢弃
+    """
+
+    def __init__(self, max_size: int = IDENTITY_CACHE_SIZE, ttl: float = IDENTITY_CACHE_TTL):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """读取未过期的快照，未命中返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, values: Dict[str, Any]):
+        """写入快照，超出上限时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """删除一条缓存"""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """获取缓存命中统计，hits即节省的数据库查询次数"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+# 全局缓存实例
+user_cache = IdentityCache()
+file_cache = IdentityCache()
+
+
+def snapshot(instance) -> Dict[str, Any]:
+    """提取实例的全部列值"""
+    return {attr.key: getattr(instance, attr.key) for attr in inspect(instance).mapper.column_attrs}
+
+
+async def attach(db: AsyncSession, model, values: Dict[str, Any]):
+    """
+    把快照还原为当前会话中的持久化实例，不发出SQL
+    会话中已有同一行时返回已有实例
+    """
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return await db.merge(instance, load=False)
+
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    """按用户名读取用户，优先使用缓存"""
+    values = user_cache.get(username)
+    if values is not None:
+        return await attach(db, User, values)
+    user = await db.scalar(select(User).where(User.username == username))
+    if user is not None:
+        user_cache.put(username, snapshot(user))
+    return user
+
+
+async def get_owned_file(db: AsyncSession, file_id: int, owner_id: int) -> Optional[FileModel]:
+    """按id读取属于owner_id的文件，优先使用缓存"""
+    values = file_cache.get(file_id)
+    if values is not None:
+        return await attach(db, FileModel, values) if values["owner_id"] == owner_id else None
+    file = await db.scalar(select(FileModel).where(FileModel.id == file_id))
+    if file is None:
+        return None
+    file_cache.put(file_id, snapshot(file))
+    return file if file.owner_id == owner_id else None
+
+
+def invalidate_user(username: str):
+    """用户名、邮箱、密码变更或账户删除后调用"""
+    user_cache.invalidate(username)
+
+
+def invalidate_file(file_id: int):
+    """文件删除或分享状态变更后调用"""
+    file_cache.invalidate(file_id)
+
+
+def cache_stats() -> dict:
+    """获取各类记录缓存的统计"""
+    return {"user": user_cache.stats(), "file": file_cache.stats()}
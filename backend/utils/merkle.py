@@ -0,0 +1,172 @@
+"""
+Wenxi网盘 - Merkle树完整性校验
+作者：Wenxi
+功能：每份加密内容按密文块（v3块大小，默认1MB）计算叶子哈希并组成Merkle树保存在数据库，
+      校验任意字节区间、单个上传分块或续传下载的片段时，只需读取覆盖该区间的块和对数级的证明路径
+说明：
+    - 叶子 = SHA256(0x00 || 块明文)，内部节点 = SHA256(0x01 || 左 || 右)，落单的节点直接升到上一层；
+      前缀区分叶子与内部节点，防止第二原像攻击
+    - 叶子在上传时随加密一起计算（单次上传由EncryptStream、断点续传由加密引擎的工作进程），不额外读文件
+    - 整个文件校验时由加密引擎把块区间分给多个进程并行解密、计算叶子
+    - 本功能之前保存的内容首次校验时补建树；仍未登记为共享内容的旧文件只临时计算不保存
+"""
+
+import hashlib
+from typing import List, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from logger import logger
+from models import File as FileModel, FileMerkle
+
+HASH_SIZE = 32
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(data) -> bytes:
+    """一个块明文的叶子哈希"""
+    hasher = hashlib.sha256(LEAF_PREFIX)
+    hasher.update(data)
+    return hasher.digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def split_leaves(leaves: bytes) -> List[bytes]:
+    """把拼接存储的叶子哈希拆成列表"""
+    return [leaves[offset:offset + HASH_SIZE] for offset in range(0, len(leaves), HASH_SIZE)]
+
+
+def parent_level(nodes: List[bytes]) -> List[bytes]:
+    return [
+        node_hash(nodes[i], nodes[i + 1]) if i + 1 < len(nodes) else nodes[i]
+        for i in range(0, len(nodes), 2)
+    ]
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    """根哈希；空文件没有叶子，根为空串的SHA256"""
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    level = leaves
+    while len(level) > 1:
+        level = parent_level(level)
+    return level[0]
+
+
+def block_range(start: int, end: int, block_size: int) -> Tuple[int, int]:
+    """覆盖明文区间[start, end)的块序号区间[first, last)"""
+    return start // block_size, -(-end // block_size)
+
+
+def range_proof(leaves: List[bytes], first: int, end: int) -> List[bytes]:
+    """
+    叶子区间[first, end)到根的证明：自底向上，每层依次给出区间左侧与右侧缺少的兄弟节点
+    """
+    proof, level = [], leaves
+    while len(level) > 1:
+        if first % 2:
+            proof.append(level[first - 1])
+        if end % 2 and end < len(level):
+            proof.append(level[end])
+        level = parent_level(level)
+        first, end = first // 2, (end + 1) // 2
+    return proof
+
+
+def root_from_range(range_leaves: List[bytes], first: int, leaf_count: int, proof: List[bytes]) -> Optional[bytes]:
+    """由叶子区间及其证明还原根哈希，证明长度不符时返回None"""
+    if leaf_count == 0:
+        return merkle_root([]) if not range_leaves and not proof else None
+    nodes, end, siblings = list(range_leaves), first + len(range_leaves), iter(proof)
+    if not nodes or end > leaf_count:
+        return None
+    try:
+        while leaf_count > 1:
+            if first % 2:
+                nodes.insert(0, next(siblings))
+                first -= 1
+            if end % 2 and end < leaf_count:
+                nodes.append(next(siblings))
+                end += 1
+            nodes = parent_level(nodes)
+            first, end, leaf_count = first // 2, (end + 1) // 2, (leaf_count + 1) // 2
+    except StopIteration:
+        return None
+    if next(siblings, None) is not None:
+        return None
+    return nodes[0]
+
+
+def verify_range(range_leaves: List[bytes], first: int, leaf_count: int, proof: List[bytes], root: bytes) -> bool:
+    """校验一段连续叶子属于根为root的树"""
+    return root_from_range(range_leaves, first, leaf_count, proof) == root
+
+
+def new_tree(blob_id: Optional[int], block_size: int, leaves: bytes) -> FileMerkle:
+    """由拼接的叶子哈希构建树记录（调用方决定是否加入数据库会话）"""
+    return FileMerkle(blob_id=blob_id, block_size=block_size, leaves=leaves,
+                      root=merkle_root(split_leaves(leaves)).hex())
+
+
+async def compute_leaves(file_path: str, first: int = 0, end: Optional[int] = None) -> Tuple[int, bytes]:
+    """
+    解密块[first, end)并计算叶子哈希，大区间由加密引擎分片并行
+
+    返回:
+        (块大小, 拼接的叶子哈希)
+    """
+    from utils.crypto_engine import crypto_engine
+    layout, leaves = await crypto_engine.block_hashes(file_path, first, end)
+    return layout.chunk_size, leaves
+
+
+async def ensure_tree(db: AsyncSession, file: FileModel, file_path: str) -> FileMerkle:
+    """读取文件内容的Merkle树；没有时由加密文件计算，登记为共享内容的文件顺带保存"""
+    if file.blob_id is not None:
+        tree = await db.scalar(select(FileMerkle).where(FileMerkle.blob_id == file.blob_id))
+        if tree is not None:
+            return tree
+    block_size, leaves = await compute_leaves(file_path)
+    tree = new_tree(file.blob_id, block_size, leaves)
+    if file.blob_id is not None:
+        try:
+            async with db.begin_nested():
+                db.add(tree)
+        except IntegrityError:
+            # 其他请求刚为同一内容补建了树
+            return await db.scalar(select(FileMerkle).where(FileMerkle.blob_id == file.blob_id))
+        await db.commit()
+        logger.info(f"Wenxi - 补建Merkle树: {file.file_path} ({len(leaves) // HASH_SIZE}个块)")
+    return tree
+
+
+async def verify_stored_range(tree: FileMerkle, file_path: str, file_size: int,
+                              start: Optional[int] = None, end: Optional[int] = None) -> Tuple[bool, int]:
+    """
+    校验加密文件中明文区间[start, end)与Merkle树一致；不指定区间时校验整个文件（多进程并行）
+
+    返回:
+        (是否一致, 校验的块数)
+    """
+    leaves = split_leaves(tree.leaves)
+    root = bytes.fromhex(tree.root)
+    whole = start is None and end is None
+    first, last = block_range(start or 0, file_size if end is None else end, tree.block_size)
+    try:
+        block_size, computed = await compute_leaves(file_path, first, last)
+    except (InvalidTag, ValueError) as e:
+        logger.error(f"Wenxi - Merkle校验解密失败: {file_path}, {e}")
+        return False, last - first
+    if block_size != tree.block_size:
+        return False, last - first
+    computed = split_leaves(computed)
+    if whole:
+        return len(computed) == len(leaves) and merkle_root(computed) == root, len(computed)
+    return verify_range(computed, first, len(leaves), range_proof(leaves, first, last), root), len(computed)
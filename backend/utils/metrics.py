@@ -0,0 +1,384 @@
+"""
+Wenxi网盘 - 运行指标
+作者：Wenxi
+功能：进程内聚合计数器、仪表和直方图，供/api/files/performance和Prometheus文本格式的/metrics读取
+特点：每次记录只是加锁后的几次整数/浮点加法，无后台线程、无外部依赖；
+      直方图使用固定分桶，分位数按桶内线性插值估算（与Prometheus的histogram_quantile一致）。
+      多进程部署时每个进程各自统计，由Prometheus按实例汇总
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.tracing import record_span
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# 常用分桶
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400, 800, 1600)  # MB/s
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        f'{name}="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in key
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """指标基类，按标签组合分别累计"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+    def total(self) -> float:
+        """所有标签组合之和"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Counter(Metric):
+    """只增计数器"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """可增可减的当前值"""
+
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(Metric):
+    """固定分桶直方图，记录每个桶的计数、总和与总数"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = SECONDS_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, list] = {}  # [各桶计数..., 总和, 总数]
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _merged(self, labels: Optional[Dict[str, str]] = None) -> list:
+        """指定标签的序列，未指定时合并所有标签组合"""
+        with self._lock:
+            if labels is not None:
+                series = self._series.get(_label_key(labels))
+                return list(series) if series else [0] * (len(self.buckets) + 1) + [0.0, 0]
+            merged = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            for series in self._series.values():
+                merged = [a + b for a, b in zip(merged, series)]
+            return merged
+
+    def summary(self, **labels) -> dict:
+        """总数、总和、平均值与估算的p50/p95/p99"""
+        series = self._merged(labels or None)
+        count, total = series[-1], series[-2]
+        return {
+            "count": count,
+            "sum": total,
+            "avg": total / count if count else 0.0,
+            "p50": self._quantile(series, 0.5),
+            "p95": self._quantile(series, 0.95),
+            "p99": self._quantile(series, 0.99)
+        }
+
+    def _quantile(self, series: list, q: float) -> float:
+        count = series[-1]
+        if not count:
+            return 0.0
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(series[:len(self.buckets) + 1]):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]  # 落在+Inf桶时只能给出最大边界
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        result = []
+        for key, series in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series):
+                cumulative += bucket_count
+                result.append((f"{self.name}_bucket", key + (("le", _format_value(float(bound))),), cumulative))
+            result.append((f"{self.name}_sum", key, series[-2]))
+            result.append((f"{self.name}_count", key, series[-1]))
+        return result
+
+
+class Registry:
+    """指标注册表，渲染为Prometheus文本格式"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self.register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self.register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = SECONDS_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, buckets))
+
+    def add_collector(self, collector):
+        """注册抓取时调用的采集函数，返回[(名称, 类型, 说明, [(标签字典, 值)])]"""
+        self._collectors.append(collector)
+
+    def reset(self):
+        """清空所有累计值（测试用）"""
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(_label_key(labels))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# HTTP
+http_requests_in_flight = registry.gauge("wenxi_http_requests_in_flight", "正在处理的HTTP请求数（含响应体发送）")
+http_requests_total = registry.counter("wenxi_http_requests_total", "已完成的HTTP请求数")
+http_request_seconds = registry.histogram("wenxi_http_request_duration_seconds", "HTTP请求耗时（至响应体发送完毕）")
+
+# 传输
+transfer_bytes_total = registry.counter("wenxi_transfer_bytes_total", "上传接收/下载发送的明文字节数")
+transfer_seconds = registry.histogram("wenxi_transfer_duration_seconds", "单次上传/下载的传输耗时")
+transfer_throughput = registry.histogram("wenxi_transfer_throughput_mbps", "单次上传/下载的吞吐（MB/s）", THROUGHPUT_BUCKETS)
+stored_bytes_total = registry.counter("wenxi_stored_bytes_total", "上传实际写入磁盘的密文字节数（内容去重命中时为0）")
+
+# 计算
+crypto_seconds = registry.histogram("wenxi_crypto_duration_seconds", "每批加密/每块解密耗时")
+crypto_bytes_total = registry.counter("wenxi_crypto_bytes_total", "加密/解密的明文字节数")
+hash_seconds = registry.histogram("wenxi_hash_duration_seconds", "每批SHA256计算耗时")
+
+# 数据库
+db_query_seconds = registry.histogram("wenxi_db_query_duration_seconds", "数据库语句执行耗时")
+
+
+def record_transfer(direction: str, size: int, seconds: float):
+    """记录一次完整的上传或下载"""
+    transfer_bytes_total.inc(size, direction=direction)
+    transfer_seconds.observe(seconds, direction=direction)
+    if seconds > 0 and size:
+        transfer_throughput.observe(size / seconds / 1024 / 1024, direction=direction)
+
+
+def metered(iterator, direction: str = "download"):
+    """包装响应体迭代器，发送结束（含客户端中断）时记录字节数与耗时"""
+    start = time.perf_counter()
+    sent = 0
+    try:
+        for chunk in iterator:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        seconds = time.perf_counter() - start
+        record_transfer(direction, sent, seconds)
+        record_span("stream", seconds)
+
+
+def average_throughput(direction: str) -> float:
+    """累计字节数 / 累计耗时，单位MB/s"""
+    seconds = transfer_seconds.summary(direction=direction)["sum"]
+    size = transfer_bytes_total.value(direction=direction)
+    return size / seconds / 1024 / 1024 if seconds > 0 else 0.0
+
+
+def instrument_engine(sync_engine):
+    """为同步引擎（或异步引擎的sync_engine）挂载语句计时"""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("wenxi_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("wenxi_query_start")
+        if starts:
+            seconds = time.perf_counter() - starts.pop()
+            db_query_seconds.observe(seconds)
+            record_span("sql", seconds)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def drop_timer(context):
+        starts = context.connection.info.get("wenxi_query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def cache_stats() -> Dict[str, dict]:
+    """收集各级缓存的命中统计"""
+    from utils.cache import get_cache
+    from utils.encryption import get_key_cache_stats
+    from utils.file_meta import file_meta_stats
+    from utils.identity_cache import cache_stats as identity_cache_stats
+
+    identity = identity_cache_stats()
+    return {
+        "file_meta": file_meta_stats(),
+        "identity_user": identity["user"],
+        "identity_file": identity["file"],
+        "backend": get_cache().stats(),
+        "key": get_key_cache_stats()
+    }
+
+
+def overall_hit_rate(stats: Dict[str, dict]) -> float:
+    """请求路径上各级记录缓存（元数据、用户、文件）的合计命中率"""
+    hits = sum(stats[name]["hits"] for name in ("file_meta", "identity_user", "identity_file"))
+    misses = sum(stats[name]["misses"] for name in ("file_meta", "identity_user", "identity_file"))
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+def _collect_caches():
+    stats = cache_stats()
+    hits = [({"cache": name}, values["hits"]) for name, values in stats.items() if "hits" in values]
+    misses = [({"cache": name}, values["misses"]) for name, values in stats.items() if "misses" in values]
+    return [
+        ("wenxi_cache_hits_total", "counter", "缓存命中次数", hits),
+        ("wenxi_cache_misses_total", "counter", "缓存未命中次数", misses),
+    ]
+
+
+registry.add_collector(_collect_caches)
+
+
+def _route_label(scope) -> str:
+    """
+    路由模板（如/api/files/download/{file_id}），标签数量不随id增长
+    部分FastAPI版本中被include的路由只记录前缀之后的模板，前缀从实际路径中补回
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    path = scope.get("path", "")
+    try:
+        concrete = route.path_format.format(**scope.get("path_params", {}))
+    except (AttributeError, KeyError, IndexError, ValueError):
+        return template
+    return path[:len(path) - len(concrete)] + template if path.endswith(concrete) else template
+
+
+class MetricsMiddleware:
+    """
+    ASGI中间件：统计进行中的请求、状态码与耗时
+    在响应体发送完毕后才计数结束，流式下载的整个传输过程都计入进行中
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            path = _route_label(scope)
+            http_requests_total.inc(method=scope["method"], route=path, status=status)
+            http_request_seconds.observe(time.perf_counter() - start, method=scope["method"], route=path)
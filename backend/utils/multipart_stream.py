@@ -0,0 +1,123 @@
+"""
+Wenxi网盘 - 流式表单解析工具
+作者：Wenxi
+功能：增量解析multipart/form-data请求体，文件字段数据直接交给调用方处理，不经过磁盘临时文件
+"""
+
+from typing import Dict, Optional
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.multipart import parse_options_header
+
+
+MAX_FIELD_SIZE = 64 * 1024  # 普通表单字段上限，防止描述字段占用过多内存
+
+
+class StreamingFormParser:
+    """
+    Wenxi流式表单解析器
+    普通字段保存在内存中，指定文件字段的数据通过feed()的返回值逐段交付
+
+    用法:
+        parser = StreamingFormParser(request.headers["content-type"])
+        async for body_chunk in request.stream():
+            data = parser.feed(body_chunk)  # 本段请求体中属于文件字段的字节
+        parser.finish()
+    """
+
+    def __init__(self, content_type: str, file_field: str = "file"):
+        media_type, params = parse_options_header(content_type or "")
+        boundary = params.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise ValueError("请求必须为multipart/form-data格式")
+
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+
+        self._file_data = bytearray()
+        self._field_data = bytearray()
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part_name: Optional[str] = None
+        self._in_file = False
+
+        self._parser = multipart.MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._field_data = bytearray()
+        self._part_name = None
+        self._in_file = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._part_name = options.get(b"name", b"").decode("utf-8", "replace")
+        if self._part_name == self.file_field and b"filename" in options:
+            if self.filename is not None:
+                raise ValueError(f"表单字段重复: {self.file_field}")
+            self._in_file = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            content_type = self._headers.get(b"content-type")
+            self.content_type = content_type.decode("latin-1") if content_type else None
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._file_data += data[start:end]
+        else:
+            self._field_data += data[start:end]
+            if len(self._field_data) > MAX_FIELD_SIZE:
+                raise ValueError(f"表单字段过大: {self._part_name}")
+
+    def _on_part_end(self):
+        if not self._in_file and self._part_name:
+            self.fields[self._part_name] = self._field_data.decode("utf-8", "replace")
+        self._in_file = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        """
+        输入一段请求体
+
+        返回:
+            本段中属于文件字段的数据（可能为空）
+        """
+        self._parser.write(chunk)
+        if not self._file_data:
+            return b""
+        data = bytes(self._file_data)
+        self._file_data.clear()
+        return data
+
+    def finish(self) -> bytes:
+        """结束解析，返回残留的文件数据"""
+        self._parser.finalize()
+        data = bytes(self._file_data)
+        self._file_data.clear()
+        if self.filename is None:
+            raise ValueError(f"缺少文件字段: {self.file_field}")
+        return data
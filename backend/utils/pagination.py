@@ -0,0 +1,102 @@
+"""
+Wenxi网盘 - 文件列表键集分页
+作者：Wenxi
+功能：按(排序列, id)定位下一页，配合(owner_id, 排序列, id)复合索引，翻到任意深度都只扫描一页数据
+说明：游标是不透明的base64url字符串，记录排序方式和上一页最后一行的排序值与id
+"""
+
+import json
+import base64
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import Select, tuple_
+
+from models import File as FileModel
+
+# 可排序字段 -> 模型列，每个都有对应的复合索引
+SORT_COLUMNS = {
+    "created_at": FileModel.created_at,
+    "name": FileModel.original_filename,
+    "size": FileModel.file_size,
+}
+
+# 按搜索相关度排序，排序值由调用方以表达式传入，行中的键名为rank
+RELEVANCE = "relevance"
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+class CursorError(ValueError):
+    """游标无效或与当前排序方式不匹配"""
+
+
+def encode_cursor(sort: str, order: str, value: Any, row_id: int) -> str:
+    """
+    生成下一页游标
+
+    参数:
+        sort: 排序字段名
+        order: asc 或 desc
+        value: 上一页最后一行的排序值
+        row_id: 上一页最后一行的id
+    """
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, order, value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, int]:
+    """
+    解析游标，返回(排序值, id)
+
+    异常:
+        CursorError: 游标格式错误，或生成游标时的排序方式与本次请求不同
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_order, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if sort == "created_at":
+            value = datetime.fromisoformat(value)
+        row_id = int(row_id)
+    except (ValueError, TypeError):
+        raise CursorError("无效的分页游标")
+    if (cursor_sort, cursor_order) != (sort, order):
+        raise CursorError("分页游标与排序方式不匹配")
+    return value, row_id
+
+
+def apply_keyset(query: Select, sort: str, order: str, cursor: Optional[str], limit: int, column=None) -> Select:
+    """
+    为查询追加排序、游标条件和条数限制
+
+    多取一行用于判断是否还有下一页，调用方用page_with_cursor截断
+    column: 按相关度排序时传入相关度表达式，其余排序使用SORT_COLUMNS中的列
+    """
+    if column is None:
+        column = SORT_COLUMNS[sort]
+    key = tuple_(column, FileModel.id)
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort, order)
+        query = query.where(key < tuple_(value, row_id) if order == "desc" else key > tuple_(value, row_id))
+    if order == "desc":
+        query = query.order_by(column.desc(), FileModel.id.desc())
+    else:
+        query = query.order_by(column.asc(), FileModel.id.asc())
+    return query.limit(limit + 1)
+
+
+def page_with_cursor(rows: list, sort: str, order: str, limit: int) -> Tuple[list, Optional[str]]:
+    """
+    截取一页数据并生成下一页游标，没有更多数据时游标为None
+
+    rows中的每一行需包含id和排序列对应的键（相关度排序为rank）
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last: Dict[str, Any] = rows[-1]
+    key = "rank" if sort == RELEVANCE else SORT_COLUMNS[sort].key
+    return rows, encode_cursor(sort, order, last[key], last["id"])
@@ -0,0 +1,107 @@
+"""
+Wenxi网盘 - 密码哈希线程池
+作者：Wenxi
+功能：bcrypt哈希与校验在独立的有界线程池中执行，事件循环不再被登录/注册阻塞
+特点：排队数超过上限时立即拒绝（路由返回503），低于当前成本的旧哈希在登录成功后透明升级
+环境变量：
+    WENXI_HASH_WORKERS      哈希线程数（默认2，bcrypt计算时释放GIL）
+    WENXI_HASH_QUEUE_LIMIT  执行中+排队中的哈希任务上限（默认64）
+    WENXI_BCRYPT_ROUNDS     bcrypt成本因子（默认12）
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from logger import logger
+from utils.tracing import span
+
+HASH_WORKERS = max(1, int(os.environ.get("WENXI_HASH_WORKERS", "2")))
+HASH_QUEUE_LIMIT = max(1, int(os.environ.get("WENXI_HASH_QUEUE_LIMIT", "64")))
+BCRYPT_ROUNDS = int(os.environ.get("WENXI_BCRYPT_ROUNDS", "12"))
+
+
+class HashPoolBusy(RuntimeError):
+    """哈希任务排队已满"""
+
+
+class PasswordHasher:
+    """
+    Wenxi密码哈希器 - 有界线程池 + 排队深度限制
+    min_rounds与default_rounds相同，只有成本低于当前配置的哈希才会被判定需要升级
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto",
+            bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.pending = 0
+        self.rejected = 0
+        self.upgraded = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """延迟创建线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="wenxi-hash")
+        return self._executor
+
+    async def _run(self, func, *args):
+        """在线程池中执行，排队已满时抛出HashPoolBusy"""
+        if self.pending >= self.queue_limit:
+            self.rejected += 1
+            raise HashPoolBusy("密码哈希繁忙")
+        self.pending += 1
+        try:
+            with span("bcrypt"):  # 含排队等待
+                return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """生成密码哈希"""
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """校验密码"""
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        校验密码，哈希成本低于当前配置时同时返回按当前成本重新生成的哈希
+
+        返回:
+            (是否通过, 新哈希或None)
+        """
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed_password)
+        if valid and new_hash:
+            self.upgraded += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        """关闭线程池（应用关闭时调用）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Wenxi - 密码哈希线程池已关闭")
+
+    def stats(self) -> dict:
+        """获取排队与拒绝统计"""
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "upgraded": self.upgraded
+        }
+
+
+# 全局密码哈希器
+password_hasher = PasswordHasher()
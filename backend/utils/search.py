@@ -0,0 +1,127 @@
+"""
+Wenxi网盘 - 文件名/描述全文检索
+作者：Wenxi
+功能：SQLite下维护files_fts（FTS5 trigram分词）索引，按子串匹配文件名和描述并用bm25排序
+说明：trigram按字符切分，中日韩文件名无需分词即可检索；索引由触发器随files表的增删改同步，
+      任何写入路径（上传、秒传、合并、重命名、删除）都不需要额外维护。
+      少于3个字符的词无法使用trigram索引，回退为当前用户范围内的LIKE匹配；
+      其他数据库和不支持trigram的旧版SQLite整体回退为ILIKE
+"""
+
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Select, and_, column, func, literal_column, or_, table, text
+
+from logger import logger
+from models import File as FileModel
+
+FTS_TABLE = "files_fts"
+MIN_TRIGRAM_LENGTH = 3
+
+# bm25列权重：文件名命中比描述命中更相关
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+files_fts = table(FTS_TABLE, column("rowid"))
+
+# 由ensure_search_index在启动时设置
+fts_enabled = False
+
+FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        original_filename, description, content='files', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, original_filename, description)
+        VALUES (new.id, new.original_filename, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_filename, description)
+        VALUES ('delete', old.id, old.original_filename, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF original_filename, description ON files BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, original_filename, description)
+        VALUES ('delete', old.id, old.original_filename, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, original_filename, description)
+        VALUES (new.id, new.original_filename, new.description);
+    END""",
+]
+
+
+def ensure_search_index(engine) -> bool:
+    """
+    Wenxi - 创建全文索引和同步触发器，首次创建时从files表重建索引
+
+    返回:
+        是否启用了FTS检索
+    """
+    global fts_enabled
+    if engine.dialect.name != "sqlite":
+        fts_enabled = False
+        return False
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+            ).first()
+            for statement in FTS_DDL:
+                conn.execute(text(statement))
+            if not exists:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+                logger.info("Wenxi - 已创建文件全文索引")
+        fts_enabled = True
+    except Exception as e:
+        logger.warning(f"Wenxi - 当前SQLite不支持FTS5 trigram，搜索回退为LIKE: {e}")
+        fts_enabled = False
+    return fts_enabled
+
+
+def split_terms(search: str) -> Tuple[List[str], List[str]]:
+    """
+    拆分搜索词，返回(可走索引的词, 需要LIKE匹配的短词)
+
+    结尾的*表示前缀查询；trigram本身按子串匹配，前缀自然包含在内
+    """
+    indexed, short = [], []
+    for term in search.split():
+        term = term.rstrip("*")
+        if not term:
+            continue
+        (indexed if len(term) >= MIN_TRIGRAM_LENGTH else short).append(term)
+    return indexed, short
+
+
+def match_expression(terms: List[str]) -> str:
+    """把词转换为FTS5查询：每个词作为短语（转义双引号），多个词之间为AND"""
+    return " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def like_condition(term: str):
+    """文件名或描述包含该词（忽略大小写）"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"%{escaped}%"
+    return or_(
+        FileModel.original_filename.ilike(pattern, escape="\\"),
+        FileModel.description.ilike(pattern, escape="\\"),
+    )
+
+
+def apply_search(query: Select, search: str) -> Tuple[Select, Optional[object]]:
+    """
+    为列表查询追加搜索条件
+
+    返回:
+        (查询, 相关度表达式)。相关度越大越相关；未使用全文索引时为None
+    """
+    indexed, short = split_terms(search)
+    conditions = [like_condition(term) for term in short]
+    rank = None
+    if fts_enabled and indexed:
+        query = query.join(files_fts, files_fts.c.rowid == FileModel.id)
+        conditions.append(literal_column(FTS_TABLE).op("MATCH")(match_expression(indexed)))
+        rank = -func.bm25(literal_column(FTS_TABLE), NAME_WEIGHT, DESCRIPTION_WEIGHT)
+    else:
+        conditions.extend(like_condition(term) for term in indexed)
+    if conditions:
+        query = query.where(and_(*conditions))
+    return query, rank
@@ -0,0 +1,193 @@
+"""
+Wenxi网盘 - 请求分阶段计时
+作者：Wenxi
+功能：在一次请求内累计各阶段（接收、哈希、加密、SQL、提交、解密等）的耗时，
+      以Server-Timing响应头返回，并可按行写入本地JSON追踪文件
+说明：当前请求的Trace保存在contextvar中，同一请求的协程、SQLAlchemy的greenlet和Starlette的线程池迭代都能看到；
+      asyncio的run_in_executor不会复制上下文，提交到线程池的函数用bind_context包装。
+      同名阶段累加耗时并计数；上传流水线中接收与加密并行，各阶段之和可以大于总耗时。
+      响应头在响应体之前发送，下载的解密/发送阶段只出现在追踪文件中。
+      响应头会把耗时暴露给任意客户端，默认关闭；/api/auth/下的响应从不附加，
+      bcrypt阶段也从不写入响应头（有无该阶段可区分用户名是否存在），只记入追踪文件
+环境变量：
+    WENXI_SERVER_TIMING     是否返回Server-Timing响应头（默认0，仅调试时开启）
+    WENXI_TRACE_FILE        追踪文件路径，每个请求一行JSON（默认不写）
+    WENXI_TRACE_MIN_MS      只写入总耗时不低于该值的请求（毫秒，默认0）
+"""
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from typing import Dict, List, Optional
+
+SERVER_TIMING = os.environ.get("WENXI_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+TRACE_FILE = os.environ.get("WENXI_TRACE_FILE") or None
+TRACE_MIN_MS = float(os.environ.get("WENXI_TRACE_MIN_MS", "0"))
+PRIVATE_SPANS = frozenset({"bcrypt"})  # 只写入追踪文件、不返回给客户端的阶段
+PRIVATE_PATH_PREFIXES = ("/api/auth/",)  # 不附加Server-Timing的路径（未登录即可访问，耗时可用于枚举账号）
+
+
+class Trace:
+    """一次请求的阶段耗时：阶段名 -> [累计秒数, 次数]，按首次出现的顺序排列"""
+
+    __slots__ = ("start", "spans", "_lock")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                self.spans[name] = [seconds, 1]
+            else:
+                entry[0] += seconds
+                entry[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        """Server-Timing头的值，耗时单位为毫秒，不含PRIVATE_SPANS"""
+        with self._lock:
+            items = list(self.spans.items())
+        parts = []
+        for name, (seconds, count) in items:
+            if name in PRIVATE_SPANS:
+                continue
+            desc = f';desc="{count}x"' if count > 1 else ""
+            parts.append(f"{name}{desc};dur={seconds * 1000:.2f}")
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(parts)
+
+    def to_record(self, **fields) -> dict:
+        with self._lock:
+            spans = {name: {"ms": round(seconds * 1000, 3), "count": count}
+                     for name, (seconds, count) in self.spans.items()}
+        return {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            **fields,
+            "total_ms": round(self.elapsed() * 1000, 3),
+            "spans": spans
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("wenxi_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def record_span(name: str, seconds: float):
+    """把一段已测得的耗时计入当前请求（不在请求中时忽略）"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """计时一段代码并计入当前请求"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+
+async def timed_iter(iterator, name: str):
+    """包装异步迭代器，把每次等待下一项的时间计为name阶段（如等待客户端上传数据）"""
+    iterator = iterator.__aiter__()
+    while True:
+        start = time.perf_counter()
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            record_span(name, time.perf_counter() - start)
+            return
+        record_span(name, time.perf_counter() - start)
+        yield item
+
+
+def bind_context(func):
+    """让提交到run_in_executor的函数在当前上下文中执行，其中的span计入当前请求"""
+    return partial(contextvars.copy_context().run, func)
+
+
+class TraceWriter:
+    """追加写入追踪文件，文件在首次写入时打开"""
+
+    def __init__(self, path: Optional[str] = TRACE_FILE, min_ms: float = TRACE_MIN_MS):
+        self.path = path
+        self.min_ms = min_ms
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        if not self.path or record["total_ms"] < self.min_ms:
+            return
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+trace_writer = TraceWriter()
+
+
+class TracingMiddleware:
+    """
+    ASGI中间件：为每个HTTP请求创建Trace，发送响应头时附加Server-Timing，
+    响应体发送完毕后把完整记录（含下载解密/发送阶段）写入追踪文件
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING, writer: TraceWriter = trace_writer):
+        self.app = app
+        self.server_timing = server_timing
+        self.writer = writer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.server_timing or self.writer.path):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _current.set(trace)
+        status = 500
+        server_timing = self.server_timing and not scope.get("path", "").startswith(PRIVATE_PATH_PREFIXES)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if self.writer.path:
+                self.writer.write(trace.to_record(method=scope["method"], path=scope.get("path", ""), status=status))
@@ -0,0 +1,717 @@
+"""
+Wenxi网盘 - 断点续传上传会话
+作者：Wenxi
+功能：服务器签发上传会话ID，会话记录（预期大小、分块大小、已接收分块、过期时间）保存在数据库，
+      分块可乱序、并行上传，服务重启或客户端中断后查询会话即可只补传缺失的分块
+说明：
+    - 会话按用户隔离，其他用户的会话一律视为不存在
+    - 创建会话时在temp_chunks/{会话ID}/data预分配完整的v3密文文件（posix_fallocate，不支持时为稀疏文件），
+      文件头与尾部块索引只取决于大小和块大小，创建时即写好
+    - 分块边到达边交给加密引擎按块并行加密，密文按块序号写到最终偏移；完成时数据文件就是最终密文，
+      直接改名到存储目录，不再合并或加密，耗时与文件大小无关
+    - 加密时顺带算出每个加密块的Merkle叶子哈希，按块序号写入temp_chunks/{会话ID}/leaves，
+      完成时直接组成该文件的Merkle树，不再读取数据
+    - 分块收齐并核对大小与SHA256后才加密，写完并落盘（fdatasync）后才记录为已接收；
+      中途断开或校验失败的分块不写入密文，重传时写入同一区域；加密块的nonce由块序号决定，
+      已写入过密文的块只接受相同内容（按叶子哈希比对），避免同一nonce加密两份不同明文；
+      已接收的分块不再覆盖，同一分块同时只允许一个请求写入（lockf跨进程生效）
+    - 整个文件的SHA256随分块到达按顺序累积：轮到的分块边接收边计入，乱序到达的分块在内存上限内暂存明文，
+      其余分块轮到时以大块读取数据文件解密计入（线程池中执行）；暂存明文每个会话与整个进程各有上限，
+      超出时不再暂存，改为轮到时从数据文件补算。哈希进度保存在本进程内，
+      服务重启或分块落在其他工作进程时由完成请求补算缺少的部分；超过会话有效期未再收到分块的进度
+      （会话已过期或已在其他进程中完成、放弃）在清理过期会话时一并丢弃
+    - 已接收分块记为数据库中的位图（每个分块1位），查询状态只读一行，按版本号做乐观并发更新，
+      多个请求（或多个工作进程）同时完成分块也不会丢失记录；状态以缺失区间返回
+环境变量：
+    WENXI_UPLOAD_SESSION_TTL   会话有效期（秒，默认86400），每收到一个分块顺延
+    WENXI_UPLOAD_CHUNK_SIZE    客户端未指定时的分块大小（字节，默认16MB）
+    WENXI_MAX_UPLOAD_SIZE      单个会话允许声明的最大文件大小（字节，默认10GB）
+    WENXI_UPLOAD_HASH_MEMORY   本进程所有会话暂存乱序分块明文的合计上限（字节，默认256MB）
+"""
+
+import os
+import re
+import time
+import uuid
+import shutil
+import asyncio
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：只在进程内互斥
+    fcntl = None
+
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from logger import logger
+from models import UploadSession
+from utils.crypto_engine import crypto_engine
+from utils.encryption import (
+    ChunkLayout, TAG_SIZE, V3_CHUNK_SIZE, build_v3_header, build_v3_index, new_v3_layout
+)
+from utils.file_paths import ensure_directory_exists, get_temp_chunks_path
+from utils.merkle import HASH_SIZE, leaf_hash
+
+SESSION_TTL = float(os.environ.get("WENXI_UPLOAD_SESSION_TTL", "86400"))
+DEFAULT_CHUNK_SIZE = int(os.environ.get("WENXI_UPLOAD_CHUNK_SIZE", str(16 * 1024 * 1024)))
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.environ.get("WENXI_MAX_UPLOAD_SIZE", str(10 * 1024 * 1024 * 1024)))
+WRITE_BUFFER_SIZE = 1024 * 1024  # 分块内容攒够该大小（向下取整到加密块）后哈希并提交加密一次
+READ_BUFFER_SIZE = 4 * 1024 * 1024  # 从数据文件补算哈希时每次读取的密文量
+HASH_PENDING_LIMIT = 64 * 1024 * 1024  # 每个会话暂存的乱序分块明文上限
+HASH_PENDING_TOTAL = int(os.environ.get("WENXI_UPLOAD_HASH_MEMORY", str(256 * 1024 * 1024)))
+UPDATE_RETRIES = 50  # 乐观更新冲突时的重试次数
+PURGE_BATCH = 100  # 每次清理的过期会话上限
+
+
+class PartError(ValueError):
+    """分块序号、大小或校验和不合法"""
+
+
+class FileTooLarge(ValueError):
+    """声明的文件大小超过WENXI_MAX_UPLOAD_SIZE"""
+
+
+class InsufficientStorage(OSError):
+    """剩余磁盘空间不足以预分配数据文件"""
+
+
+class PartBusy(Exception):
+    """同一分块正由另一个请求写入"""
+
+
+def utcnow() -> datetime:
+    """不带时区的UTC时间，与数据库中读出的DateTime可直接比较"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# === 分块位图 ===
+
+def set_bit(bitmap: bytes, index: int) -> bytes:
+    """置位第index个分块（低位在前），位图不够长时补零"""
+    buffer = bytearray(bitmap)
+    if len(buffer) <= index >> 3:
+        buffer.extend(bytes((index >> 3) + 1 - len(buffer)))
+    buffer[index >> 3] |= 1 << (index & 7)
+    return bytes(buffer)
+
+
+def has_bit(bitmap: bytes, index: int) -> bool:
+    return len(bitmap) > index >> 3 and bool(bitmap[index >> 3] >> (index & 7) & 1)
+
+
+def count_bits(bitmap: bytes) -> int:
+    return int.from_bytes(bitmap, "little").bit_count()
+
+
+_INVERT = bytes(255 - byte for byte in range(256))
+_NOT_EMPTY = re.compile(b"[^\\x00]")
+_NOT_FULL = re.compile(b"[^\\xff]")
+
+
+def bit_ranges(bitmap: bytes, count: int, value: bool = True) -> List[List[int]]:
+    """
+    前count位中取值为value的连续区间，返回有序的半开区间列表[[start, end), ...]
+    按字节扫描：区间外的全0字节与区间内的全1字节整段跳过（正则在C中查找），只逐位检查0与1混合的字节
+    """
+    size = -(-count // 8)
+    data = bytearray(bitmap[:size].ljust(size, b"\0"))
+    if not value:
+        data = data.translate(_INVERT)
+    if count & 7:
+        data[-1] &= (1 << (count & 7)) - 1
+    ranges, start, index = [], None, 0
+    while True:
+        match = (_NOT_EMPTY if start is None else _NOT_FULL).search(data, index)
+        if match is None:
+            break
+        index = match.start()
+        byte = data[index]
+        for bit in range(8):
+            if byte >> bit & 1:
+                if start is None:
+                    start = index * 8 + bit
+            elif start is not None:
+                ranges.append([start, index * 8 + bit])
+                start = None
+        index += 1
+    if start is not None:
+        ranges.append([start, count])
+    return ranges
+
+
+# === 会话属性 ===
+
+def total_chunks(session: UploadSession) -> int:
+    return -(-session.file_size // session.chunk_size)
+
+
+def chunk_length(session: UploadSession, index: int) -> int:
+    """分块的明文字节数，最后一块为余下部分"""
+    return min(session.chunk_size, session.file_size - index * session.chunk_size)
+
+
+def received_count(session: UploadSession) -> int:
+    return count_bits(session.received)
+
+
+def received_bytes(session: UploadSession) -> int:
+    """已接收的字节数（最后一块可能较短）"""
+    total = received_count(session) * session.chunk_size
+    last = total_chunks(session) - 1
+    if last >= 0 and has_bit(session.received, last):
+        total -= session.chunk_size - chunk_length(session, last)
+    return total
+
+
+def missing_ranges(session: UploadSession) -> List[List[int]]:
+    """尚未接收的分块区间"""
+    return bit_ranges(session.received, total_chunks(session), value=False)
+
+
+def block_size_for(chunk_size: int) -> int:
+    """加密块大小：分块大小是默认块大小的整数倍时用默认值，否则一个分块就是一个加密块"""
+    return V3_CHUNK_SIZE if chunk_size % V3_CHUNK_SIZE == 0 else chunk_size
+
+
+def session_layout(session: UploadSession) -> ChunkLayout:
+    """按会话记录的盐值与块大小恢复数据文件的v3布局"""
+    return new_v3_layout(None, session.block_size, session.file_size, bytes.fromhex(session.file_salt))[0]
+
+
+def session_dir(session_id: str) -> str:
+    return os.path.join(get_temp_chunks_path(), session_id)
+
+
+def data_path(session_id: str) -> str:
+    """会话的数据文件（v3密文），各分块加密后按偏移写入"""
+    return os.path.join(session_dir(session_id), "data")
+
+
+def leaves_path(session_id: str) -> str:
+    """会话的叶子哈希文件，第i个加密块的叶子位于偏移i*32"""
+    return os.path.join(session_dir(session_id), "leaves")
+
+
+def required_space(layout: ChunkLayout) -> int:
+    """会话预分配的磁盘空间：密文、尾部块索引（每块12字节）与叶子哈希文件，另留1KB余量"""
+    return layout.chunks_end + layout.chunk_count * (12 + HASH_SIZE) + 1024
+
+
+def allocate_data_file(session_id: str, layout: ChunkLayout, file_salt: bytes) -> None:
+    """
+    创建数据文件并预分配完整密文大小，写好文件头与尾部块索引，同时创建叶子哈希文件，
+    磁盘空间不足在创建会话时即报错（在线程池中调用）
+    """
+    index = build_v3_index(layout)
+    size = layout.chunks_end + len(index)
+    os.makedirs(session_dir(session_id), exist_ok=True)
+    fd = os.open(data_path(session_id), os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+        write_at(fd, build_v3_header(layout, file_salt), 0)
+        write_at(fd, index, layout.chunks_end)
+    finally:
+        os.close(fd)
+    with open(leaves_path(session_id), 'wb') as leaves:
+        leaves.truncate(layout.chunk_count * HASH_SIZE)
+
+
+def write_at(fd: int, data: bytes, offset: int) -> None:
+    """在偏移处写入全部数据，不移动共享的文件位置（在线程池中调用）"""
+    if not hasattr(os, "pwrite"):
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+        return
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+def sync_file(path: str, writes: List[Tuple[bytes, int]] = ()) -> None:
+    """在各偏移处写入数据后把文件落盘（在线程池中调用）"""
+    fd = os.open(path, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+    try:
+        for data, offset in writes:
+            write_at(fd, data, offset)
+        getattr(os, "fdatasync", os.fsync)(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_part(session_id: str, leaves: List[Tuple[bytes, int]]) -> None:
+    """
+    把数据文件落盘，并写入分块各加密块的叶子哈希（在线程池中调用）；
+    本功能之前创建的会话没有叶子文件，跳过叶子，完成后由校验时补建Merkle树
+    """
+    sync_file(data_path(session_id))
+    if os.path.exists(leaves_path(session_id)):
+        sync_file(leaves_path(session_id), leaves)
+
+
+def read_leaves(session_id: str, block_count: int) -> Optional[bytes]:
+    """读取所有加密块的叶子哈希，没有叶子文件或大小不符时返回None（在线程池中调用）"""
+    try:
+        with open(leaves_path(session_id), 'rb') as infile:
+            data = infile.read()
+    except FileNotFoundError:
+        return None
+    return data if len(data) == block_count * HASH_SIZE else None
+
+
+# === 会话读写 ===
+
+async def create_session(db: AsyncSession, owner_id: int, file_name: str, file_size: int,
+                         chunk_size: Optional[int] = None, checksum: Optional[str] = None,
+                         mime_type: Optional[str] = None, description: Optional[str] = None) -> UploadSession:
+    """
+    创建上传会话，顺带清理一批过期会话
+
+    异常:
+        FileTooLarge: 大小超过WENXI_MAX_UPLOAD_SIZE
+        ValueError: 大小或分块大小不合法
+        InsufficientStorage: 剩余磁盘空间不足
+        OSError: 无法预分配数据文件
+    """
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    if file_size < 0:
+        raise ValueError("文件大小不能为负数")
+    if file_size > MAX_UPLOAD_SIZE:
+        raise FileTooLarge(f"文件大小超过上限{MAX_UPLOAD_SIZE}字节")
+    if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+        raise ValueError(f"分块大小必须在{MIN_CHUNK_SIZE}到{MAX_CHUNK_SIZE}字节之间")
+    if checksum is not None and len(checksum) != 64:
+        raise ValueError("文件哈希必须是SHA256十六进制")
+
+    await purge_expired_sessions(db)
+    session_id = uuid.uuid4().hex
+    layout, file_salt = new_v3_layout(None, block_size_for(chunk_size), file_size)
+    # 先按剩余空间拒绝，不让超大声明触发预分配与块索引构建
+    free = shutil.disk_usage(ensure_directory_exists(get_temp_chunks_path())).free
+    if required_space(layout) > free:
+        raise InsufficientStorage(f"磁盘空间不足: 需要{required_space(layout)}字节，剩余{free}字节")
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, allocate_data_file, session_id, layout, file_salt)
+    except OSError:
+        remove_session_files(session_id)
+        raise
+    session = UploadSession(
+        id=session_id,
+        owner_id=owner_id,
+        file_name=file_name,
+        file_size=file_size,
+        chunk_size=chunk_size,
+        mime_type=mime_type,
+        description=description,
+        checksum=checksum.lower() if checksum else None,
+        file_salt=file_salt.hex(),
+        block_size=layout.chunk_size,
+        received=bytes((-(-file_size // chunk_size) + 7) // 8),  # 全零位图
+        version=0,
+        expires_at=utcnow() + timedelta(seconds=SESSION_TTL)
+    )
+    db.add(session)
+    await db.commit()
+    logger.info(f"Wenxi - 创建上传会话: {session.id} ({file_name}, {file_size} bytes, 分块{chunk_size})")
+    return session
+
+
+async def get_session(db: AsyncSession, session_id: str, owner_id: int) -> Optional[UploadSession]:
+    """读取属于该用户且未过期的会话，否则返回None（旧版本创建的明文会话没有盐值，同样视为不存在）"""
+    session = await db.scalar(
+        select(UploadSession).where(UploadSession.id == session_id).execution_options(populate_existing=True)
+    )
+    if (session is None or session.owner_id != owner_id or session.expires_at <= utcnow()
+            or session.file_salt is None):
+        return None
+    return session
+
+
+def update_hashers(hashers: list, data: bytes) -> None:
+    for hasher in hashers:
+        hasher.update(data)
+
+
+async def write_part(session: UploadSession, index: int, chunks: AsyncIterator[bytes],
+                     expected_hash: Optional[str] = None, file_hasher=None,
+                     pieces: Optional[list] = None) -> int:
+    """
+    接收一个分块，大小与校验和都核对无误后再按加密块提交给加密引擎并行加密，
+    密文写入数据文件对应偏移，全部写完落盘后返回
+
+    同一加密块的密钥与nonce固定，不同明文绝不能写入同一块：分块在内存中收齐（不超过分块大小）并校验后才加密，
+    中途失败的请求不写入任何密文；已写入过的块重传时内容必须与记录的叶子哈希一致
+
+    参数:
+        chunks: 分块内容的异步迭代器（请求体）
+        expected_hash: 客户端提供的分块SHA256，提供时校验
+        file_hasher: 整个文件的哈希（可选），分块内容按顺序计入，分块无效时调用方应丢弃
+        pieces: 列表（可选），追加分块明文以便稍后计入整体哈希
+
+    返回:
+        分块字节数
+
+    异常:
+        PartError: 序号越界、大小不符、校验失败或与已写入的内容不同（调用方不应记录该分块）
+        FileNotFoundError: 数据文件已不存在
+    """
+    if not 0 <= index < total_chunks(session):
+        raise PartError(f"分块序号超出范围: {index}")
+    expected = chunk_length(session, index)
+    path = data_path(session.id)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    layout = session_layout(session)
+    block = layout.chunk_size
+    flush_size = block * max(1, WRITE_BUFFER_SIZE // block)
+    first_block = index * session.chunk_size // block
+    part_hasher = hashlib.sha256() if expected_hash else None
+    hashers = [hasher for hasher in (part_hasher, file_hasher) if hasher is not None]
+    loop = asyncio.get_running_loop()
+    buffer = bytearray()
+    batches = []
+    size = 0
+
+    async def take(data: bytes) -> None:
+        # 哈希在线程池中按顺序执行，与接收后续数据并行
+        if hashers:
+            await loop.run_in_executor(None, update_hashers, hashers, data)
+        batches.append(data)
+
+    async for data in chunks:
+        size += len(data)
+        if size > expected:
+            raise PartError(f"分块{index}超过应有大小{expected}字节")
+        buffer += data
+        while len(buffer) >= flush_size:
+            await take(bytes(buffer[:flush_size]))
+            del buffer[:flush_size]
+    if size != expected:
+        raise PartError(f"分块{index}大小不符: 应为{expected}字节，收到{size}字节")
+    if buffer:
+        await take(bytes(buffer))
+    if part_hasher is not None and part_hasher.hexdigest() != expected_hash.lower():
+        raise PartError(f"分块{index}校验失败")
+    if not await loop.run_in_executor(None, part_unchanged, session.id, first_block, block, batches):
+        raise PartError(f"分块{index}此前已写入不同内容")
+    if pieces is not None:
+        pieces.extend(batches)
+
+    starts, tasks = [], []
+    for data in batches:
+        starts.append(first_block)
+        tasks.append(asyncio.ensure_future(crypto_engine.encrypt_blocks(path, layout, first_block, data)))
+        first_block += -(-len(data) // block)
+    try:
+        if tasks:
+            await asyncio.wait(tasks)
+    finally:
+        # 请求被取消时也等已提交的加密写完，避免与重传的同一分块交错写入；
+        # 部分块失败时写完的块照样记下叶子，重传不同内容时据此拒绝
+        if tasks:
+            await asyncio.wait(tasks)
+        leaves = [(task.result(), start * HASH_SIZE) for start, task in zip(starts, tasks)
+                  if not task.cancelled() and task.exception() is None]
+        await loop.run_in_executor(None, sync_part, session.id, leaves)
+    for task in tasks:
+        task.result()
+    return size
+
+
+def part_unchanged(session_id: str, first_block: int, block_size: int, batches: List[bytes]) -> bool:
+    """
+    分块覆盖的加密块此前未写入（叶子全为0），或写入的明文与本次相同时返回True（在线程池中调用）；
+    本功能之前创建的会话没有叶子文件，无从比对，返回True
+    """
+    block_count = sum(-(-len(data) // block_size) for data in batches)
+    try:
+        with open(leaves_path(session_id), 'rb') as infile:
+            infile.seek(first_block * HASH_SIZE)
+            stored = infile.read(block_count * HASH_SIZE)
+    except FileNotFoundError:
+        return True
+    if not stored.strip(b"\0"):
+        return True
+    return stored == b"".join(
+        leaf_hash(data[offset:offset + block_size])
+        for data in batches for offset in range(0, len(data), block_size)
+    )
+
+
+async def update_received(db: AsyncSession, session_id: str, change) -> bytes:
+    """
+    乐观并发更新已接收位图并顺延过期时间：读取版本号，按版本号条件更新，冲突时重读重试
+
+    参数:
+        change: 旧位图 -> 新位图
+    """
+    for _ in range(UPDATE_RETRIES):
+        row = (await db.execute(
+            select(UploadSession.received, UploadSession.version).where(UploadSession.id == session_id)
+        )).one_or_none()
+        if row is None:
+            await db.rollback()
+            raise LookupError(f"上传会话不存在: {session_id}")
+        bitmap = change(row.received)
+        result = await db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session_id, UploadSession.version == row.version)
+            .values(received=bitmap, version=row.version + 1,
+                    expires_at=utcnow() + timedelta(seconds=SESSION_TTL))
+        )
+        if result.rowcount == 1:
+            await db.commit()
+            return bitmap
+        await db.rollback()
+    raise RuntimeError(f"上传会话更新冲突过多: {session_id}")
+
+
+async def mark_received(db: AsyncSession, session_id: str, index: int) -> bytes:
+    """记录分块已接收，返回最新的已接收位图"""
+    return await update_received(db, session_id, lambda bitmap: set_bit(bitmap, index))
+
+
+# === 整体哈希 ===
+
+class HashState:
+    """本进程内的会话哈希进度：next_index之前的分块已按顺序计入hasher"""
+
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.next_index = 0
+        self.size = 0
+        self.pending: Dict[int, list] = {}  # 乱序到达、尚未轮到的分块明文
+        self.pending_bytes = 0
+        self.lock = asyncio.Lock()
+        self.touched = time.monotonic()  # 最近一次收到分块的时间
+
+
+class PendingBudget:
+    """本进程所有会话暂存明文的合计额度，先预留再接收分块"""
+
+    def __init__(self, limit: int = HASH_PENDING_TOTAL):
+        self.limit = limit
+        self.used = 0
+
+    def reserve(self, size: int) -> bool:
+        if self.used + size > self.limit:
+            return False
+        self.used += size
+        return True
+
+    def release(self, size: int) -> None:
+        self.used -= size
+
+
+hash_states: Dict[str, HashState] = {}
+pending_budget = PendingBudget()
+busy_parts = set()  # 本进程内正在写入的(会话ID, 分块序号)
+
+
+@contextmanager
+def part_lock(session_id: str, index: int):
+    """独占一个分块的写入，已被其他请求（含其他工作进程）占用时抛出PartBusy"""
+    key = (session_id, index)
+    if key in busy_parts:
+        raise PartBusy(f"分块{index}正在上传")
+    fd = os.open(os.path.join(session_dir(session_id), f"{index}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        # lockf记录锁不会被加密进程池fork出的子进程继承（flock会）；每个分块一个锁文件，
+        # 进程内由busy_parts保证同时只有一个请求打开它，关闭其他文件不会误释放
+        if fcntl is not None:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (BlockingIOError, PermissionError):
+                raise PartBusy(f"分块{index}正在上传")
+        busy_parts.add(key)
+        try:
+            yield
+        finally:
+            busy_parts.discard(key)
+    finally:
+        os.close(fd)
+
+
+def drop_hash_state(session_id: str) -> None:
+    """丢弃会话的哈希进度并归还暂存明文占用的额度"""
+    state = hash_states.pop(session_id, None)
+    if state is not None:
+        pending_budget.release(state.pending_bytes)
+        state.pending.clear()
+        state.pending_bytes = 0
+
+
+def evict_idle_hash_states() -> int:
+    """丢弃超过会话有效期未收到分块的进度（会话已过期，或已在其他进程中完成、放弃），返回丢弃数量"""
+    deadline = time.monotonic() - SESSION_TTL
+    idle = [session_id for session_id, state in hash_states.items()
+            if state.touched < deadline and not state.lock.locked()]
+    for session_id in idle:
+        drop_hash_state(session_id)
+    return len(idle)
+
+
+def hash_parts(session: UploadSession, hasher, start: int, end: int) -> int:
+    """以大块读取数据文件，解密分块[start, end)按顺序计入哈希，返回明文字节数（在线程池中调用）"""
+    layout = session_layout(session)
+    chacha = ChaCha20Poly1305(layout.key)
+    per_read = max(1, READ_BUFFER_SIZE // (layout.chunk_size + TAG_SIZE))
+    first = start * session.chunk_size // layout.chunk_size
+    last = -(-min(end * session.chunk_size, session.file_size) // layout.chunk_size)
+    size = 0
+    with open(data_path(session.id), "rb") as f:
+        f.seek(layout.chunk_offset(first))
+        for batch in range(first, last, per_read):
+            count = min(per_read, last - batch)
+            stop = layout.chunk_offset(batch + count) if batch + count < layout.chunk_count else layout.chunks_end
+            with memoryview(f.read(stop - layout.chunk_offset(batch))) as view:
+                offset = 0
+                for block in range(batch, batch + count):
+                    length = layout.plain_length(block) + TAG_SIZE
+                    data = layout.decrypt_chunk(chacha, block, view[offset:offset + length])
+                    hasher.update(data)
+                    size += len(data)
+                    offset += length
+    return size
+
+
+async def advance_hash(session: UploadSession, state: HashState, bitmap: bytes) -> None:
+    """把已接收且轮到的分块计入整体哈希：优先用暂存的明文，否则从数据文件补算（调用方持有state.lock）"""
+    loop = asyncio.get_running_loop()
+    total = total_chunks(session)
+    while state.next_index < total and has_bit(bitmap, state.next_index):
+        pieces = state.pending.pop(state.next_index, None)
+        if pieces is not None:
+            size = sum(len(data) for data in pieces)
+            state.pending_bytes -= size
+            pending_budget.release(size)
+            for data in pieces:
+                await loop.run_in_executor(None, state.hasher.update, data)
+            end = state.next_index + 1
+        else:
+            end = state.next_index + 1
+            while end < total and has_bit(bitmap, end) and end not in state.pending:
+                end += 1
+            size = await loop.run_in_executor(None, hash_parts, session, state.hasher, state.next_index, end)
+        state.next_index = end
+        state.size += size
+
+
+async def receive_part(db: AsyncSession, session: UploadSession, index: int, chunks: AsyncIterator[bytes],
+                       expected_hash: Optional[str] = None) -> Tuple[int, bytes]:
+    """
+    接收并记录一个分块，顺带推进整个文件的SHA256
+    已接收的分块可能已计入哈希，不再覆盖，直接返回
+
+    返回:
+        (分块字节数, 最新的已接收位图)
+
+    异常:
+        PartError / FileNotFoundError: 同write_part
+        PartBusy: 同一分块正由另一个请求写入
+        LookupError: 会话已不存在
+    """
+    if not 0 <= index < total_chunks(session):
+        raise PartError(f"分块序号超出范围: {index}")
+    if session in db:
+        db.expunge(session)  # 更新冲突回滚时会话对象不随之过期
+    state = hash_states.setdefault(session.id, HashState())
+    state.touched = time.monotonic()
+    with part_lock(session.id, index):
+        bitmap = await db.scalar(select(UploadSession.received).where(UploadSession.id == session.id))
+        await db.commit()
+        if bitmap is None:
+            drop_hash_state(session.id)
+            raise LookupError(f"上传会话不存在: {session.id}")
+        if has_bit(bitmap, index):
+            return chunk_length(session, index), bitmap
+
+        # 轮到的分块边接收边计入哈希副本，分块有效才替换；未轮到的分块在会话与进程额度内暂存明文
+        inline = state.next_index == index
+        candidate = state.hasher.copy() if inline else None
+        length = chunk_length(session, index)
+        keep = (not inline and state.pending_bytes + length <= HASH_PENDING_LIMIT
+                and pending_budget.reserve(length))
+        pieces = [] if keep else None
+        try:
+            size = await write_part(session, index, chunks, expected_hash, candidate, pieces)
+            bitmap = await mark_received(db, session.id, index)
+        except BaseException as e:
+            if keep:
+                pending_budget.release(length)
+            if isinstance(e, LookupError):
+                drop_hash_state(session.id)
+            raise
+
+    async with state.lock:
+        if candidate is not None and state.next_index == index:
+            state.hasher = candidate
+            state.next_index += 1
+            state.size += size
+        elif keep and index > state.next_index and hash_states.get(session.id) is state:
+            state.pending[index] = pieces
+            state.pending_bytes += size
+            keep = False  # 额度随明文转入暂存，计入哈希或丢弃进度时归还
+        if keep:
+            pending_budget.release(length)
+        await advance_hash(session, state, bitmap)
+    return size, bitmap
+
+
+async def file_checksum(session: UploadSession) -> Tuple[str, int]:
+    """所有分块接收完后取整个文件的SHA256与字节数，本进程未计入的分块从数据文件补算"""
+    state = hash_states.setdefault(session.id, HashState())
+    async with state.lock:
+        await advance_hash(session, state, session.received)
+        return state.hasher.hexdigest(), state.size
+
+
+def remove_session_files(session_id: str) -> None:
+    drop_hash_state(session_id)
+    shutil.rmtree(session_dir(session_id), ignore_errors=True)
+
+
+async def delete_session(db: AsyncSession, session: UploadSession) -> None:
+    """删除会话记录及其分块"""
+    await db.delete(session)
+    await db.commit()
+    remove_session_files(session.id)
+
+
+async def delete_user_sessions(db: AsyncSession, owner_id: int) -> List[str]:
+    """删除用户的全部会话记录（不提交），返回会话ID，调用方提交后删除分块"""
+    session_ids = (await db.scalars(select(UploadSession.id).where(UploadSession.owner_id == owner_id))).all()
+    if session_ids:
+        await db.execute(delete(UploadSession).where(UploadSession.owner_id == owner_id))
+    return list(session_ids)
+
+
+async def purge_expired_sessions(db: AsyncSession, limit: int = PURGE_BATCH) -> int:
+    """删除一批过期会话及其分块，顺带丢弃本进程内闲置的哈希进度，返回删除数量"""
+    evicted = evict_idle_hash_states()
+    if evicted:
+        logger.info(f"Wenxi - 丢弃闲置的上传哈希进度: {evicted}个")
+    session_ids = (await db.scalars(
+        select(UploadSession.id).where(UploadSession.expires_at <= utcnow()).limit(limit)
+    )).all()
+    if not session_ids:
+        return 0
+    await db.execute(delete(UploadSession).where(UploadSession.id.in_(session_ids)))
+    await db.commit()
+    for session_id in session_ids:
+        remove_session_files(session_id)
+    logger.info(f"Wenxi - 清理过期上传会话: {len(session_ids)}个")
+    return len(session_ids)
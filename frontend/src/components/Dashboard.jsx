@@ -23,6 +23,8 @@ export default function Dashboard() {
   const [searchResults, setSearchResults] = useState([]);
   const [allFiles, setAllFiles] = useState([]); // Wenxi - 本地文件缓存
   const [isSearching, setIsSearching] = useState(false); // Wenxi - 搜索状态
+  const [nextCursor, setNextCursor] = useState(null); // Wenxi - 列表下一页游标
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // Wenxi - 前端本地搜索优化
   const performLocalSearch = (query, fileList) => {
@@ -35,10 +37,10 @@ export default function Dashboard() {
     );
   };
 
-  const fetchFiles = async (searchQuery = '') => {
+  const fetchFiles = async (searchQuery = '', cursor = null) => {
     try {
-      // Wenxi - 如果有本地缓存且搜索词不为空，优先使用本地搜索
-      if (allFiles.length > 0 && searchQuery) {
+      // Wenxi - 如果已加载全部文件且搜索词不为空，优先使用本地搜索
+      if (allFiles.length > 0 && searchQuery && !nextCursor && !cursor) {
         setIsSearching(true);
         const localResults = performLocalSearch(searchQuery, allFiles);
         setFiles(localResults);
@@ -55,17 +57,24 @@ export default function Dashboard() {
       
       const { getBaseURL } = await import('../utils/apiConfig');
       const response = await axios.get(`${getBaseURL()}/api/files/list`, {
-        params: searchQuery ? { search: searchQuery } : {},
+        params: {
+          ...(searchQuery ? { search: searchQuery } : {}),
+          ...(cursor ? { cursor } : {})
+        },
         headers: {
           'Authorization': `Bearer ${token}`
         }
       });
       console.log('Wenxi - 文件列表获取成功:', response.data);
       
-      // Wenxi - 更新本地缓存
-      setAllFiles(response.data);
-      setFiles(response.data);
-      setSearchResults(response.data);
+      // Wenxi - 更新本地缓存，带游标时追加到已加载的列表
+      const loaded = cursor ? [...files, ...response.data] : response.data;
+      setNextCursor(response.headers['x-next-cursor'] || null);
+      if (!searchQuery) {
+        setAllFiles(loaded);
+      }
+      setFiles(loaded);
+      setSearchResults(loaded);
     } catch (error) {
       console.error('Wenxi - 获取文件列表失败:', error);
       if (error.response?.status === 401) {
@@ -88,6 +97,12 @@ export default function Dashboard() {
     }
   }, [user]);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    await fetchFiles(searchTerm, nextCursor);
+    setLoadingMore(false);
+  };
+
   const handleUploadSuccess = () => {
     setShowUpload(false);
     fetchFiles(searchTerm);
@@ -190,7 +205,7 @@ export default function Dashboard() {
                   <div className="ml-5 w-0 flex-1">
                     <dl>
                       <dt className="text-sm font-medium text-gray-500 truncate">文件总数</dt>
-                      <dd className="text-lg font-medium text-gray-900">{files.length}</dd>
+                      <dd className="text-lg font-medium text-gray-900">{files.length}{nextCursor ? '+' : ''}</dd>
                     </dl>
                   </div>
                 </div>
@@ -292,6 +307,17 @@ export default function Dashboard() {
                 onRefresh={() => fetchFiles(searchTerm)}
                 formatFileSize={formatFileSize}
               />
+              {nextCursor && (
+                <div className="mt-4 flex justify-center">
+                  <button
+                    onClick={loadMore}
+                    disabled={loadingMore}
+                    className="px-4 py-2 text-sm text-gray-600 bg-white border border-gray-300 rounded-md hover:bg-gray-50 disabled:opacity-50"
+                  >
+                    {loadingMore ? '加载中...' : '加载更多'}
+                  </button>
+                </div>
+              )}
             </>
           )}
         </div>
@@ -7,6 +7,9 @@
 import React, { useState, useRef } from 'react';
 import { X, UploadCloud, FileText } from 'lucide-react';
 
+// 分块上传时并行上传的分块数
+const PARALLEL_PARTS = 4;
+
 export default function FileUpload({ onClose, onSuccess }) {
   const [files, setFiles] = useState([]);
   const [uploading, setUploading] = useState(false);
@@ -55,12 +58,18 @@ export default function FileUpload({ onClose, onSuccess }) {
     const isLargeFile = file.size > CHUNK_SIZE; // 大于16MB使用分块
     
     try {
+      // 秒传预检：服务器已有相同内容时无需上传
+      const fileHash = await calculateFileHash(file);
+      if (await tryInstantUpload(fileObj, fileHash, token)) {
+        return true;
+      }
+      
       if (!isLargeFile) {
         // 小文件直接上传
         return await uploadSingleFile(fileObj, token);
       } else {
         // 大文件分块上传
-        return await uploadChunkedFile(fileObj, CHUNK_SIZE, token);
+        return await uploadChunkedFile(fileObj, CHUNK_SIZE, token, fileHash);
       }
     } catch (error) {
       setFiles(prev => prev.map(f => 
@@ -117,82 +126,131 @@ export default function FileUpload({ onClose, onSuccess }) {
     });
   };
 
-  const uploadChunkedFile = async (fileObj, chunkSize, token) => {
-    const file = fileObj.file;
-    const totalChunks = Math.ceil(file.size / chunkSize);
-    const fileHash = await calculateFileHash(file);
+  const tryInstantUpload = async (fileObj, fileHash, token) => {
+    const formData = new FormData();
+    formData.append('file_name', fileObj.file.name);
+    formData.append('file_hash', fileHash);
+    formData.append('file_size', fileObj.file.size);
     
-    // 检查已上传的分块
-    const uploadedChunks = await checkUploadedChunks(fileHash, token);
+    try {
+      const response = await fetch('/api/files/upload/instant', {
+        method: 'POST',
+        body: formData,
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      });
+      if (!response.ok) {
+        return false;
+      }
+      const data = await response.json();
+      if (data.instant) {
+        setFiles(prev => prev.map(f => 
+          f.id === fileObj.id 
+            ? { ...f, status: 'completed', progress: 100 }
+            : f
+        ));
+      }
+      return data.instant;
+    } catch (error) {
+      return false;
+    }
+  };
+
+  const uploadChunkedFile = async (fileObj, chunkSize, token, fileHash) => {
+    const file = fileObj.file;
+    const authHeaders = { 'Authorization': `Bearer ${token}` };
     
-    for (let i = 0; i < totalChunks; i++) {
-      if (uploadedChunks.includes(i)) {
-        // 跳过已上传的分块
-        updateProgress(fileObj.id, (i + 1) / totalChunks * 100);
-        continue;
+    // 断点续传：同一文件（内容哈希+大小）复用上次的上传会话，只补传缺失的分块
+    const sessionKey = `wenxi-upload:${fileHash}:${file.size}`;
+    let session = await resumeUploadSession(localStorage.getItem(sessionKey), authHeaders);
+    if (!session) {
+      const response = await fetch('/api/files/uploads', {
+        method: 'POST',
+        headers: { ...authHeaders, 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          file_name: file.name,
+          file_size: file.size,
+          chunk_size: chunkSize,
+          file_hash: fileHash,
+          mime_type: file.type || null
+        })
+      });
+      if (!response.ok) {
+        throw new Error('创建上传会话失败');
       }
-      
-      const start = i * chunkSize;
-      const end = Math.min(start + chunkSize, file.size);
-      const chunk = file.slice(start, end);
-      
-      const chunkFormData = new FormData();
-      chunkFormData.append('chunk', chunk);
-      chunkFormData.append('chunk_index', i);
-      chunkFormData.append('total_chunks', totalChunks);
-      chunkFormData.append('file_name', file.name);
-      chunkFormData.append('file_hash', fileHash);
-      chunkFormData.append('chunk_hash', await calculateFileHash(chunk));
+      session = await response.json();
+      localStorage.setItem(sessionKey, session.upload_id);
+    }
+    
+    // 待上传的分块：服务器返回的缺失区间
+    const pending = [];
+    for (const [start, end] of session.missing) {
+      for (let i = start; i < end; i++) pending.push(i);
+    }
+    
+    // 整体进度：已完成字节 + 各在途分块已发送字节
+    let completedBytes = session.received_bytes;
+    const inFlight = {};
+    const reportProgress = () => {
+      const sending = Object.values(inFlight).reduce((sum, loaded) => sum + loaded, 0);
+      updateProgress(fileObj.id, file.size ? (completedBytes + sending) / file.size * 100 : 100);
+    };
+    reportProgress();
+    
+    const uploadPart = async (index) => {
+      const start = index * session.chunk_size;
+      const chunk = file.slice(start, Math.min(start + session.chunk_size, file.size));
+      const chunkHash = await calculateFileHash(chunk);
       
       // 使用 XMLHttpRequest 来支持分块上传的进度监听
       await new Promise((resolve, reject) => {
         const xhr = new XMLHttpRequest();
         
-        // 监听分块上传进度
         xhr.upload.addEventListener('progress', (event) => {
-          if (event.lengthComputable) {
-            // 计算整体进度：已上传分块 + 当前分块进度
-            const baseProgress = i / totalChunks * 100;
-            const chunkProgress = (event.loaded / event.total) * (100 / totalChunks);
-            const totalProgress = Math.round(baseProgress + chunkProgress);
-            updateProgress(fileObj.id, totalProgress);
-          }
+          inFlight[index] = event.loaded;
+          reportProgress();
         });
         
         xhr.addEventListener('load', () => {
+          delete inFlight[index];
           if (xhr.status === 200) {
-            updateProgress(fileObj.id, Math.round((i + 1) / totalChunks * 100));
+            completedBytes += chunk.size;
+            reportProgress();
             resolve();
           } else {
-            reject(new Error(`分块 ${i + 1} 上传失败`));
+            reject(new Error(`分块 ${index + 1} 上传失败`));
           }
         });
         
         xhr.addEventListener('error', () => {
-          reject(new Error(`分块 ${i + 1} 上传失败`));
+          delete inFlight[index];
+          reject(new Error(`分块 ${index + 1} 上传失败`));
         });
         
-        xhr.open('POST', '/api/files/upload/chunk');
+        xhr.open('PUT', `/api/files/uploads/${session.upload_id}/parts/${index}`);
         xhr.setRequestHeader('Authorization', `Bearer ${token}`);
-        xhr.send(chunkFormData);
+        xhr.setRequestHeader('X-Chunk-SHA256', chunkHash);
+        xhr.send(chunk);
       });
-    }
+    };
     
-    // 合并分块
-    const mergeFormData = new FormData();
-    mergeFormData.append('file_name', file.name);
-    mergeFormData.append('file_hash', fileHash);
-    mergeFormData.append('total_chunks', totalChunks);
+    // 多个分块并行上传，服务器按序号写入，顺序无关
+    const worker = async () => {
+      while (pending.length > 0) {
+        await uploadPart(pending.shift());
+      }
+    };
+    await Promise.all(Array.from({ length: Math.min(PARALLEL_PARTS, pending.length) }, worker));
     
-    const mergeResponse = await fetch('/api/files/upload/merge', {
+    // 完成上传
+    const completeResponse = await fetch(`/api/files/uploads/${session.upload_id}/complete`, {
       method: 'POST',
-      body: mergeFormData,
-      headers: {
-        'Authorization': `Bearer ${token}`
-      }
+      headers: authHeaders
     });
     
-    if (mergeResponse.ok) {
+    if (completeResponse.ok) {
+      localStorage.removeItem(sessionKey);
       setFiles(prev => prev.map(f => 
         f.id === fileObj.id 
           ? { ...f, status: 'completed', progress: 100 }
@@ -200,25 +258,19 @@ export default function FileUpload({ onClose, onSuccess }) {
       ));
       return true;
     } else {
-      throw new Error('合并分块失败');
+      throw new Error('完成上传失败');
     }
   };
 
-  const checkUploadedChunks = async (fileHash, token) => {
+  const resumeUploadSession = async (uploadId, authHeaders) => {
+    if (!uploadId) {
+      return null;
+    }
     try {
-      const response = await fetch(`/api/files/upload/check?file_hash=${fileHash}`, {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
-      
-      if (response.ok) {
-        const data = await response.json();
-        return data.uploaded_chunks || [];
-      }
-      return [];
+      const response = await fetch(`/api/files/uploads/${uploadId}`, { headers: authHeaders });
+      return response.ok ? await response.json() : null;
     } catch (error) {
-      return [];
+      return null;
     }
   };
 
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 加密容器格式基准测试
+作者：Wenxi
+功能：对比v2（64KB固定块、单nonce）与v3（每块独立nonce、可配置块大小）的加解密吞吐量和空间开销
+用法：python scripts/bench_container_format.py [--size-mb 256] [--chunk-sizes 65536,262144,1048576,4194304]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+
+def timed(func) -> float:
+    """执行函数并返回耗时（秒）"""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi加密容器格式基准测试")
+    parser.add_argument("--size-mb", type=int, default=256, help="测试文件大小（MB）")
+    parser.add_argument("--chunk-sizes", default="65536,262144,1048576,4194304", help="逗号分隔的v3块大小列表（字节）")
+    args = parser.parse_args()
+
+    from utils.encryption import encrypt_file, _encrypt_file_v2, DecryptStream, warm_key_cache
+
+    warm_key_cache()
+    size = args.size_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        plain_path = os.path.join(work_dir, "plain")
+        cipher_path = os.path.join(work_dir, "cipher")
+        with open(plain_path, "wb") as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+
+        def decrypt_all():
+            for _ in DecryptStream(cipher_path):
+                pass
+
+        cases = [("v2 / 64KB", lambda: _encrypt_file_v2(plain_path, cipher_path))]
+        for chunk_size in [int(value) for value in args.chunk_sizes.split(",") if value]:
+            cases.append((
+                f"v3 / {chunk_size // 1024}KB",
+                lambda chunk_size=chunk_size: encrypt_file(plain_path, cipher_path, chunk_size=chunk_size)
+            ))
+
+        print(f"Wenxi - 容器格式基准: {args.size_mb}MB")
+        print(f"{'格式/块大小':<14} {'加密MB/s':>10} {'解密MB/s':>10} {'空间开销':>10}")
+        for label, encrypt in cases:
+            encrypt_seconds = timed(encrypt)
+            overhead = os.path.getsize(cipher_path) - size
+            decrypt_seconds = timed(decrypt_all)
+            print(f"{label:<14} {size / encrypt_seconds / 1024 / 1024:>10.2f} "
+                  f"{size / decrypt_seconds / 1024 / 1024:>10.2f} {overhead / 1024:>8.1f}KB")
+            os.remove(cipher_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 多核加解密引擎基准测试
+作者：Wenxi
+功能：对比单核encrypt_file/decrypt_file与CryptoEngine在不同工作数下的吞吐量
+用法：python scripts/bench_crypto_engine.py [--size-mb 256] [--workers 1,2,4,8] [--executor process]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+
+def throughput(size: int, seconds: float) -> float:
+    """计算MB/s"""
+    return size / seconds / 1024 / 1024 if seconds > 0 else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi多核加解密引擎基准测试")
+    parser.add_argument("--size-mb", type=int, default=256, help="测试文件大小（MB）")
+    parser.add_argument("--workers", default="1,2,4,8", help="逗号分隔的工作数列表")
+    parser.add_argument("--executor", default="process", choices=["process", "thread"], help="执行器类型")
+    args = parser.parse_args()
+
+    from utils.encryption import encrypt_file, decrypt_file, warm_key_cache
+    from utils.crypto_engine import CryptoEngine
+
+    warm_key_cache()
+    size = args.size_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        plain_path = os.path.join(work_dir, "plain")
+        cipher_path = os.path.join(work_dir, "cipher")
+        output_path = os.path.join(work_dir, "output")
+        with open(plain_path, "wb") as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+
+        print(f"Wenxi - 加解密引擎基准: {args.size_mb}MB, CPU核心数 {os.cpu_count()}")
+        start = time.perf_counter()
+        encrypt_file(plain_path, cipher_path)
+        encrypt_baseline = throughput(size, time.perf_counter() - start)
+        start = time.perf_counter()
+        decrypt_file(cipher_path, output_path)
+        decrypt_baseline = throughput(size, time.perf_counter() - start)
+        print(f"{'单核基线':<16} 加密 {encrypt_baseline:8.2f}MB/s  解密 {decrypt_baseline:8.2f}MB/s")
+
+        for workers in [int(value) for value in args.workers.split(",") if value]:
+            engine = CryptoEngine(workers=workers, executor_type=args.executor)
+
+            async def run_once():
+                # 预热工作池，不把进程启动时间计入吞吐量
+                await engine.encrypt_file(plain_path, cipher_path)
+                start = time.perf_counter()
+                await engine.encrypt_file(plain_path, cipher_path)
+                encrypt_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                await engine.decrypt_file(cipher_path, output_path)
+                return encrypt_seconds, time.perf_counter() - start
+
+            encrypt_seconds, decrypt_seconds = asyncio.run(run_once())
+            engine.shutdown()
+            encrypt_speed = throughput(size, encrypt_seconds)
+            decrypt_speed = throughput(size, decrypt_seconds)
+            print(f"{args.executor + ' x ' + str(workers):<16} 加密 {encrypt_speed:8.2f}MB/s "
+                  f"({encrypt_speed / encrypt_baseline:.2f}x)  解密 {decrypt_speed:8.2f}MB/s "
+                  f"({decrypt_speed / decrypt_baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 数据库配置档位基准测试
+作者：Wenxi
+功能：对每个引擎档位执行并发的文件元数据写入和列表查询，统计吞吐量、p99延迟和锁冲突次数
+用法：python scripts/bench_db_profiles.py [--writers 8] [--readers 8] [--writes 200] [--profiles default,sqlite]
+说明：默认使用临时SQLite文件；--url可指向MySQL/PostgreSQL测试库（会创建并清空表）
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+
+def percentile(values, fraction: float) -> float:
+    """计算百分位数（毫秒）"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+
+
+async def run_profile(url: str, profile: str, args) -> dict:
+    """在全新的表上运行一轮并发读写"""
+    from sqlalchemy import select
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from database import build_async_engine
+    from models import Base, User, File as FileModel
+
+    engine = build_async_engine(url, profile)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(user)
+        await db.commit()
+
+    write_latencies, read_latencies = [], []
+    errors = 0
+    writers_done = asyncio.Event()
+
+    async def writer(index: int):
+        nonlocal errors
+        for number in range(args.writes):
+            start = time.perf_counter()
+            try:
+                async with Session() as db:
+                    db.add(FileModel(
+                        filename=f"{index}_{number}", original_filename=f"file_{index}_{number}.bin",
+                        file_path=f"uploads/{index}_{number}", file_size=number, owner_id=user.id
+                    ))
+                    await db.commit()
+                write_latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                errors += 1
+
+    async def reader():
+        nonlocal errors
+        while not writers_done.is_set():
+            start = time.perf_counter()
+            try:
+                async with Session() as db:
+                    (await db.scalars(
+                        select(FileModel).where(FileModel.owner_id == user.id)
+                        .order_by(FileModel.created_at.desc()).limit(50)
+                    )).all()
+                read_latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                errors += 1
+
+    started = time.perf_counter()
+    readers = [asyncio.create_task(reader()) for _ in range(args.readers)]
+    await asyncio.gather(*[writer(index) for index in range(args.writers)])
+    elapsed = time.perf_counter() - started
+    writers_done.set()
+    await asyncio.gather(*readers)
+    await engine.dispose()
+
+    return {
+        "writes": len(write_latencies) / elapsed,
+        "reads": len(read_latencies) / elapsed,
+        "write_p99": percentile(write_latencies, 0.99),
+        "read_p99": percentile(read_latencies, 0.99),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi数据库配置档位基准测试")
+    parser.add_argument("--writers", type=int, default=8, help="并发写入任务数")
+    parser.add_argument("--readers", type=int, default=8, help="并发列表查询任务数")
+    parser.add_argument("--writes", type=int, default=200, help="每个写入任务的提交次数")
+    parser.add_argument("--profiles", default="default,sqlite,server", help="逗号分隔的档位列表")
+    parser.add_argument("--url", default="", help="异步数据库URL，默认使用临时SQLite文件")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(work_dir, 'import.db')}")
+        print(f"Wenxi - 数据库档位基准: {args.writers}写 x {args.writes}次, {args.readers}个并发列表查询")
+        print(f"{'档位':<10} {'写入/s':>9} {'查询/s':>9} {'写p99(ms)':>10} {'查p99(ms)':>10} {'锁冲突':>7}")
+        for profile in [value for value in args.profiles.split(",") if value]:
+            url = args.url or f"sqlite+aiosqlite:///{os.path.join(work_dir, f'{profile}.db')}"
+            result = asyncio.run(run_profile(url, profile, args))
+            print(f"{profile:<10} {result['writes']:>9.0f} {result['reads']:>9.0f} "
+                  f"{result['write_p99']:>10.1f} {result['read_p99']:>10.1f} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
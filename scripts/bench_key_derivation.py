@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 密钥派生缓存基准测试
+作者：Wenxi
+功能：对比每次请求重新执行PBKDF2（缓存前）与命中密钥缓存（缓存后）的单请求延迟
+用法：python scripts/bench_key_derivation.py [--requests 5] [--size 65536]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+
+def measure(label: str, func, requests: int) -> dict:
+    """执行多次请求并统计延迟（毫秒）"""
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    result = {
+        "label": label,
+        "requests": requests,
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": statistics.median(samples),
+        "max_ms": max(samples)
+    }
+    print(f"{label:<28} mean={result['mean_ms']:9.2f}ms  p50={result['p50_ms']:9.2f}ms  max={result['max_ms']:9.2f}ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi密钥派生缓存基准测试")
+    parser.add_argument("--requests", type=int, default=5, help="每组模拟请求数")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="每次请求加解密的数据大小（字节）")
+    args = parser.parse_args()
+
+    from utils.encryption import encrypt_stream, decrypt_stream, clear_key_cache, get_key_cache_stats
+
+    payload = os.urandom(args.size)
+
+    def one_request():
+        decrypt_stream(encrypt_stream(payload))
+
+    def uncached_request():
+        # 清空缓存，模拟缓存引入前每次请求都派生密钥
+        clear_key_cache()
+        one_request()
+
+    print(f"Wenxi - 密钥派生基准: {args.requests}次请求, 每次{args.size}字节加密+解密")
+    before = measure("缓存前(每次PBKDF2)", uncached_request, args.requests)
+
+    clear_key_cache()
+    one_request()  # 预热，相当于启动时预派生
+    after = measure("缓存后(命中缓存)", one_request, args.requests)
+
+    speedup = before["mean_ms"] / after["mean_ms"] if after["mean_ms"] else float("inf")
+    print(f"单请求平均延迟降低: {before['mean_ms'] - after['mean_ms']:.2f}ms ({speedup:.1f}x)")
+    print(f"密钥缓存统计: {get_key_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 上传压力下的列表接口延迟测试
+作者：Wenxi
+功能：启动独立的后端进程，在多个大文件上传进行时持续请求/api/files/list，统计p50/p95/p99延迟
+用法：python scripts/bench_list_latency.py [--uploads 4] [--upload-mb 64] [--seed-files 200] [--backend-dir backend]
+说明：使用临时数据库和存储目录，不影响本地数据；--backend-dir可指向其他版本的backend目录做对比
+"""
+
+import os
+import sys
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+DEFAULT_BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction: float) -> float:
+    """计算百分位数（毫秒）"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+
+
+def multipart_body(filename: str, size_mb: int):
+    """生成流式multipart请求体，返回(Content-Type, 异步数据生成器)"""
+    boundary = uuid.uuid4().hex
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+
+    async def body():
+        yield head
+        for _ in range(size_mb):
+            yield os.urandom(1024 * 1024)
+        yield tail
+
+    return f"multipart/form-data; boundary={boundary}", body()
+
+
+async def run_benchmark(base_url: str, args) -> None:
+    """注册用户、预置文件，然后测量空闲与上传压力下的列表延迟"""
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        await client.post("/api/auth/register", json={
+            "username": "bench", "email": "bench@example.com", "password": "bench-password"
+        })
+        response = await client.post("/api/auth/login", data={"username": "bench", "password": "bench-password"})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        for index in range(args.seed_files):
+            await client.post("/api/files/upload", headers=headers,
+                              files={"file": (f"seed_{index}.bin", os.urandom(1024))})
+
+        async def sample_list(stop: asyncio.Event, latencies: list):
+            while not stop.is_set():
+                start = time.perf_counter()
+                response = await client.get("/api/files/list", headers=headers)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+                await asyncio.sleep(args.interval)
+
+        async def upload(index: int):
+            content_type, body = multipart_body(f"large_{index}.bin", args.upload_mb)
+            response = await client.post("/api/files/upload", content=body,
+                                         headers={**headers, "Content-Type": content_type})
+            response.raise_for_status()
+
+        async def measure(with_uploads: bool) -> list:
+            latencies = []
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(sample_list(stop, latencies))
+            started = time.perf_counter()
+            if with_uploads:
+                await asyncio.gather(*[upload(index) for index in range(args.uploads)])
+            else:
+                await asyncio.sleep(args.idle_seconds)
+            stop.set()
+            await sampler
+            return latencies, time.perf_counter() - started
+
+        print(f"Wenxi - /list延迟测试: 预置{args.seed_files}个文件, {args.uploads}个并发上传 x {args.upload_mb}MB")
+        print(f"{'场景':<12} {'请求数':>6} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9} {'耗时(s)':>8}")
+        for label, with_uploads in (("空闲", False), ("上传进行中", True)):
+            latencies, elapsed = await measure(with_uploads)
+            print(f"{label:<12} {len(latencies):>6} {percentile(latencies, 0.50):>9.1f} "
+                  f"{percentile(latencies, 0.95):>9.1f} {percentile(latencies, 0.99):>9.1f} "
+                  f"{max(latencies) * 1000:>9.1f} {elapsed:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi上传压力下的列表接口延迟测试")
+    parser.add_argument("--uploads", type=int, default=4, help="并发上传数")
+    parser.add_argument("--upload-mb", type=int, default=64, help="每个上传的大小（MB）")
+    parser.add_argument("--seed-files", type=int, default=200, help="预置的文件记录数")
+    parser.add_argument("--interval", type=float, default=0.01, help="列表请求间隔（秒）")
+    parser.add_argument("--idle-seconds", type=float, default=3.0, help="空闲场景测量时长（秒）")
+    parser.add_argument("--backend-dir", default=DEFAULT_BACKEND_DIR, help="被测backend目录")
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(work_dir, 'bench.db')}",
+            WENXI_FILE_STORAGE_PATH=os.path.join(work_dir, "uploads"),
+            WENXI_ENCRYPTION_KEY=os.environ.get("WENXI_ENCRYPTION_KEY", "wenxi-bench-key"),
+            WENXI_ENCRYPTION_SALT=os.environ.get("WENXI_ENCRYPTION_SALT", "wenxi-bench-salt"),
+            WENXI_JWT_SECRET_KEY=os.environ.get("WENXI_JWT_SECRET_KEY", "wenxi-bench-secret"),
+            WENXI_JWT_EXPIRE_MINUTES="60",
+            WENXI_LOG_LEVEL="WARNING",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.abspath(args.backend_dir), env=env
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            for _ in range(100):
+                try:
+                    httpx.get(f"{base_url}/health")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            asyncio.run(run_benchmark(base_url, args))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
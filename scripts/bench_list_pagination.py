@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 文件列表分页基准测试
+作者：Wenxi
+功能：在不同文件数下对比旧的全量加载与键集分页的首页、深页查询耗时，验证分页延迟不随文件数增长
+用法：python scripts/bench_list_pagination.py [--counts 1000,10000,100000] [--limit 200]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+
+async def timed(coro_factory, repeat: int) -> float:
+    """多次执行取中位数（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coro_factory()
+        samples.append(time.perf_counter() - start)
+    return sorted(samples)[len(samples) // 2] * 1000
+
+
+async def run_count(work_dir: str, count: int, args) -> tuple:
+    """预置count个文件后测量三种查询"""
+    from sqlalchemy import insert, select
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    from database import build_async_engine
+    from models import Base, User, File as FileModel
+    from utils.pagination import apply_keyset, encode_cursor, page_with_cursor
+
+    engine = build_async_engine(f"sqlite+aiosqlite:///{os.path.join(work_dir, f'list_{count}.db')}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as db:
+        db.add(User(username="bench", email="bench@example.com", hashed_password="x"))
+        await db.commit()
+        base_time = datetime(2025, 1, 1)
+        rows = [{
+            "filename": f"f{index}", "original_filename": f"file_{index}.bin", "file_path": f"uploads/f{index}",
+            "file_size": index, "owner_id": 1, "created_at": base_time + timedelta(seconds=index)
+        } for index in range(count)]
+        for start in range(0, count, 10000):
+            await db.execute(insert(FileModel), rows[start:start + 10000])
+        await db.commit()
+
+    columns = (FileModel.id, FileModel.filename, FileModel.original_filename, FileModel.file_size,
+               FileModel.mime_type, FileModel.created_at, FileModel.is_shared)
+
+    async with Session() as db:
+        async def full_load():
+            (await db.scalars(select(FileModel).where(FileModel.owner_id == 1)
+                              .order_by(FileModel.created_at.desc()))).all()
+
+        async def keyset_page(cursor=None):
+            query = apply_keyset(select(*columns).where(FileModel.owner_id == 1), "created_at", "desc", cursor, args.limit)
+            return page_with_cursor((await db.execute(query)).mappings().all(), "created_at", "desc", args.limit)
+
+        # 深页游标：模拟翻到列表中间
+        middle = await db.scalar(select(FileModel).where(FileModel.id == count // 2))
+        deep_cursor = encode_cursor("created_at", "desc", middle.created_at, middle.id)
+
+        result = (
+            await timed(full_load, args.repeat),
+            await timed(keyset_page, args.repeat),
+            await timed(lambda: keyset_page(deep_cursor), args.repeat),
+        )
+    await engine.dispose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi文件列表分页基准测试")
+    parser.add_argument("--counts", default="1000,10000,100000", help="逗号分隔的文件数列表")
+    parser.add_argument("--limit", type=int, default=200, help="每页条数")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(work_dir, 'import.db')}")
+        print(f"Wenxi - 文件列表分页基准: 每页{args.limit}条")
+        print(f"{'文件数':>8} {'全量加载(ms)':>14} {'首页(ms)':>10} {'中间页(ms)':>12}")
+        for count in [int(value) for value in args.counts.split(",") if value]:
+            full, first, deep = asyncio.run(run_count(work_dir, count, args))
+            print(f"{count:>8} {full:>14.1f} {first:>10.1f} {deep:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
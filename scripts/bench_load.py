@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 端到端负载测试
+作者：Wenxi
+功能：先生成多用户、多文件的合成语料，再按可配置的请求混合（注册登录、普通上传、断点续传分块上传、列表、搜索、下载、分享链接访问）
+      和并发数驱动backend/main.py:app，按接口统计吞吐量、p50/p95/p99延迟、错误数与服务端内存峰值，为容量规划提供实测数据
+用法：python scripts/bench_load.py [--mix mixed|browse|upload|login=1,download=3] [--concurrency 1,8,32] [--duration 20]
+                                  [--users 20] [--files-per-user 20] [--max-file-size 4M] [--output load.json]
+      python scripts/bench_load.py --uvicorn          # 在独立的uvicorn进程中运行，经真实HTTP连接
+      python scripts/bench_load.py --url http://host:3008 --server-pid 1234   # 对已运行的实例施压
+说明：默认在进程内通过httpx的ASGITransport调用应用，不经网络，客户端与服务端共用CPU和内存；
+      ASGITransport会把整个响应体收进内存，内存数据以--uvicorn模式为准。进程内与--uvicorn模式使用临时数据库，
+      文件写入backend/uploads，结束时注销测试账户删除其文件（--keep保留）。
+      内存为服务进程及其子进程（并行加解密工作进程）的RSS，后台线程每20ms采样一次；接口的内存峰值是该接口
+      有请求进行中时观测到的最大RSS，混合负载下包含同时进行的其他请求，用--mix download=1这类单接口混合可单独测量
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+OPERATIONS = ["register", "login", "upload", "chunked", "list", "search", "download", "shared", "share"]
+MIXES = {
+    "mixed": "register=2,login=5,upload=12,chunked=3,list=25,search=15,download=25,shared=8,share=5",
+    "browse": "login=2,list=30,search=20,download=35,shared=10,upload=3",
+    "upload": "upload=50,chunked=20,list=20,download=10",
+}
+WORDS = [
+    "报告", "合同", "发票", "照片", "会议纪要", "季度总结", "预算", "设计稿", "项目计划", "简历",
+    "report", "invoice", "budget", "design", "meeting", "draft", "final", "backup", "holiday", "contract",
+]
+EXTENSIONS = ["pdf", "docx", "xlsx", "jpg", "png", "zip", "txt", "mp4"]
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def parse_size(text: str) -> int:
+    """解析1K、64KiB、2G等大小（按1024进位）"""
+    value = text.strip().upper().replace("IB", "").replace("B", "")
+    if value and value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(value)
+
+
+def parse_mix(text: str) -> dict:
+    """解析预设名或"操作=权重"列表，返回操作 -> 权重"""
+    weights = {}
+    for item in MIXES.get(text, text).split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"未知操作: {name}（可用：{', '.join(OPERATIONS)}）")
+        if float(weight or 1) > 0:
+            weights[name] = float(weight or 1)
+    if not weights:
+        raise ValueError("请求混合为空")
+    return weights
+
+
+def process_tree_rss(pid: int) -> int:
+    """进程及其全部子进程的RSS（字节）；优先读取/proc，其次psutil，都不可用时返回0"""
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * PAGE_SIZE
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue
+    if total:
+        return total
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+    except Exception:
+        return 0
+
+
+class MemorySampler:
+    """后台线程定时采样服务进程树的RSS，记录整体峰值和每个接口有请求进行中时的峰值"""
+
+    def __init__(self, pid: int = None, interval: float = 0.02):
+        self.pid = pid
+        self.interval = interval
+        self.in_flight = {}
+        self.peaks = {}
+        self.peak = 0
+        self.baseline = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.pid is not None and self.baseline > 0
+
+    def start(self):
+        if self.pid is None:
+            return
+        self.reset()
+        if self.baseline:
+            self._thread = threading.Thread(target=self._run, name="wenxi-load-memory", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def reset(self):
+        self.peaks = {}
+        self.baseline = self.peak = process_tree_rss(self.pid) if self.pid is not None else 0
+
+    def enter(self, endpoint: str):
+        self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+
+    def leave(self, endpoint: str):
+        self.in_flight[endpoint] -= 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = process_tree_rss(self.pid)
+            self.peak = max(self.peak, rss)
+            for endpoint, count in list(self.in_flight.items()):
+                if count > 0 and rss > self.peaks.get(endpoint, 0):
+                    self.peaks[endpoint] = rss
+
+
+class EndpointStats:
+    """单个接口的延迟样本、传输字节数和状态码计数"""
+
+    __slots__ = ("latencies", "bytes", "statuses")
+
+    def __init__(self):
+        self.latencies = []
+        self.bytes = 0
+        self.statuses = {}
+
+    def record(self, seconds: float, status, nbytes: int):
+        self.latencies.append(seconds)
+        self.bytes += nbytes
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    def errors(self) -> int:
+        return sum(count for status, count in self.statuses.items() if not status.startswith("2"))
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        if len(latencies) > 1:
+            cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+            p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+        else:
+            p50 = p95 = p99 = latencies[0] if latencies else 0.0
+        return {
+            "count": len(latencies),
+            "errors": self.errors(),
+            "statuses": dict(sorted(self.statuses.items())),
+            "rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "mb_s": self.bytes / elapsed / 1024 / 1024 if elapsed > 0 else 0.0,
+            "p50_ms": p50 * 1000,
+            "p95_ms": p95 * 1000,
+            "p99_ms": p99 * 1000,
+            "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        }
+
+
+class Corpus:
+    """合成语料：用户、文件名/描述（取自固定词表，便于搜索命中）、对数均匀分布的文件大小、按比例重复的内容"""
+
+    def __init__(self, rng: random.Random, args):
+        self.rng = rng
+        self.args = args
+        self.run_id = f"{int(time.time()) % 100000:05d}{rng.randrange(1000):03d}"
+        self.users = []
+        self.shared = {}  # 文件ID -> (分享令牌, 大小)
+        self.payloads = []
+        self.counter = 0
+
+    def next_id(self) -> int:
+        self.counter += 1
+        return self.counter
+
+    def new_user(self) -> dict:
+        username = f"load{self.run_id}_{self.next_id()}"
+        return {"username": username, "email": f"{username}@example.com", "password": f"{username}-password",
+                "token": None, "files": []}
+
+    def file_name(self) -> str:
+        first, second = self.rng.sample(WORDS, 2)
+        return f"{first}_{second}_{self.next_id():05d}.{self.rng.choice(EXTENSIONS)}"
+
+    def description(self) -> str:
+        return " ".join(self.rng.sample(WORDS, 3))
+
+    def file_size(self) -> int:
+        low, high = math.log(self.args.min_file_size), math.log(self.args.max_file_size)
+        return max(1, int(math.exp(self.rng.uniform(low, high))))
+
+    def payload(self, size: int) -> bytes:
+        """按--dup-ratio复用此前的内容（触发去重），否则生成随机内容"""
+        if self.payloads and self.rng.random() < self.args.dup_ratio:
+            return self.rng.choice(self.payloads)
+        data = os.urandom(size)
+        if size <= 1024 * 1024:
+            self.payloads = (self.payloads + [data])[-32:]
+        return data
+
+    def user_with_files(self):
+        candidates = [user for user in self.users if user["files"] and user["token"]]
+        return self.rng.choice(candidates) if candidates else None
+
+    def logged_in_user(self):
+        candidates = [user for user in self.users if user["token"]]
+        return self.rng.choice(candidates) if candidates else None
+
+
+class LoadTest:
+    """生成语料、按并发级别施压并汇总每个接口的统计"""
+
+    def __init__(self, client: httpx.AsyncClient, args, memory: MemorySampler):
+        self.client = client
+        self.args = args
+        self.memory = memory
+        self.rng = random.Random(args.seed)
+        self.corpus = Corpus(self.rng, args)
+        self.weights = parse_mix(args.mix)
+        self.stats = {}
+        self.recording = False
+
+    @staticmethod
+    def auth(user: dict) -> dict:
+        return {"Authorization": f"Bearer {user['token']}"}
+
+    async def request(self, endpoint: str, method: str, url: str, sent: int = 0, expect_size: int = None,
+                      keep_body: bool = True, **kwargs):
+        """发送请求并计时到最后一个字节；返回(状态码, 响应体)，不保留响应体时返回b"" """
+        self.memory.enter(endpoint)
+        start = time.perf_counter()
+        status, body, received = "error", b"", 0
+        try:
+            async with self.client.stream(method, url, **kwargs) as response:
+                status = response.status_code
+                if keep_body:
+                    body = await response.aread()
+                    received = len(body)
+                else:
+                    async for data in response.aiter_bytes():
+                        received += len(data)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        finally:
+            elapsed = time.perf_counter() - start
+            self.memory.leave(endpoint)
+        if expect_size is not None and status == 200 and received != expect_size:
+            status = "size_mismatch"
+        if self.recording:
+            self.stats.setdefault(endpoint, EndpointStats()).record(elapsed, status, sent + received)
+        return status, body
+
+    # === 操作 ===
+
+    async def op_register(self, user: dict = None):
+        user = user or self.corpus.new_user()
+        status, _ = await self.request("register", "POST", "/api/auth/register", json={
+            "username": user["username"], "email": user["email"], "password": user["password"]})
+        if status == 200:
+            self.corpus.users.append(user)
+            await self.op_login(user)
+
+    async def op_login(self, user: dict = None):
+        user = user or (self.rng.choice(self.corpus.users) if self.corpus.users else None)
+        if user is None:
+            return await self.op_register()
+        status, body = await self.request("login", "POST", "/api/auth/login", data={
+            "username": user["username"], "password": user["password"]})
+        if status == 200:
+            user["token"] = json.loads(body)["access_token"]
+
+    async def op_upload(self, user: dict = None):
+        user = user or self.corpus.logged_in_user()
+        if user is None:
+            return await self.op_register()
+        size = self.corpus.file_size()
+        content = self.corpus.payload(size)
+        status, body = await self.request(
+            "upload", "POST", "/api/files/upload", sent=len(content), headers=self.auth(user),
+            files={"file": (self.corpus.file_name(), content, "application/octet-stream")},
+            data={"description": self.corpus.description()})
+        if status == 200:
+            user["files"].append((json.loads(body)["id"], len(content)))
+
+    async def op_chunked(self):
+        """断点续传会话：创建会话，--part-concurrency路并行上传分块，最后完成"""
+        user = self.corpus.logged_in_user()
+        if user is None:
+            return await self.op_register()
+        content = os.urandom(self.args.chunked_size)
+        chunk_size = self.args.chunk_size
+        status, body = await self.request("upload_session", "POST", "/api/files/uploads", headers=self.auth(user), json={
+            "file_name": self.corpus.file_name(), "file_size": len(content), "chunk_size": chunk_size,
+            "file_hash": hashlib.sha256(content).hexdigest(), "description": self.corpus.description()})
+        if status != 201:
+            return
+        session = json.loads(body)
+        pending = list(range(session["total_chunks"]))
+
+        async def send_parts():
+            while pending:
+                index = pending.pop(0)
+                chunk = content[index * chunk_size:(index + 1) * chunk_size]
+                await self.request(
+                    "upload_part", "PUT", f"/api/files/uploads/{session['upload_id']}/parts/{index}", sent=len(chunk),
+                    headers={**self.auth(user), "X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest()}, content=chunk)
+
+        await asyncio.gather(*(send_parts() for _ in range(self.args.part_concurrency)))
+        status, body = await self.request(
+            "upload_complete", "POST", f"/api/files/uploads/{session['upload_id']}/complete", headers=self.auth(user))
+        if status == 200:
+            user["files"].append((json.loads(body)["id"], len(content)))
+
+    async def op_list(self):
+        user = self.corpus.logged_in_user()
+        if user is None:
+            return await self.op_register()
+        params = {"limit": self.args.page_size, "sort": self.rng.choice(["created_at", "name", "size"])}
+        await self.request("list", "GET", "/api/files/list", headers=self.auth(user), params=params)
+
+    async def op_search(self):
+        user = self.corpus.logged_in_user()
+        if user is None:
+            return await self.op_register()
+        params = {"limit": self.args.page_size, "search": self.rng.choice(WORDS)}
+        await self.request("search", "GET", "/api/files/list", headers=self.auth(user), params=params)
+
+    async def op_download(self):
+        user = self.corpus.user_with_files()
+        if user is None:
+            return await self.op_upload()
+        file_id, size = self.rng.choice(user["files"])
+        await self.request("download", "GET", f"/api/files/download/{file_id}", expect_size=size,
+                           keep_body=False, params={"token": user["token"]})
+
+    async def op_share(self, user: dict = None, file: tuple = None):
+        user = user or self.corpus.user_with_files()
+        if user is None:
+            return await self.op_upload()
+        file_id, size = file or self.rng.choice(user["files"])
+        status, body = await self.request("share", "POST", f"/api/files/{file_id}/share", headers=self.auth(user))
+        if status == 200:
+            self.corpus.shared[file_id] = (json.loads(body)["share_token"], size)
+
+    async def op_shared(self):
+        if not self.corpus.shared:
+            return await self.op_share()
+        share_token, size = self.rng.choice(list(self.corpus.shared.values()))
+        await self.request("shared", "GET", f"/api/files/shared/{share_token}", expect_size=size, keep_body=False)
+
+    # === 语料与施压 ===
+
+    async def gather_limited(self, coroutines, limit: int):
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run(coroutine):
+            async with semaphore:
+                await coroutine
+
+        await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+    async def seed(self):
+        """注册登录--users个用户，每人上传--files-per-user个文件，按--share-ratio分享"""
+        start = time.perf_counter()
+        limit = self.args.seed_concurrency
+        await self.gather_limited((self.op_register() for _ in range(self.args.users)), limit)
+        users = [user for user in self.corpus.users if user["token"]]
+        await self.gather_limited((self.op_upload(user) for user in users for _ in range(self.args.files_per_user)), limit)
+        files = [(user, file) for user in users for file in user["files"]]
+        shares = [self.op_share(user, file) for user, file in files if self.rng.random() < self.args.share_ratio]
+        await self.gather_limited(shares, limit)
+        total = sum(size for _, (_, size) in files)
+        print(f"语料: {len(users)}个用户, {len(files)}个文件({total / 1024 / 1024:.1f}MB), "
+              f"{len(self.corpus.shared)}个分享链接, 耗时{time.perf_counter() - start:.1f}s")
+
+    async def worker(self, deadline: float):
+        operations, weights = list(self.weights), list(self.weights.values())
+        while time.perf_counter() < deadline:
+            operation = self.rng.choices(operations, weights)[0]
+            await getattr(self, f"op_{operation}")()
+
+    async def run_level(self, concurrency: int) -> dict:
+        if self.args.warmup > 0:
+            deadline = time.perf_counter() + self.args.warmup
+            await asyncio.gather(*(self.worker(deadline) for _ in range(concurrency)))
+        self.stats = {}
+        self.memory.reset()
+        self.recording = True
+        start = time.perf_counter()
+        await asyncio.gather(*(self.worker(start + self.args.duration) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        self.recording = False
+
+        endpoints = {}
+        for endpoint in sorted(self.stats, key=lambda name: -len(self.stats[name].latencies)):
+            endpoints[endpoint] = self.stats[endpoint].summary(elapsed)
+            if self.memory.enabled:
+                peak = self.memory.peaks.get(endpoint)
+                endpoints[endpoint]["mem_peak_mb"] = peak / 1024 / 1024 if peak else None
+        requests = sum(item["count"] for item in endpoints.values())
+        level = {
+            "concurrency": concurrency,
+            "elapsed_s": elapsed,
+            "requests": requests,
+            "rps": requests / elapsed if elapsed > 0 else 0.0,
+            "errors": sum(item["errors"] for item in endpoints.values()),
+            "endpoints": endpoints,
+        }
+        if self.memory.enabled:
+            level["memory"] = {"baseline_mb": self.memory.baseline / 1024 / 1024, "peak_mb": self.memory.peak / 1024 / 1024}
+        return level
+
+    async def cleanup(self):
+        """注销测试账户，服务端随之删除其文件"""
+        coroutines = (self.client.request("DELETE", "/api/auth/delete-account", headers=self.auth(user), json={
+            "username": user["username"], "email": user["email"], "password": user["password"]})
+            for user in self.corpus.users if user["token"])
+        await self.gather_limited(coroutines, self.args.seed_concurrency)
+
+    async def run(self) -> list:
+        levels = []
+        self.memory.start()
+        try:
+            await self.seed()
+            for concurrency in self.args.concurrency:
+                level = await self.run_level(concurrency)
+                print_level(level)
+                levels.append(level)
+        finally:
+            self.memory.stop()
+            if not self.args.keep:
+                # 令牌可能已过期，清理前重新登录
+                await self.gather_limited((self.op_login(user) for user in list(self.corpus.users)), self.args.seed_concurrency)
+                await self.cleanup()
+        return levels
+
+
+def print_level(level: dict):
+    memory = level.get("memory")
+    memory_text = f", 内存 {memory['baseline_mb']:.0f}->{memory['peak_mb']:.0f}MB" if memory else ""
+    print(f"\n并发 {level['concurrency']}: {level['requests']}个请求, {level['rps']:.1f} req/s, "
+          f"{level['errors']}个错误{memory_text}")
+    print(f"{'接口':<14} {'请求数':>7} {'错误':>5} {'req/s':>8} {'MB/s':>8} {'p50(ms)':>9} {'p95(ms)':>9} "
+          f"{'p99(ms)':>9} {'max(ms)':>9} {'内存峰值(MB)':>12}")
+    for endpoint, item in level["endpoints"].items():
+        peak = item.get("mem_peak_mb")
+        peak_text = f"{peak:.0f}" if peak else "-"
+        print(f"{endpoint:<14} {item['count']:>7} {item['errors']:>5} {item['rps']:>8.1f} {item['mb_s']:>8.1f} "
+              f"{item['p50_ms']:>9.1f} {item['p95_ms']:>9.1f} {item['p99_ms']:>9.1f} {item['max_ms']:>9.1f} {peak_text:>12}")
+        failed = {status: count for status, count in item["statuses"].items() if not status.startswith("2")}
+        if failed:
+            print(f"{'':<14} 错误状态: {failed}")
+
+
+def bench_environment(work_dir: str) -> dict:
+    """临时数据库与测试用密钥；缓存后端默认使用进程内缓存，可由环境变量覆盖"""
+    return {
+        "DATABASE_URL": f"sqlite:///{os.path.join(work_dir, 'load.db')}",
+        "WENXI_FILE_STORAGE_PATH": "./uploads",
+        "WENXI_CACHE_BACKEND": os.environ.get("WENXI_CACHE_BACKEND", "memory"),
+        "WENXI_ENCRYPTION_KEY": os.environ.get("WENXI_ENCRYPTION_KEY", "wenxi-bench-key"),
+        "WENXI_ENCRYPTION_SALT": os.environ.get("WENXI_ENCRYPTION_SALT", "wenxi-bench-salt"),
+        "WENXI_JWT_SECRET_KEY": os.environ.get("WENXI_JWT_SECRET_KEY", "wenxi-bench-secret-key-for-hs256-signing"),
+        "WENXI_JWT_EXPIRE_MINUTES": "600",
+        "WENXI_LOG_LEVEL": os.environ.get("WENXI_LOG_LEVEL", "WARNING"),
+    }
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_in_process(args, work_dir: str) -> list:
+    """在当前进程内运行应用（含启动/关闭生命周期），经ASGITransport调用"""
+    os.environ.update(bench_environment(work_dir))
+    sys.path.insert(0, BACKEND_DIR)
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://wenxi", timeout=args.timeout) as client:
+            return await LoadTest(client, args, MemorySampler(os.getpid())).run()
+
+
+async def run_against(base_url: str, args, pid: int = None) -> list:
+    limits = httpx.Limits(max_connections=max(args.concurrency + [args.seed_concurrency]) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        return await LoadTest(client, args, MemorySampler(pid)).run()
+
+
+def run_uvicorn(args, work_dir: str) -> list:
+    """在独立的uvicorn进程中运行应用，内存只统计服务进程"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=dict(os.environ, **bench_environment(work_dir))
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for _ in range(300):
+            try:
+                httpx.get(f"{base_url}/health")
+                break
+            except httpx.TransportError:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn启动失败")
+                time.sleep(0.1)
+        return asyncio.run(run_against(base_url, args, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi端到端负载测试")
+    parser.add_argument("--mix", default="mixed", help=f"请求混合：预设{'/'.join(MIXES)}或\"操作=权重\"列表，操作：{','.join(OPERATIONS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="逗号分隔的并发数，依次各运行一轮")
+    parser.add_argument("--duration", type=float, default=20.0, help="每轮测量时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每轮测量前的预热时长（秒，不计入统计）")
+    parser.add_argument("--users", type=int, default=20, help="语料用户数")
+    parser.add_argument("--files-per-user", type=int, default=20, help="每个用户预先上传的文件数")
+    parser.add_argument("--min-file-size", default="1K", help="文件大小下限（对数均匀分布）")
+    parser.add_argument("--max-file-size", default="4M", help="文件大小上限")
+    parser.add_argument("--dup-ratio", type=float, default=0.1, help="重复内容的上传比例（触发去重）")
+    parser.add_argument("--share-ratio", type=float, default=0.3, help="语料中分享的文件比例")
+    parser.add_argument("--chunked-size", default="8M", help="分块上传的文件大小")
+    parser.add_argument("--chunk-size", default="2M", help="分块上传的块大小")
+    parser.add_argument("--part-concurrency", type=int, default=2, help="分块上传时并行上传的分块数")
+    parser.add_argument("--page-size", type=int, default=50, help="列表与搜索每页条数")
+    parser.add_argument("--seed-concurrency", type=int, default=8, help="生成语料与清理时的并发数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子（操作序列与文件名/大小）")
+    parser.add_argument("--timeout", type=float, default=300.0, help="单个请求超时（秒）")
+    parser.add_argument("--uvicorn", action="store_true", help="在独立的uvicorn进程中运行应用")
+    parser.add_argument("--url", default="", help="对已运行的实例施压（不使用临时数据库）")
+    parser.add_argument("--server-pid", type=int, default=None, help="配合--url：本机服务进程PID，用于采样内存")
+    parser.add_argument("--keep", action="store_true", help="结束时保留测试账户与文件")
+    parser.add_argument("--output", default="", help="结果JSON路径")
+    args = parser.parse_args()
+
+    try:
+        weights = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    args.concurrency = [int(value) for value in args.concurrency.split(",") if value.strip()]
+    for name in ("min_file_size", "max_file_size", "chunked_size", "chunk_size"):
+        setattr(args, name, parse_size(getattr(args, name)))
+    mode = "url" if args.url else "uvicorn" if args.uvicorn else "asgi"
+
+    print(f"Wenxi - 端到端负载测试: 模式{mode}, 混合{weights}, 并发{args.concurrency}, 每轮{args.duration}s")
+    with tempfile.TemporaryDirectory(prefix="wenxi-load-") as work_dir:
+        if mode == "url":
+            levels = asyncio.run(run_against(args.url.rstrip("/"), args, args.server_pid))
+        elif mode == "uvicorn":
+            levels = run_uvicorn(args, work_dir)
+        else:
+            levels = asyncio.run(run_in_process(args, work_dir))
+
+    if args.output:
+        meta = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "mode": mode,
+            "mix": weights,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "levels": levels}, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
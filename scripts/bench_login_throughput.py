@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 登录吞吐量测试
+作者：Wenxi
+功能：启动独立的后端进程，分别测量单独登录、单独下载、两者同时进行时的登录吞吐量/延迟与下载吞吐量
+用法：python scripts/bench_login_throughput.py [--logins 16] [--downloads 4] [--file-mb 32] [--seconds 5]
+说明：使用临时数据库；下载按backend/uploads解析路径，测试文件存于该目录并在结束时通过接口删除；
+      --backend-dir可指向其他版本的backend目录做对比
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+DEFAULT_BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction: float) -> float:
+    """计算百分位数（毫秒）"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+
+
+async def run_benchmark(base_url: str, args) -> None:
+    """注册用户、上传下载用文件，然后测量三种场景"""
+    credentials = {"username": "bench", "password": "bench-password"}
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        await client.post("/api/auth/register", json={**credentials, "email": "bench@example.com"})
+        response = await client.post("/api/auth/login", data=credentials)
+        token = response.json()["access_token"]
+        response = await client.post("/api/files/upload", headers={"Authorization": f"Bearer {token}"},
+                                     files={"file": ("large.bin", os.urandom(args.file_mb * 1024 * 1024))})
+        file_id = response.json()["id"]
+
+        async def login_loop(stop: asyncio.Event, latencies: list, rejected: list):
+            while not stop.is_set():
+                start = time.perf_counter()
+                response = await client.post("/api/auth/login", data=credentials)
+                if response.status_code == 503:
+                    rejected.append(1)
+                    continue
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        async def download_loop(stop: asyncio.Event, received: list):
+            while not stop.is_set():
+                async with client.stream("GET", f"/api/files/download/{file_id}", params={"token": token}) as response:
+                    async for data in response.aiter_bytes():
+                        received.append(len(data))
+
+        async def measure(logins: int, downloads: int):
+            stop = asyncio.Event()
+            latencies, rejected, received = [], [], []
+            tasks = [asyncio.create_task(login_loop(stop, latencies, rejected)) for _ in range(logins)]
+            tasks += [asyncio.create_task(download_loop(stop, received)) for _ in range(downloads)]
+            await asyncio.sleep(args.seconds)
+            stop.set()
+            await asyncio.gather(*tasks)
+            return latencies, len(rejected), sum(received)
+
+        print(f"Wenxi - 登录吞吐量测试: {args.logins}个并发登录, {args.downloads}个并发下载 x {args.file_mb}MB, 每场景{args.seconds}s")
+        print(f"{'场景':<10} {'登录/s':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'503次数':>8} {'下载MB/s':>10}")
+        scenarios = (("仅登录", args.logins, 0), ("仅下载", 0, args.downloads), ("同时进行", args.logins, args.downloads))
+        for label, logins, downloads in scenarios:
+            latencies, rejected, received = await measure(logins, downloads)
+            print(f"{label:<10} {len(latencies) / args.seconds:>8.1f} {percentile(latencies, 0.50):>9.1f} "
+                  f"{percentile(latencies, 0.99):>9.1f} {rejected:>8} {received / args.seconds / 1024 / 1024:>10.1f}")
+
+        await client.delete(f"/api/files/{file_id}", headers={"Authorization": f"Bearer {token}"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi登录吞吐量测试")
+    parser.add_argument("--logins", type=int, default=16, help="并发登录数")
+    parser.add_argument("--downloads", type=int, default=4, help="并发下载数")
+    parser.add_argument("--file-mb", type=int, default=32, help="下载文件大小（MB）")
+    parser.add_argument("--seconds", type=float, default=5.0, help="每个场景的测量时长（秒）")
+    parser.add_argument("--backend-dir", default=DEFAULT_BACKEND_DIR, help="被测backend目录")
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(work_dir, 'bench.db')}",
+            WENXI_FILE_STORAGE_PATH="./uploads",
+            WENXI_ENCRYPTION_KEY=os.environ.get("WENXI_ENCRYPTION_KEY", "wenxi-bench-key"),
+            WENXI_ENCRYPTION_SALT=os.environ.get("WENXI_ENCRYPTION_SALT", "wenxi-bench-salt"),
+            WENXI_JWT_SECRET_KEY=os.environ.get("WENXI_JWT_SECRET_KEY", "wenxi-bench-secret"),
+            WENXI_JWT_EXPIRE_MINUTES="60",
+            WENXI_LOG_LEVEL="WARNING",
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.abspath(args.backend_dir), env=env
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            for _ in range(100):
+                try:
+                    httpx.get(f"{base_url}/health")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            asyncio.run(run_benchmark(base_url, args))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
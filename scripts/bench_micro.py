@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 热点路径微基准
+作者：Wenxi
+功能：测量encrypt_file、decrypt_file、encrypt_stream、calculate_file_hash、derive_key、JWT签发+校验、bcrypt校验，
+      覆盖不同文件大小与块大小，结果写为JSON，并可与保存的基线对比、标记性能回退
+用法：python scripts/bench_micro.py [--preset quick|full] [--sizes 1K,16M] [--chunks 64K,1M] [--only encrypt_file,jwt]
+                                   [--output results.json] [--baseline baseline.json] [--threshold 0.15]
+      python scripts/bench_micro.py --preset full --output baseline.json   # 在基准分支上生成基线
+说明：完全离线运行，只依赖本仓库的requirements；测试文件写入临时目录（--work-dir指定磁盘），磁盘空间不足的大小会跳过。
+      刚写入的文件会命中页缓存，测得的是CPU与内存带宽而非磁盘；只有同一台机器上的结果才可比较。
+      存在性能回退时退出码为1，可直接用于CI
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timezone
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+PRESETS = {
+    "quick": {"sizes": "1K,1M,16M", "chunks": "64K,1M,4M"},
+    "full": {"sizes": "1K,64K,1M,16M,256M,2G", "chunks": "64K,256K,1M,4M"},
+}
+BENCHES = ["encrypt_file", "decrypt_file", "encrypt_stream", "calculate_file_hash", "derive_key", "jwt", "bcrypt_verify"]
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    """解析1K、64KiB、2G等大小（按1024进位）"""
+    value = text.strip().upper().replace("IB", "").replace("B", "")
+    if value and value[-1] in UNITS:
+        return int(float(value[:-1]) * UNITS[value[-1]])
+    return int(value)
+
+
+def format_size(size: int) -> str:
+    for unit in ("G", "M", "K"):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f"{size // UNITS[unit]}{unit}"
+    return str(size)
+
+
+def measure(func, min_runs: int, min_time: float, max_runs: int, warmup: bool = True) -> list:
+    """重复执行直到达到最少次数且累计时间达到min_time（或达到max_runs），返回每次耗时"""
+    if warmup:
+        func()
+    durations = []
+    started = time.perf_counter()
+    while len(durations) < min_runs or (time.perf_counter() - started < min_time and len(durations) < max_runs):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def check(name: str, ok: bool):
+    """encrypt_file/decrypt_file失败时返回False而不抛异常，基准中视为错误"""
+    if not ok:
+        raise RuntimeError(f"{name}失败")
+
+
+def summarize(bench: str, durations: list, size: int = None, chunk_size: int = None) -> dict:
+    median = statistics.median(durations)
+    result = {
+        "bench": bench,
+        "size": size,
+        "chunk_size": chunk_size,
+        "runs": len(durations),
+        "min_s": min(durations),
+        "median_s": median,
+        "mean_s": statistics.fmean(durations),
+        "stdev_s": statistics.stdev(durations) if len(durations) > 1 else 0.0,
+    }
+    if size:
+        result["mb_s"] = size / median / 1024 / 1024 if median > 0 else 0.0
+    else:
+        result["ops_s"] = 1 / median if median > 0 else 0.0
+    return result
+
+
+def result_key(result: dict) -> str:
+    return f"{result['bench']}|{result['size']}|{result['chunk_size']}"
+
+
+def write_plain_file(path: str, size: int):
+    """写入随机内容的测试文件（大文件重复同一个1MB随机块）"""
+    block = os.urandom(min(size, 1024 * 1024))
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+def print_result(result: dict):
+    size = format_size(result["size"]) if result["size"] else "-"
+    chunk = format_size(result["chunk_size"]) if result["chunk_size"] else "-"
+    rate = f"{result['mb_s']:10.1f} MB/s" if "mb_s" in result else f"{result['ops_s']:10.1f} op/s"
+    print(f"{result['bench']:<20} {size:>6} {chunk:>6} {result['runs']:>5} {result['median_s'] * 1000:>12.3f} {rate}")
+
+
+def run_file_benches(args, selected: set, sizes: list, chunks: list) -> list:
+    from utils.encryption import encrypt_file, decrypt_file, encrypt_stream
+    from routers.files import calculate_file_hash
+
+    results = []
+    for size in sizes:
+        if shutil.disk_usage(args.work_dir).free < 3 * size + 64 * 1024 * 1024:
+            print(f"跳过 {format_size(size)}：{args.work_dir} 剩余空间不足（需要约3倍文件大小）")
+            continue
+        work_dir = tempfile.mkdtemp(prefix="wenxi-bench-", dir=args.work_dir)
+        try:
+            plain_path = os.path.join(work_dir, "plain")
+            cipher_path = os.path.join(work_dir, "cipher")
+            output_path = os.path.join(work_dir, "output")
+            write_plain_file(plain_path, size)
+            warmup = size <= 16 * 1024 * 1024
+            runs = dict(min_runs=args.min_runs, min_time=args.min_time, max_runs=args.max_runs, warmup=warmup)
+
+            for chunk_size in chunks:
+                if "encrypt_file" in selected:
+                    durations = measure(lambda: check("encrypt_file", encrypt_file(plain_path, cipher_path, chunk_size=chunk_size)), **runs)
+                    results.append(summarize("encrypt_file", durations, size, chunk_size))
+                    print_result(results[-1])
+                if "decrypt_file" in selected:
+                    check("encrypt_file", encrypt_file(plain_path, cipher_path, chunk_size=chunk_size))
+                    durations = measure(lambda: check("decrypt_file", decrypt_file(cipher_path, output_path)), **runs)
+                    results.append(summarize("decrypt_file", durations, size, chunk_size))
+                    print_result(results[-1])
+                    os.remove(output_path)
+
+            if "encrypt_stream" in selected:
+                if size > args.max_memory:
+                    print(f"跳过 encrypt_stream {format_size(size)}：超过--max-memory（整块在内存中加密）")
+                else:
+                    with open(plain_path, "rb") as f:
+                        data = f.read()
+                    durations = measure(lambda: encrypt_stream(data), **runs)
+                    results.append(summarize("encrypt_stream", durations, size))
+                    print_result(results[-1])
+                    del data
+
+            if "calculate_file_hash" in selected:
+                durations = measure(lambda: calculate_file_hash(plain_path), **runs)
+                results.append(summarize("calculate_file_hash", durations, size))
+                print_result(results[-1])
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def run_auth_benches(args, selected: set) -> list:
+    import jwt
+    from datetime import timedelta
+    from utils.encryption import SALT, clear_key_cache, derive_key
+    from utils.password_pool import password_hasher
+    from routers.auth import ALGORITHM, SECRET_KEY, create_access_token
+
+    results = []
+    runs = dict(min_runs=args.min_runs, min_time=args.min_time, max_runs=args.max_runs)
+    if "derive_key" in selected:
+        def derive_cold():
+            clear_key_cache()
+            derive_key("wenxi-bench-password", SALT)
+        results.append(summarize("derive_key", measure(derive_cold, **runs)))
+        print_result(results[-1])
+        results.append(summarize("derive_key_cached", measure(lambda: derive_key("wenxi-bench-password", SALT),
+                                                              min_runs=1000, min_time=args.min_time, max_runs=100000)))
+        print_result(results[-1])
+        clear_key_cache()
+
+    if "jwt" in selected:
+        def issue_and_verify():
+            token = create_access_token({"sub": "bench", "remember_me": False}, timedelta(minutes=30))
+            jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        results.append(summarize("jwt", measure(issue_and_verify, min_runs=1000, min_time=args.min_time, max_runs=100000)))
+        print_result(results[-1])
+
+    if "bcrypt_verify" in selected:
+        hashed = password_hasher.context.hash("wenxi-bench-password")
+        results.append(summarize("bcrypt_verify", measure(
+            lambda: password_hasher.context.verify("wenxi-bench-password", hashed), **runs)))
+        print_result(results[-1])
+    return results
+
+
+def environment_info() -> dict:
+    import cryptography
+    from utils.password_pool import BCRYPT_ROUNDS
+    from utils.encryption import KEY_DERIVATION_ITERATIONS
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "cryptography": cryptography.__version__,
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "pbkdf2_iterations": KEY_DERIVATION_ITERATIONS,
+    }
+
+
+def compare(results: list, meta: dict, baseline: dict, threshold: float) -> int:
+    """
+    与基线逐项比较最短耗时，返回回退项数
+    微基准是确定性的CPU计算，最短耗时最接近真实成本，受调度与页缓存抖动的影响远小于中位数
+    """
+    reference = {result_key(item): item for item in baseline.get("results", [])}
+    for field in ("machine", "cpu_count", "python", "cryptography", "bcrypt_rounds", "pbkdf2_iterations"):
+        if baseline.get("meta", {}).get(field) != meta.get(field):
+            print(f"注意：基线的{field}为{baseline.get('meta', {}).get(field)}，本次为{meta.get(field)}，对比结果仅供参考")
+
+    regressions = 0
+    print(f"\n与基线对比（阈值±{threshold:.0%}）")
+    print(f"{'项目':<20} {'大小':>6} {'块':>6} {'基线min(ms)':>12} {'本次min(ms)':>12} {'变化':>8}  结论")
+    for result in results:
+        base = reference.get(result_key(result))
+        size = format_size(result["size"]) if result["size"] else "-"
+        chunk = format_size(result["chunk_size"]) if result["chunk_size"] else "-"
+        if base is None:
+            print(f"{result['bench']:<20} {size:>6} {chunk:>6} {'-':>12} {result['min_s'] * 1000:>12.3f} {'-':>8}  新增")
+            continue
+        ratio = result["min_s"] / base["min_s"] if base["min_s"] > 0 else 1.0
+        if ratio > 1 + threshold:
+            verdict = "回退"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            verdict = "提升"
+        else:
+            verdict = "持平"
+        result["baseline_min_s"] = base["min_s"]
+        result["change"] = ratio - 1
+        result["verdict"] = verdict
+        print(f"{result['bench']:<20} {size:>6} {chunk:>6} {base['min_s'] * 1000:>12.3f} "
+              f"{result['min_s'] * 1000:>12.3f} {ratio - 1:>+8.1%}  {verdict}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi热点路径微基准")
+    parser.add_argument("--preset", default="quick", choices=sorted(PRESETS), help="大小与块大小预设")
+    parser.add_argument("--sizes", default="", help="逗号分隔的文件大小，如1K,1M,2G（覆盖预设）")
+    parser.add_argument("--chunks", default="", help="逗号分隔的v3块大小，如64K,4M（覆盖预设）")
+    parser.add_argument("--only", default="", help=f"只运行这些项目：{','.join(BENCHES)}")
+    parser.add_argument("--min-runs", type=int, default=3, help="每项最少测量次数")
+    parser.add_argument("--max-runs", type=int, default=50, help="每项最多测量次数")
+    parser.add_argument("--min-time", type=float, default=1.0, help="每项最少累计测量时间（秒）")
+    parser.add_argument("--max-memory", default="256M", help="encrypt_stream整块在内存中加密，超过此大小跳过")
+    parser.add_argument("--work-dir", default=tempfile.gettempdir(), help="测试文件所在目录")
+    parser.add_argument("--output", default="", help="结果JSON路径")
+    parser.add_argument("--baseline", default="", help="基线JSON路径（此前某次--output的结果）")
+    parser.add_argument("--threshold", type=float, default=0.15, help="最短耗时变化超过该比例视为回退/提升")
+    args = parser.parse_args()
+    args.max_memory = parse_size(args.max_memory)
+
+    selected = set(args.only.split(",")) if args.only else set(BENCHES)
+    unknown = selected - set(BENCHES)
+    if unknown:
+        parser.error(f"未知项目: {','.join(sorted(unknown))}")
+    sizes = [parse_size(value) for value in (args.sizes or PRESETS[args.preset]["sizes"]).split(",") if value]
+    chunks = [parse_size(value) for value in (args.chunks or PRESETS[args.preset]["chunks"]).split(",") if value]
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        os.environ.update(
+            DATABASE_URL=f"sqlite:///{os.path.join(db_dir, 'bench.db')}",
+            WENXI_ENCRYPTION_KEY=os.environ.get("WENXI_ENCRYPTION_KEY", "wenxi-bench-key"),
+            WENXI_ENCRYPTION_SALT=os.environ.get("WENXI_ENCRYPTION_SALT", "wenxi-bench-salt"),
+            WENXI_JWT_SECRET_KEY=os.environ.get("WENXI_JWT_SECRET_KEY", "wenxi-bench-secret-key-for-hs256-signing"),
+            WENXI_JWT_EXPIRE_MINUTES=os.environ.get("WENXI_JWT_EXPIRE_MINUTES", "60"),
+            WENXI_LOG_LEVEL="WARNING",
+        )
+        meta = environment_info()
+        print(f"Wenxi - 微基准: {meta['platform']}, CPU核心数 {meta['cpu_count']}, "
+              f"Python {meta['python']}, cryptography {meta['cryptography']}")
+        print(f"{'项目':<20} {'大小':>6} {'块':>6} {'次数':>5} {'中位数(ms)':>12} {'吞吐':>15}")
+
+        from utils.encryption import warm_key_cache
+        warm_key_cache()  # 文件加解密不计入首次PBKDF2
+        results = run_file_benches(args, selected, sizes, chunks) + run_auth_benches(args, selected)
+
+    regressions = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, meta, json.load(f), args.threshold)
+        print(f"\n{regressions}项回退" if regressions else "\n无性能回退")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Wenxi网盘 - 上传流水线基准测试
+作者：Wenxi
+功能：对比旧版多遍上传流程与单遍流水线的I/O放大倍数和吞吐量
+旧版：multipart落盘 -> 复制到.tmp -> 重读计算哈希 -> 重读并加密写盘
+新版：请求体边到达边解析，同一遍内完成哈希与加密写盘
+用法：python scripts/bench_upload_pipeline.py [--size-mb 1024] [--dir /tmp]
+"""
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+# 添加backend到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+PIECE_SIZE = 1024 * 1024  # 模拟网络每次到达1MB请求体
+SPOOL_MAX_SIZE = 1024 * 1024  # Starlette UploadFile内存缓冲上限
+BOUNDARY = "wenxibenchboundary"
+
+
+def read_io_counters() -> dict:
+    """读取当前进程的系统调用级读写字节数（Linux /proc/self/io）"""
+    try:
+        with open("/proc/self/io") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+        return {"read": int(values["rchar"]), "written": int(values["wchar"])}
+    except (OSError, KeyError, ValueError):
+        return {"read": 0, "written": 0}
+
+
+def body_pieces(size: int):
+    """生成multipart请求体分片：表单头 + 随机文件内容 + 结尾边界"""
+    yield (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.bin\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode()
+    block = os.urandom(PIECE_SIZE)
+    remaining = size
+    while remaining > 0:
+        piece = block[:min(PIECE_SIZE, remaining)]
+        remaining -= len(piece)
+        yield piece
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def legacy_pipeline(size: int, work_dir: str) -> None:
+    """旧版流程：UploadFile落盘 + .tmp副本 + 4KB块哈希 + encrypt_file"""
+    from utils.encryption import encrypt_file
+    from utils.multipart_stream import StreamingFormParser
+
+    parser = StreamingFormParser(f"multipart/form-data; boundary={BOUNDARY}")
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, dir=work_dir)
+    for piece in body_pieces(size):
+        spool.write(parser.feed(piece))
+    spool.write(parser.finish())
+    spool.seek(0)
+
+    temp_path = os.path.join(work_dir, "legacy.tmp")
+    output_path = os.path.join(work_dir, "legacy.enc")
+    with open(temp_path, "wb") as buffer:
+        shutil.copyfileobj(spool, buffer, 32 * 1024 * 1024)
+    spool.close()
+
+    sha256_hash = hashlib.sha256()
+    with open(temp_path, "rb") as f:
+        for byte_block in iter(lambda: f.read(4096), b""):
+            sha256_hash.update(byte_block)
+
+    encrypt_file(temp_path, output_path)
+    os.remove(temp_path)
+    os.remove(output_path)
+
+
+def single_pass_pipeline(size: int, work_dir: str) -> None:
+    """新版流程：流式解析 + 同遍哈希与加密"""
+    from utils.encryption import EncryptStream
+    from utils.multipart_stream import StreamingFormParser
+
+    parser = StreamingFormParser(f"multipart/form-data; boundary={BOUNDARY}")
+    output_path = os.path.join(work_dir, "single.enc")
+    hasher = hashlib.sha256()
+    encryptor = EncryptStream(output_path)
+    for piece in body_pieces(size):
+        data = parser.feed(piece)
+        hasher.update(data)
+        encryptor.write(data)
+    data = parser.finish()
+    hasher.update(data)
+    encryptor.write(data)
+    encryptor.close()
+    os.remove(output_path)
+
+
+def run(label: str, pipeline, size: int, work_dir: str) -> dict:
+    """执行一次流水线并统计耗时与I/O"""
+    before = read_io_counters()
+    start = time.perf_counter()
+    pipeline(size, work_dir)
+    elapsed = time.perf_counter() - start
+    after = read_io_counters()
+
+    read_bytes = after["read"] - before["read"]
+    written_bytes = after["written"] - before["written"]
+    result = {
+        "label": label,
+        "seconds": elapsed,
+        "throughput_mb_s": size / elapsed / 1024 / 1024,
+        "read_amplification": read_bytes / size,
+        "write_amplification": written_bytes / size,
+    }
+    print(f"{label:<14} {elapsed:8.2f}s  {result['throughput_mb_s']:8.2f}MB/s  "
+          f"读放大 {result['read_amplification']:.2f}x  写放大 {result['write_amplification']:.2f}x")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wenxi上传流水线基准测试")
+    parser.add_argument("--size-mb", type=int, default=1024, help="模拟上传文件大小（MB）")
+    parser.add_argument("--dir", default=None, help="临时文件目录（默认系统临时目录）")
+    args = parser.parse_args()
+
+    from utils.encryption import warm_key_cache
+    warm_key_cache()
+
+    size = args.size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory(dir=args.dir) as work_dir:
+        print(f"Wenxi - 上传流水线基准: {args.size_mb}MB")
+        legacy = run("旧版多遍流程", legacy_pipeline, size, work_dir)
+        single = run("单遍流水线", single_pass_pipeline, size, work_dir)
+
+    print(f"吞吐量提升: {single['throughput_mb_s'] / legacy['throughput_mb_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Wenxi网盘 - 缓存后端测试
+作者：Wenxi
+功能：验证进程内LRU缓存、Redis管道读写，以及Redis故障时的熔断与回退、未送达删除的重放
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from utils import cache as cache_module
+from utils.cache import CircuitBreaker, MemoryCache, RedisCache
+
+
+class FakePipeline:
+    """记录管道命令的假Redis管道"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, key, value, px=None):
+        self.commands.append((key, value))
+
+    async def execute(self):
+        self.client._check()
+        self.client.data.update(self.commands)
+
+
+class FakeRedis:
+    """最小化的假Redis客户端，可模拟连接失败"""
+
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+        self.down = False
+
+    def _check(self):
+        self.round_trips += 1
+        if self.down:
+            raise ConnectionError("redis down")
+
+    async def mget(self, keys):
+        self._check()
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def delete(self, *keys):
+        self._check()
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def aclose(self):
+        pass
+
+
+class TestMemoryCache(unittest.IsolatedAsyncioTestCase):
+    """测试进程内缓存"""
+
+    async def test_ttl_and_lru(self):
+        """测试过期与容量淘汰"""
+        cache = MemoryCache(max_size=2)
+        with patch.object(cache_module.time, "monotonic", return_value=100.0):
+            await cache.set("a", "1", ttl=10)
+            await cache.set("b", "2", ttl=60)
+            await cache.set("c", "3", ttl=60)
+            self.assertIsNone(await cache.get("a"))
+        with patch.object(cache_module.time, "monotonic", return_value=120.0):
+            self.assertEqual(await cache.get_many(["b", "c"]), ["2", "3"])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+class TestRedisCache(unittest.IsolatedAsyncioTestCase):
+    """测试Redis缓存与熔断"""
+
+    def setUp(self):
+        self.client = FakeRedis()
+        self.cache = RedisCache(client=self.client, breaker=CircuitBreaker(failure_threshold=2, cooldown=30))
+
+    async def test_batch_operations_use_one_round_trip(self):
+        """测试批量写入用管道、批量读取用MGET"""
+        await self.cache.set_many({"a": "1", "b": "2", "c": "3"}, ttl=60)
+        self.assertEqual(self.client.round_trips, 1)
+        self.assertEqual(await self.cache.get_many(["a", "b", "x"]), ["1", "2", None])
+        self.assertEqual(self.client.round_trips, 2)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    async def test_breaker_skips_redis_during_cooldown(self):
+        """测试连续失败后冷却期内不再访问Redis，改用进程内缓存"""
+        self.client.down = True
+        with patch.object(cache_module.time, "monotonic", return_value=100.0):
+            await self.cache.set("a", "1", ttl=600)
+            await self.cache.get("a")
+            self.assertEqual(self.cache.breaker.state, "open")
+            attempts = self.client.round_trips
+            for _ in range(10):
+                self.assertEqual(await self.cache.get("a"), "1")
+            self.assertEqual(self.client.round_trips, attempts)
+
+        # 冷却结束后试探成功，恢复使用Redis
+        self.client.down = False
+        with patch.object(cache_module.time, "monotonic", return_value=200.0):
+            self.assertIsNone(await self.cache.get("a"))
+            self.assertEqual(self.cache.breaker.state, "closed")
+        self.assertEqual(self.cache.stats()["circuit_trips"], 1)
+
+    async def test_delete_clears_fallback(self):
+        """测试删除同时作用于回退缓存，Redis恢复后再次熔断也不会读到旧值"""
+        await self.cache.fallback.set("a", "stale", ttl=600)
+        await self.cache.delete("a")
+        self.assertIsNone(await self.cache.fallback.get("a"))
+
+
+    async def test_failed_delete_replayed_after_recovery(self):
+        """测试熔断期间的删除排队，Redis恢复后先重放再读取，不会读到旧值"""
+        self.client.data["a"] = "stale"
+        self.client.down = True
+        with patch.object(cache_module.time, "monotonic", return_value=100.0):
+            await self.cache.get("x")
+            await self.cache.delete("a")  # 本次失败后熔断
+            await self.cache.delete("b")  # 熔断期间不访问Redis
+            self.assertEqual(self.cache.breaker.state, "open")
+            self.assertEqual(self.cache.stats()["pending_deletes"], 2)
+
+        self.client.down = False
+        with patch.object(cache_module.time, "monotonic", return_value=200.0):
+            self.assertIsNone(await self.cache.get("a"))
+        self.assertNotIn("a", self.client.data)
+        self.assertEqual(self.cache.stats()["pending_deletes"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
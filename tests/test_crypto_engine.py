@@ -0,0 +1,92 @@
+"""
+Wenxi网盘 - 多核加解密引擎测试
+作者：Wenxi
+功能：验证分片并行加解密结果与单线程格式互通
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from utils import crypto_engine as engine_module
+from utils.crypto_engine import CryptoEngine, plan_shards
+from utils.encryption import encrypt_file, _encrypt_file_v2, DecryptStream, CHUNK_SIZE
+
+
+class TestCryptoEngine(unittest.TestCase):
+    """测试并行加解密引擎"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.plain_path = os.path.join(self.temp_dir.name, "plain")
+        self.cipher_path = os.path.join(self.temp_dir.name, "cipher")
+        self.output_path = os.path.join(self.temp_dir.name, "output")
+        self.content = os.urandom(CHUNK_SIZE * 7 + 321)
+        with open(self.plain_path, 'wb') as f:
+            f.write(self.content)
+        self.engine = CryptoEngine(workers=3, executor_type="thread")
+
+        # 缩小分片阈值，使小文件也走多分片路径
+        self.patchers = [
+            patch.object(engine_module, "SHARD_SIZE", CHUNK_SIZE * 2),
+            patch.object(engine_module, "PARALLEL_THRESHOLD", 0),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.engine.shutdown()
+        self.temp_dir.cleanup()
+
+    def test_plan_shards_covers_file(self):
+        """测试分片互不重叠且覆盖全部数据"""
+        size = CHUNK_SIZE * 5 + 10
+        shards = plan_shards(size, CHUNK_SIZE, CHUNK_SIZE * 2)
+        self.assertEqual([shard[0] for shard in shards], [0, 2, 4])
+        self.assertEqual(sum(shard[2] for shard in shards), size)
+        self.assertEqual(plan_shards(0, CHUNK_SIZE), [])
+
+    def test_parallel_encrypt_readable_by_stream(self):
+        """测试并行加密结果可被流式解密还原"""
+        self.assertTrue(asyncio.run(
+            self.engine.encrypt_file(self.plain_path, self.cipher_path, chunk_size=CHUNK_SIZE)
+        ))
+        self.assertEqual(b"".join(DecryptStream(self.cipher_path)), self.content)
+
+    def test_parallel_decrypt_of_serial_ciphertext(self):
+        """测试并行解密单线程加密的文件"""
+        self.assertTrue(encrypt_file(self.plain_path, self.cipher_path, chunk_size=CHUNK_SIZE))
+        self.assertTrue(asyncio.run(self.engine.decrypt_file(self.cipher_path, self.output_path)))
+        with open(self.output_path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_parallel_decrypt_of_v2_ciphertext(self):
+        """测试并行解密v2旧格式"""
+        self.assertTrue(_encrypt_file_v2(self.plain_path, self.cipher_path))
+        self.assertTrue(asyncio.run(self.engine.decrypt_file(self.cipher_path, self.output_path)))
+        with open(self.output_path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_decrypt_failure_cleans_output(self):
+        """测试密文损坏时解密失败并清理输出"""
+        self.assertTrue(encrypt_file(self.plain_path, self.cipher_path, chunk_size=CHUNK_SIZE))
+        offset = DecryptStream(self.cipher_path).layout.chunk_offset(5)
+        with open(self.cipher_path, 'r+b') as f:
+            f.seek(offset)
+            byte = f.read(1)
+            f.seek(offset)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        self.assertFalse(asyncio.run(self.engine.decrypt_file(self.cipher_path, self.output_path)))
+        self.assertFalse(os.path.exists(self.output_path))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
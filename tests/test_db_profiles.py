@@ -0,0 +1,79 @@
+"""
+Wenxi网盘 - 数据库引擎档位测试
+作者：Wenxi
+功能：验证档位解析、SQLite PRAGMA生效、连接池参数、异步URL转换和旧整数列加宽判断
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import BIGINT, INTEGER, text
+
+import database
+from database import build_engine, engine_options, needs_widening, resolve_profile, to_async_url
+from models import File as FileModel, FileBlob
+
+
+class TestEngineProfiles(unittest.TestCase):
+    """测试数据库引擎档位"""
+
+    def test_auto_profile_follows_url(self):
+        """测试auto按URL选择档位"""
+        self.assertEqual(resolve_profile("sqlite:///a.db"), "sqlite")
+        self.assertEqual(resolve_profile("mysql+pymysql://u:p@localhost/db"), "server")
+        self.assertEqual(resolve_profile("sqlite:///a.db", "DEFAULT"), "default")
+
+    def test_unknown_profile_rejected(self):
+        """测试未知档位报错"""
+        with self.assertRaises(ValueError):
+            resolve_profile("sqlite:///a.db", "turbo")
+
+    def test_sqlite_profile_applies_pragmas(self):
+        """测试sqlite档位的连接启用WAL和忙等待"""
+        with tempfile.TemporaryDirectory() as work_dir:
+            engine = build_engine(f"sqlite:///{os.path.join(work_dir, 'test.db')}", "sqlite")
+            with engine.connect() as conn:
+                self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+                self.assertEqual(conn.execute(text("PRAGMA synchronous")).scalar(), 1)
+                self.assertEqual(conn.execute(text("PRAGMA busy_timeout")).scalar(), 5000)
+            engine.dispose()
+
+    def test_default_profile_keeps_driver_defaults(self):
+        """测试default档位不修改连接设置"""
+        with tempfile.TemporaryDirectory() as work_dir:
+            engine = build_engine(f"sqlite:///{os.path.join(work_dir, 'test.db')}", "default")
+            with engine.connect() as conn:
+                self.assertEqual(conn.execute(text("PRAGMA journal_mode")).scalar(), "delete")
+            engine.dispose()
+
+    def test_pool_options(self):
+        """测试服务器档位的连接池参数，内存SQLite不使用连接池参数"""
+        options = engine_options("postgresql://u:p@localhost/db", "server")
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertEqual(options["pool_recycle"], 1800)
+        self.assertNotIn("pool_size", engine_options("sqlite://", "sqlite"))
+
+    def test_file_size_columns_widened(self):
+        """测试文件大小列在PostgreSQL/MySQL的旧INTEGER列上需要加宽，SQLite与已是BIGINT的列不需要"""
+        for column in (FileBlob.__table__.c.file_size, FileModel.__table__.c.file_size):
+            self.assertTrue(needs_widening("postgresql", column, INTEGER()))
+            self.assertTrue(needs_widening("mysql", column, INTEGER()))
+            self.assertFalse(needs_widening("postgresql", column, BIGINT()))
+            self.assertFalse(needs_widening("sqlite", column, INTEGER()))
+        self.assertFalse(needs_widening("postgresql", FileBlob.__table__.c.ref_count, INTEGER()))
+
+    def test_async_url(self):
+        """测试同步URL转换为异步驱动URL"""
+        self.assertEqual(to_async_url("sqlite:///a.db"), "sqlite+aiosqlite:///a.db")
+        self.assertEqual(to_async_url("mysql+pymysql://u:p@h/db"), "mysql+aiomysql://u:p@h/db")
+        self.assertEqual(to_async_url("sqlite+aiosqlite:///a.db"), "sqlite+aiosqlite:///a.db")
+        self.assertIn(database.DB_PROFILE, database.ENGINE_PROFILES)
+
+
+if __name__ == '__main__':
+    unittest.main()
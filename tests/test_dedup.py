@@ -0,0 +1,170 @@
+"""
+Wenxi网盘 - 内容去重测试
+作者：Wenxi
+功能：验证内容登记与引用计数、旧文件登记以及同内容并发任务合并
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, User, File as FileModel, FileBlob
+from utils.dedup import SingleFlight, find_blob, find_owned_blob, register_blob, release_blob
+
+CHECKSUM = "a" * 64
+
+
+class TestBlobRegistry(unittest.IsolatedAsyncioTestCase):
+    """测试内容登记与引用计数"""
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.db = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(username="wenxi", email="wenxi@example.com", hashed_password="x")
+        self.db.add(self.user)
+        await self.db.commit()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        await self.engine.dispose()
+
+    async def add_file(self, blob, name="a.txt"):
+        """按内容记录创建文件记录"""
+        db_file = FileModel(
+            filename=os.path.basename(blob.file_path), original_filename=name, file_path=blob.file_path,
+            file_size=blob.file_size, owner_id=self.user.id, checksum=blob.checksum, blob_id=blob.id
+        )
+        self.db.add(db_file)
+        await self.db.commit()
+        return db_file
+
+    async def test_register_same_content_shares_blob(self):
+        """测试相同内容第二次登记时复用已有内容"""
+        first, created = await register_blob(self.db, CHECKSUM, 100, "uploads/first")
+        await self.add_file(first)
+        second, second_created = await register_blob(self.db, CHECKSUM, 100, "uploads/second")
+        await self.add_file(second, "b.txt")
+
+        self.assertTrue(created)
+        self.assertFalse(second_created)
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(second.file_path, "uploads/first")
+        await self.db.refresh(first)
+        self.assertEqual(first.ref_count, 2)
+
+    async def test_find_blob_checks_size(self):
+        """测试大小不一致时不命中"""
+        blob, _ = await register_blob(self.db, CHECKSUM, 100, "uploads/first")
+        await self.add_file(blob)
+        self.assertIsNotNone(await find_blob(self.db, CHECKSUM, 100))
+        self.assertIsNone(await find_blob(self.db, CHECKSUM, 101))
+
+    async def test_release_returns_path_on_last_reference(self):
+        """测试最后一个引用释放后才返回待删除路径"""
+        blob, _ = await register_blob(self.db, CHECKSUM, 100, "uploads/first")
+        await self.add_file(blob)
+        await register_blob(self.db, CHECKSUM, 100, "uploads/second")
+        await self.add_file(blob, "b.txt")
+
+        self.assertIsNone(await release_blob(self.db, blob.id))
+        await self.db.commit()
+        self.assertEqual(await release_blob(self.db, blob.id), "uploads/first")
+        await self.db.commit()
+        self.assertEqual(await self.db.scalar(select(func.count(FileBlob.id))), 0)
+
+    async def test_legacy_file_adopted(self):
+        """测试去重前上传的文件在首次命中时登记为内容"""
+        legacy = FileModel(
+            filename="legacy", original_filename="old.txt", file_path="uploads/legacy",
+            file_size=100, owner_id=self.user.id, checksum=CHECKSUM
+        )
+        self.db.add(legacy)
+        await self.db.commit()
+
+        blob = await find_blob(self.db, CHECKSUM, 100)
+        await self.db.commit()
+        self.assertEqual(blob.file_path, "uploads/legacy")
+        self.assertEqual(blob.ref_count, 1)
+        self.assertEqual(legacy.blob_id, blob.id)
+
+    async def test_instant_lookup_limited_to_own_content(self):
+        """测试秒传查找只返回本用户已引用的内容，知道他人文件的哈希和大小不能取得内容"""
+        other = User(username="other", email="other@example.com", hashed_password="x")
+        self.db.add(other)
+        await self.db.commit()
+        blob, _ = await register_blob(self.db, CHECKSUM, 100, "uploads/private")
+        await self.add_file(blob)
+
+        self.assertIsNone(await find_owned_blob(self.db, other.id, CHECKSUM, 100))
+        self.assertEqual((await find_owned_blob(self.db, self.user.id, CHECKSUM, 100)).id, blob.id)
+        self.assertIsNone(await find_owned_blob(self.db, self.user.id, CHECKSUM, 99))
+
+
+class TestSingleFlight(unittest.TestCase):
+    """测试同键并发任务合并"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """测试并发调用只执行一次"""
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        async def main():
+            return await asyncio.gather(*[flight.run(CHECKSUM, work) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(main()), ["done"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(flight.pending(CHECKSUM))
+
+    def test_exception_shared_with_waiters(self):
+        """测试首个任务失败时等待者收到同一异常"""
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("分块不完整")
+
+        async def main():
+            return await asyncio.gather(*[flight.run(CHECKSUM, work) for _ in range(3)], return_exceptions=True)
+
+        results = asyncio.run(main())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+
+    def test_exclusive_runs_in_turn(self):
+        """测试同键独占任务依次执行、各自返回结果，执行期间等待者可见"""
+        flight = SingleFlight()
+        order = []
+
+        async def work(name):
+            order.append(("start", name))
+            await asyncio.sleep(0.01)
+            order.append(("end", name))
+            return name
+
+        async def main():
+            tasks = [asyncio.ensure_future(flight.exclusive(CHECKSUM, lambda name=name: work(name))) for name in "abc"]
+            await asyncio.sleep(0)
+            self.assertIsNotNone(flight.pending(CHECKSUM))
+            return await asyncio.gather(*tasks)
+
+        self.assertEqual(asyncio.run(main()), ["a", "b", "c"])
+        self.assertEqual([event for event, _ in order], ["start", "end"] * 3)
+        self.assertIsNone(flight.pending(CHECKSUM))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
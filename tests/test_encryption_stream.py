@@ -0,0 +1,168 @@
+"""
+Wenxi网盘 - 流式解密测试
+作者：Wenxi
+功能：验证DecryptStream逐块解密结果与原文件一致，并能识别损坏的密文
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from utils.encryption import (
+    encrypt_file, decrypt_file, _encrypt_file_v2, EncryptStream, DecryptStream, CHUNK_SIZE, V3_CHUNK_SIZE
+)
+
+
+class TestDecryptStream(unittest.TestCase):
+    """测试流式解密"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.plain_path = os.path.join(self.temp_dir.name, "plain")
+        self.cipher_path = os.path.join(self.temp_dir.name, "cipher")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _encrypt(self, content: bytes):
+        with open(self.plain_path, 'wb') as f:
+            f.write(content)
+        self.assertTrue(encrypt_file(self.plain_path, self.cipher_path, chunk_size=CHUNK_SIZE))
+
+    def test_roundtrip_multiple_chunks(self):
+        """测试跨多个块的数据完整还原"""
+        content = os.urandom(CHUNK_SIZE * 3 + 123)
+        self._encrypt(content)
+
+        stream = DecryptStream(self.cipher_path)
+        self.assertEqual(stream.size, len(content))
+        chunks = list(stream)
+        self.assertEqual(b"".join(chunks), content)
+        self.assertTrue(all(len(chunk) <= CHUNK_SIZE for chunk in chunks))
+
+    def test_iter_range_matches_slices(self):
+        """测试任意区间随机访问解密"""
+        content = os.urandom(CHUNK_SIZE * 4 + 77)
+        self._encrypt(content)
+        stream = DecryptStream(self.cipher_path)
+
+        cases = [
+            (0, 1),
+            (CHUNK_SIZE - 5, CHUNK_SIZE + 5),
+            (CHUNK_SIZE * 2, CHUNK_SIZE * 3),
+            (len(content) - 10, len(content)),
+            (123, len(content) + 1000),
+        ]
+        for start, end in cases:
+            self.assertEqual(b"".join(stream.iter_range(start, end)), content[start:end])
+        self.assertEqual(list(stream.iter_range(50, 50)), [])
+
+    def test_iter_range_skips_unrelated_chunks(self):
+        """测试区间解密不触碰范围外的块（损坏的前置块不影响读取）"""
+        content = os.urandom(CHUNK_SIZE * 3)
+        self._encrypt(content)
+        with open(self.cipher_path, 'r+b') as f:
+            f.seek(DecryptStream(self.cipher_path).layout.chunk_offset(0) + 10)
+            f.write(b"\x00" * 8)
+
+        stream = DecryptStream(self.cipher_path)
+        start = CHUNK_SIZE * 2 + 1
+        self.assertEqual(b"".join(stream.iter_range(start, start + 100)), content[start:start + 100])
+
+    def test_encrypt_stream_irregular_writes(self):
+        """测试流式加密接收任意长度片段，输出可被DecryptStream还原"""
+        content = os.urandom(CHUNK_SIZE * 2 + 999)
+        encryptor = EncryptStream(self.cipher_path, chunk_size=CHUNK_SIZE)
+        for offset in range(0, len(content), 50000):
+            encryptor.write(content[offset:offset + 50000])
+        self.assertEqual(encryptor.close(), len(content))
+
+        stream = DecryptStream(self.cipher_path)
+        self.assertEqual(stream.size, len(content))
+        self.assertEqual(b"".join(stream), content)
+
+    def test_encrypt_stream_abort_removes_output(self):
+        """测试放弃加密时删除不完整文件"""
+        encryptor = EncryptStream(self.cipher_path)
+        encryptor.write(b"partial")
+        encryptor.abort()
+        self.assertFalse(os.path.exists(self.cipher_path))
+
+    def test_v3_uses_configured_chunk_size(self):
+        """测试v3文件头记录块大小，默认块大小来自WENXI_CHUNK_SIZE"""
+        content = os.urandom(V3_CHUNK_SIZE + 5)
+        with open(self.plain_path, 'wb') as f:
+            f.write(content)
+        self.assertTrue(encrypt_file(self.plain_path, self.cipher_path))
+
+        stream = DecryptStream(self.cipher_path)
+        self.assertEqual(stream.layout.version, 3)
+        self.assertEqual(stream.layout.chunk_size, V3_CHUNK_SIZE)
+        self.assertEqual(stream.layout.chunk_count, 2)
+        self.assertEqual(b"".join(stream), content)
+
+    def test_v3_chunks_use_distinct_nonces(self):
+        """测试v3每块nonce不同"""
+        self._encrypt(os.urandom(CHUNK_SIZE * 3))
+        layout = DecryptStream(self.cipher_path).layout
+        nonces = {layout.nonce(index) for index in range(layout.chunk_count)}
+        self.assertEqual(len(nonces), layout.chunk_count)
+
+    def test_v2_files_still_readable(self):
+        """测试v2旧格式与v3并存可读"""
+        content = os.urandom(CHUNK_SIZE * 2 + 17)
+        with open(self.plain_path, 'wb') as f:
+            f.write(content)
+        self.assertTrue(_encrypt_file_v2(self.plain_path, self.cipher_path))
+
+        stream = DecryptStream(self.cipher_path)
+        self.assertEqual(stream.layout.version, 2)
+        self.assertEqual(b"".join(stream.iter_range(CHUNK_SIZE - 3, CHUNK_SIZE + 3)), content[CHUNK_SIZE - 3:CHUNK_SIZE + 3])
+
+        output_path = os.path.join(self.temp_dir.name, "output")
+        self.assertTrue(decrypt_file(self.cipher_path, output_path))
+        with open(output_path, 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+    def test_v3_truncation_detected_by_index(self):
+        """测试截断的v3文件在打开时即被拒绝"""
+        self._encrypt(os.urandom(CHUNK_SIZE * 2))
+        with open(self.cipher_path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.cipher_path) - 1)
+        with self.assertRaises(ValueError):
+            DecryptStream(self.cipher_path)
+
+    def test_empty_file(self):
+        """测试空文件"""
+        self._encrypt(b"")
+        stream = DecryptStream(self.cipher_path)
+        self.assertEqual(stream.size, 0)
+        self.assertEqual(list(stream), [])
+
+    def test_invalid_header_rejected_before_streaming(self):
+        """测试无效文件头在迭代前即被拒绝"""
+        with open(self.cipher_path, 'wb') as f:
+            f.write(b"not an encrypted file")
+        with self.assertRaises(ValueError):
+            DecryptStream(self.cipher_path)
+
+    def test_tampered_chunk_raises(self):
+        """测试密文被篡改时认证失败"""
+        self._encrypt(os.urandom(CHUNK_SIZE * 2))
+        offset = DecryptStream(self.cipher_path).layout.chunk_offset(1)
+        with open(self.cipher_path, 'r+b') as f:
+            f.seek(offset + 40)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        with self.assertRaises(Exception):
+            list(DecryptStream(self.cipher_path))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,167 @@
+"""
+Wenxi网盘 - 文件元数据缓存测试
+作者：Wenxi
+功能：验证元数据记录的序列化、命中时不查询数据库、属主校验、分享令牌映射与失效，
+      以及读取之后发生失效时不写回旧记录
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, User, File as FileModel
+from utils.cache import MemoryCache, set_cache
+from utils.file_meta import (
+    FileMeta, file_meta_stats, get_owned_file_meta, get_shared_file_meta,
+    invalidate_file_meta, meta_key, meta_stats, remember_file_meta, share_key
+)
+
+
+class TestFileMetaRecord(unittest.TestCase):
+    """测试记录序列化"""
+
+    def test_round_trip(self):
+        """测试序列化后字段不变"""
+        meta = FileMeta(7, 3, "uploads/abc", 1024, "报告.pdf", "application/pdf", "e3b0", 3, "tok")
+        loaded = FileMeta.loads(meta.dumps())
+        for name in FileMeta.__slots__:
+            self.assertEqual(getattr(loaded, name), getattr(meta, name))
+        self.assertIn("报告.pdf", meta.dumps())
+
+    def test_rejects_other_format(self):
+        """测试损坏或其他版本的记录被拒绝"""
+        with self.assertRaises(ValueError):
+            FileMeta.loads("{not json")
+        with self.assertRaises(ValueError):
+            FileMeta.loads('[99,7,3,"p",1,"n",null,null,null,null]')
+
+
+class TestFileMetaCache(unittest.IsolatedAsyncioTestCase):
+    """测试元数据读取"""
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        async with self.Session() as db:
+            user = User(username="wenxi", email="wenxi@example.com", hashed_password="x")
+            db.add(user)
+            await db.commit()
+            db_file = FileModel(filename="f", original_filename="a.txt", file_path="uploads/f", file_size=5,
+                                mime_type="text/plain", checksum="abc", owner_id=user.id,
+                                is_shared=True, share_token="sharetoken")
+            db.add(db_file)
+            await db.commit()
+            self.user_id, self.file_id = user.id, db_file.id
+
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+        self.cache = MemoryCache()
+        set_cache(self.cache)
+        meta_stats.reset()
+
+    async def asyncTearDown(self):
+        set_cache(None)
+        await self.engine.dispose()
+
+    async def test_miss_reads_database_until_stored(self):
+        """测试未命中时查询数据库，写回后不再查询"""
+        async with self.Session() as db:
+            meta = await get_owned_file_meta(db, self.file_id, self.user_id)
+            self.assertEqual((meta.name, meta.size, meta.mime, meta.cipher), ("a.txt", 5, "text/plain", None))
+            self.assertEqual(len(self.statements), 1)
+
+            meta.cipher = 3
+            await remember_file_meta(meta)
+            cached = await get_owned_file_meta(db, self.file_id, self.user_id)
+
+        self.assertEqual(cached.cipher, 3)
+        self.assertEqual(len(self.statements), 1)
+        stats = file_meta_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["stores"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    async def test_owner_mismatch_hidden(self):
+        """测试命中时仍校验属主"""
+        async with self.Session() as db:
+            await remember_file_meta(FileMeta(self.file_id, self.user_id, "uploads/f", 5, "a.txt", cipher=3))
+            self.assertIsNone(await get_owned_file_meta(db, self.file_id, self.user_id + 1))
+        self.assertEqual(self.statements, [])
+
+    async def test_share_token_lookup(self):
+        """测试分享令牌命中时不查询数据库，失效后重新查询（未命中时按令牌查询并再确认一次）"""
+        async with self.Session() as db:
+            meta = await get_shared_file_meta(db, "sharetoken")
+            self.assertEqual(meta.share_token, "sharetoken")
+            await remember_file_meta(meta)
+            self.assertEqual((await get_shared_file_meta(db, "sharetoken")).id, self.file_id)
+            self.assertEqual(len(self.statements), 2)
+
+            await invalidate_file_meta(self.file_id, "sharetoken")
+            await get_shared_file_meta(db, "sharetoken")
+            self.assertEqual(len(self.statements), 4)
+            self.assertIsNone(await get_shared_file_meta(db, "othertoken"))
+
+    async def test_write_back_after_invalidation_skipped(self):
+        """测试读取之后文件被删除或取消分享时，未命中与命中路径的写回都不会让旧记录复活"""
+        async with self.Session() as db:
+            meta = await get_owned_file_meta(db, self.file_id, self.user_id)
+            await invalidate_file_meta(self.file_id, "sharetoken")
+            meta.cipher = 3
+            await remember_file_meta(meta)
+            self.assertIsNone(await self.cache.get(meta_key(self.file_id)))
+
+            shared = await get_shared_file_meta(db, "sharetoken")
+            await invalidate_file_meta(self.file_id, "sharetoken")
+            await remember_file_meta(shared)
+            self.assertIsNone(await self.cache.get(meta_key(self.file_id)))
+            self.assertIsNone(await self.cache.get(share_key("sharetoken")))
+
+            # 上传后写入的记录命中后再回写密文版本，期间被删除
+            await remember_file_meta(FileMeta(self.file_id, self.user_id, "uploads/f", 5, "a.txt"))
+            cached = await get_owned_file_meta(db, self.file_id, self.user_id)
+            await invalidate_file_meta(self.file_id)
+            cached.cipher = 3
+            await remember_file_meta(cached)
+            self.assertIsNone(await self.cache.get(meta_key(self.file_id)))
+
+            # 失效之后重新读取的记录照常写回
+            fresh = await get_owned_file_meta(db, self.file_id, self.user_id)
+            await remember_file_meta(fresh)
+            self.assertIsNotNone(await self.cache.get(meta_key(self.file_id)))
+
+    async def test_invalidation_during_write_back_removes_record(self):
+        """测试检查与写入之间发生失效时，写入的记录随即删除"""
+        async with self.Session() as db:
+            meta = await get_owned_file_meta(db, self.file_id, self.user_id)
+        set_many = self.cache.set_many
+
+        async def racing_set_many(mapping, ttl):
+            await set_many(mapping, ttl)
+            await invalidate_file_meta(self.file_id)
+
+        with patch.object(self.cache, "set_many", racing_set_many):
+            await remember_file_meta(meta)
+        self.assertIsNone(await self.cache.get(meta_key(self.file_id)))
+        self.assertEqual(file_meta_stats()["stores"], 0)
+
+    async def test_corrupt_record_discarded(self):
+        """测试损坏的缓存记录被删除并回退到数据库"""
+        await self.cache.set(meta_key(self.file_id), "garbage", 60)
+        async with self.Session() as db:
+            meta = await get_owned_file_meta(db, self.file_id, self.user_id)
+        self.assertEqual(meta.path, "uploads/f")
+        self.assertIsNone(await self.cache.get(meta_key(self.file_id)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+Wenxi网盘 - 用户/文件记录缓存测试
+作者：Wenxi
+功能：验证缓存的TTL与容量上限、命中时不查询数据库、命中实例可正常修改提交
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, User, File as FileModel
+from utils import identity_cache
+from utils.identity_cache import IdentityCache, get_owned_file, get_user_by_username, invalidate_user
+
+
+class TestIdentityCache(unittest.TestCase):
+    """测试缓存容器"""
+
+    def test_lru_bound(self):
+        """测试超出上限时淘汰最久未使用的条目"""
+        cache = IdentityCache(max_size=2, ttl=60)
+        cache.put("a", {"id": 1})
+        cache.put("b", {"id": 2})
+        cache.get("a")
+        cache.put("c", {"id": 3})
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), {"id": 1})
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        """测试过期条目不再命中"""
+        cache = IdentityCache(max_size=4, ttl=10)
+        with patch.object(identity_cache.time, "monotonic", return_value=100.0):
+            cache.put("a", {"id": 1})
+        with patch.object(identity_cache.time, "monotonic", return_value=105.0):
+            self.assertIsNotNone(cache.get("a"))
+        with patch.object(identity_cache.time, "monotonic", return_value=111.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+
+class TestReadThrough(unittest.IsolatedAsyncioTestCase):
+    """测试读穿查询"""
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        async with self.Session() as db:
+            user = User(username="wenxi", email="wenxi@example.com", hashed_password="x")
+            db.add(user)
+            await db.commit()
+            db_file = FileModel(filename="f", original_filename="a.txt", file_path="uploads/f",
+                                file_size=1, owner_id=user.id)
+            db.add(db_file)
+            await db.commit()
+            self.user_id, self.file_id = user.id, db_file.id
+
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+        identity_cache.user_cache.clear()
+        identity_cache.file_cache.clear()
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_hit_skips_database(self):
+        """测试第二次读取不发出SQL"""
+        async with self.Session() as db:
+            await get_user_by_username(db, "wenxi")
+        queries = len(self.statements)
+        async with self.Session() as db:
+            user = await get_user_by_username(db, "wenxi")
+            file = await get_owned_file(db, self.file_id, user.id)
+            file_again = await get_owned_file(db, self.file_id, user.id)
+
+        self.assertEqual(user.email, "wenxi@example.com")
+        self.assertIs(file, file_again)
+        self.assertEqual(len(self.statements), queries + 1)  # 只有首次读取文件时查询
+
+    async def test_owner_mismatch_hidden(self):
+        """测试缓存命中时仍校验文件所有者"""
+        async with self.Session() as db:
+            self.assertIsNotNone(await get_owned_file(db, self.file_id, self.user_id))
+            self.assertIsNone(await get_owned_file(db, self.file_id, self.user_id + 1))
+
+    async def test_cached_instance_can_be_updated(self):
+        """测试命中得到的实例修改后可以提交，失效后读到新值"""
+        async with self.Session() as db:
+            await get_user_by_username(db, "wenxi")
+        async with self.Session() as db:
+            user = await get_user_by_username(db, "wenxi")
+            user.email = "new@example.com"
+            await db.commit()
+        invalidate_user("wenxi")
+
+        async with self.Session() as db:
+            self.assertEqual((await get_user_by_username(db, "wenxi")).email, "new@example.com")
+            self.assertEqual(await db.scalar(select(User.email).where(User.id == self.user_id)), "new@example.com")
+
+
+if __name__ == '__main__':
+    unittest.main()
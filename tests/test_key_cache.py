@@ -0,0 +1,134 @@
+"""
+Wenxi网盘 - 密钥派生缓存测试
+作者：Wenxi
+功能：验证派生密钥缓存的命中统计、容量上限与清零行为，以及并发派生时同键只算一次、不同键互不阻塞
+"""
+
+import os
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from utils import encryption
+from utils.encryption import KeyCache
+
+
+class TestKeyCache(unittest.TestCase):
+    """测试派生密钥缓存"""
+
+    def setUp(self):
+        """使用快速的假派生函数，避免测试执行100万次PBKDF2"""
+        self.patcher = patch.object(
+            encryption, "_pbkdf2_derive",
+            side_effect=lambda password, salt: (password.encode() + salt).ljust(32, b"k")[:32]
+        )
+        self.mock_derive = self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_hit_and_miss_counters(self):
+        """测试重复派生命中缓存"""
+        cache = KeyCache(max_size=4)
+        first = cache.get_or_derive("password", b"salt")
+        second = cache.get_or_derive("password", b"salt")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.mock_derive.call_count, 1)
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_salt_is_part_of_key(self):
+        """测试不同盐值分别派生"""
+        cache = KeyCache(max_size=4)
+        cache.get_or_derive("password", b"salt-a")
+        cache.get_or_derive("password", b"salt-b")
+        self.assertEqual(self.mock_derive.call_count, 2)
+
+    def test_bounded_size_evicts_and_zeroizes(self):
+        """测试超过容量时淘汰最久未使用的密钥并清零"""
+        cache = KeyCache(max_size=2)
+        cache.get_or_derive("a", b"salt")
+        evicted = next(iter(cache._keys.values()))
+        cache.get_or_derive("b", b"salt")
+        cache.get_or_derive("c", b"salt")
+
+        stats = cache.stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(bytes(evicted), b"\x00" * len(evicted))
+
+    def test_clear_zeroizes_keys(self):
+        """测试清空缓存时密钥被覆盖"""
+        cache = KeyCache(max_size=2)
+        cache.get_or_derive("password", b"salt")
+        stored = next(iter(cache._keys.values()))
+        cache.clear()
+
+        self.assertEqual(cache.stats()["size"], 0)
+        self.assertEqual(bytes(stored), b"\x00" * len(stored))
+
+    def test_plain_password_not_stored(self):
+        """测试缓存键中不保留明文密码"""
+        cache = KeyCache(max_size=2)
+        cache.get_or_derive("top-secret", b"salt")
+        for digest, _ in cache._keys:
+            self.assertNotIn(b"top-secret", digest)
+
+
+    def test_concurrent_same_key_derived_once(self):
+        """测试同一密钥并发首次访问只派生一次，其余请求等待并取得相同结果"""
+        cache = KeyCache(max_size=4)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_derive(password, salt):
+            started.set()
+            release.wait(5)
+            return b"k" * 32
+
+        self.mock_derive.side_effect = slow_derive
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(cache.get_or_derive, "password", b"salt") for _ in range(8)]
+            self.assertTrue(started.wait(5))
+            release.set()
+            results = {future.result(timeout=5) for future in futures}
+
+        self.assertEqual(results, {b"k" * 32})
+        self.assertEqual(self.mock_derive.call_count, 1)
+        self.assertEqual((cache.stats()["misses"], cache.stats()["hits"]), (1, 7))
+        self.assertEqual(cache._inflight, {})
+
+    def test_different_keys_derive_in_parallel(self):
+        """测试不同密钥的派生不在全局锁内串行"""
+        cache = KeyCache(max_size=4)
+        barrier = threading.Barrier(2, timeout=5)
+
+        def parallel_derive(password, salt):
+            barrier.wait()  # 两个派生同时进行才能通过
+            return password.encode().ljust(32, b"k")
+
+        self.mock_derive.side_effect = parallel_derive
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(cache.get_or_derive, password, b"salt") for password in ("a", "b")]
+            self.assertEqual([future.result(timeout=10) for future in futures],
+                             [b"a".ljust(32, b"k"), b"b".ljust(32, b"k")])
+
+    def test_failed_derivation_not_cached(self):
+        """测试派生失败时不留下进行中的记录，下次访问重新派生"""
+        cache = KeyCache(max_size=4)
+        self.mock_derive.side_effect = RuntimeError("kdf failed")
+        with self.assertRaises(RuntimeError):
+            cache.get_or_derive("password", b"salt")
+        self.assertEqual(cache._inflight, {})
+        self.mock_derive.side_effect = lambda password, salt: b"k" * 32
+        self.assertEqual(cache.get_or_derive("password", b"salt"), b"k" * 32)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,174 @@
+"""
+Wenxi网盘 - Merkle树完整性校验测试
+作者：Wenxi
+功能：验证任意叶子区间的证明、加密时计算的叶子与并行解密计算一致、旧内容补建树，
+      以及篡改密文后只有覆盖被篡改块的区间校验失败
+"""
+
+import os
+import sys
+import hashlib
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, User, File as FileModel, FileMerkle
+from utils import crypto_engine as engine_module
+from utils.crypto_engine import CryptoEngine
+from utils.dedup import register_blob, release_blob
+from utils.encryption import DecryptStream, EncryptStream
+from utils.merkle import (
+    HASH_SIZE, block_range, ensure_tree, leaf_hash, merkle_root, node_hash, range_proof, root_from_range,
+    split_leaves, verify_range, verify_stored_range
+)
+
+BLOCK = 4 * 1024
+
+
+class TestMerkleTree(unittest.TestCase):
+    """测试树与区间证明"""
+
+    def test_root_structure(self):
+        """测试叶子与内部节点加前缀区分，落单节点直接升层，空树根为空串哈希"""
+        leaves = [leaf_hash(bytes([i])) for i in range(3)]
+        self.assertEqual(leaves[0], hashlib.sha256(b"\x00\x00").digest())
+        self.assertEqual(merkle_root(leaves), node_hash(node_hash(leaves[0], leaves[1]), leaves[2]))
+        self.assertEqual(merkle_root(leaves[:1]), leaves[0])
+        self.assertEqual(merkle_root([]), hashlib.sha256(b"").digest())
+
+    def test_every_range_verifies(self):
+        """测试各种叶子数下任意连续区间的证明都能还原根，篡改叶子或证明后失败"""
+        for count in range(1, 12):
+            leaves = [leaf_hash(os.urandom(8)) for _ in range(count)]
+            root = merkle_root(leaves)
+            for first in range(count):
+                for end in range(first + 1, count + 1):
+                    proof = range_proof(leaves, first, end)
+                    self.assertTrue(verify_range(leaves[first:end], first, count, proof, root), (count, first, end))
+                    tampered = list(leaves[first:end])
+                    tampered[-1] = leaf_hash(b"tampered")
+                    self.assertFalse(verify_range(tampered, first, count, proof, root))
+                    if proof:
+                        self.assertIsNone(root_from_range(leaves[first:end], first, count, proof[:-1]))
+                    self.assertIsNone(root_from_range(leaves[first:end], first, count, proof + [root]))
+
+    def test_block_range(self):
+        """测试字节区间映射到覆盖它的块"""
+        self.assertEqual(block_range(0, 1, BLOCK), (0, 1))
+        self.assertEqual(block_range(BLOCK - 1, BLOCK + 1, BLOCK), (0, 2))
+        self.assertEqual(block_range(BLOCK, 3 * BLOCK, BLOCK), (1, 3))
+
+
+class TestFileMerkle(unittest.IsolatedAsyncioTestCase):
+    """测试加密文件的树计算、保存与校验"""
+
+    async def asyncSetUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.db = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(username="wenxi", email="wenxi@example.com", hashed_password="x")
+        self.db.add(self.user)
+        await self.db.commit()
+
+        # 线程池引擎，缩小分片使小文件也多分片并行
+        self.crypto = CryptoEngine(workers=3, executor_type="thread")
+        self.patchers = [
+            patch.object(engine_module, "crypto_engine", self.crypto),
+            patch.object(engine_module, "SHARD_SIZE", BLOCK * 2),
+            patch.object(engine_module, "PARALLEL_THRESHOLD", 0),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.content = os.urandom(BLOCK * 9 + 123)
+        self.cipher_path = os.path.join(self.temp_dir.name, "cipher")
+        encryptor = EncryptStream(self.cipher_path, chunk_size=BLOCK)
+        encryptor.write(self.content)
+        encryptor.close()
+        self.leaves = bytes(encryptor.leaves)
+
+    async def asyncTearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.crypto.shutdown()
+        await self.db.close()
+        await self.engine.dispose()
+        self.temp_dir.cleanup()
+
+    async def add_file(self, with_blob=True):
+        blob_id = None
+        if with_blob:
+            blob, _ = await register_blob(self.db, hashlib.sha256(self.content).hexdigest(),
+                                          len(self.content), "uploads/cipher")
+            blob_id = blob.id
+        db_file = FileModel(filename="cipher", original_filename="a.bin", file_path="uploads/cipher",
+                            file_size=len(self.content), owner_id=self.user.id, blob_id=blob_id)
+        self.db.add(db_file)
+        await self.db.commit()
+        return db_file
+
+    def corrupt_block(self, index):
+        """翻转第index个密文块中的一个字节"""
+        position = DecryptStream(self.cipher_path).layout.chunk_offset(index) + 7
+        with open(self.cipher_path, 'r+b') as f:
+            f.seek(position)
+            byte = f.read(1)
+            f.seek(position)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+    async def test_encrypt_leaves_match_parallel_hashes(self):
+        """测试加密时顺带计算的叶子与引擎分片并行解密计算的一致"""
+        self.assertEqual(len(self.leaves), 10 * HASH_SIZE)
+        self.assertEqual(split_leaves(self.leaves)[9], leaf_hash(self.content[9 * BLOCK:]))
+        layout, leaves = await self.crypto.block_hashes(self.cipher_path)
+        self.assertEqual(layout.chunk_size, BLOCK)
+        self.assertEqual(leaves, self.leaves)
+        _, middle = await self.crypto.block_hashes(self.cipher_path, 3, 7)
+        self.assertEqual(middle, self.leaves[3 * HASH_SIZE:7 * HASH_SIZE])
+        with self.assertRaises(ValueError):
+            await self.crypto.block_hashes(self.cipher_path, 5, 11)
+
+    async def test_tree_built_once_and_released_with_blob(self):
+        """测试没有树的内容首次校验时补建并保存，最后一个引用释放时一并删除"""
+        db_file = await self.add_file()
+        tree = await ensure_tree(self.db, db_file, self.cipher_path)
+        self.assertEqual(tree.leaves, self.leaves)
+        self.assertEqual(tree.root, merkle_root(split_leaves(self.leaves)).hex())
+        self.assertIs(await ensure_tree(self.db, db_file, self.cipher_path), tree)
+
+        await release_blob(self.db, db_file.blob_id)
+        await self.db.delete(db_file)
+        await self.db.commit()
+        self.assertEqual(await self.db.scalar(select(func.count()).select_from(FileMerkle)), 0)
+
+    async def test_tree_not_stored_without_blob(self):
+        """测试未登记内容的旧文件只临时计算树"""
+        db_file = await self.add_file(with_blob=False)
+        tree = await ensure_tree(self.db, db_file, self.cipher_path)
+        self.assertEqual(tree.leaves, self.leaves)
+        self.assertEqual(await self.db.scalar(select(func.count()).select_from(FileMerkle)), 0)
+
+    async def test_tampered_block_detected_in_covering_ranges_only(self):
+        """测试篡改一个块后覆盖它的区间与整体校验失败，其余区间仍通过"""
+        tree = await ensure_tree(self.db, await self.add_file(), self.cipher_path)
+        size = len(self.content)
+        self.assertEqual(await verify_stored_range(tree, self.cipher_path, size), (True, 10))
+        self.assertEqual(await verify_stored_range(tree, self.cipher_path, size, BLOCK + 1, 3 * BLOCK), (True, 2))
+
+        self.corrupt_block(4)
+        self.assertFalse((await verify_stored_range(tree, self.cipher_path, size))[0])
+        self.assertFalse((await verify_stored_range(tree, self.cipher_path, size, 4 * BLOCK, 4 * BLOCK + 1))[0])
+        self.assertTrue((await verify_stored_range(tree, self.cipher_path, size, 0, 4 * BLOCK))[0])
+        self.assertTrue((await verify_stored_range(tree, self.cipher_path, size, 5 * BLOCK, size))[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Wenxi网盘 - 运行指标测试
+作者：Wenxi
+功能：验证计数器/直方图聚合、分位数估算、Prometheus文本输出、请求中间件与数据库语句计时
+"""
+
+import os
+import sys
+import unittest
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import create_engine, text
+
+from utils import metrics
+from utils.metrics import Histogram, MetricsMiddleware, Registry
+
+
+class TestMetricTypes(unittest.TestCase):
+    """测试指标类型与文本格式"""
+
+    def test_render_text_format(self):
+        """测试计数器带标签输出、直方图输出累计桶"""
+        registry = Registry()
+        counter = registry.counter("t_bytes_total", "bytes")
+        histogram = registry.histogram("t_seconds", "seconds", buckets=(0.1, 1.0))
+        counter.inc(5, direction="upload")
+        counter.inc(3, direction="upload")
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(2.0)
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE t_bytes_total counter", lines)
+        self.assertIn('t_bytes_total{direction="upload"} 8', lines)
+        self.assertIn('t_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('t_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('t_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("t_seconds_count 3", lines)
+        self.assertIn("t_seconds_sum 2.55", lines)
+
+    def test_label_escaping(self):
+        """测试标签值中的引号和反斜杠被转义"""
+        registry = Registry()
+        registry.counter("t_total", "t").inc(route='a"b\\c')
+        self.assertIn('t_total{route="a\\"b\\\\c"} 1', registry.render())
+
+    def test_quantile_interpolation(self):
+        """测试分位数按桶内线性插值"""
+        histogram = Histogram("t", "t", buckets=(1.0, 2.0, 4.0))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+        summary = histogram.summary()
+        self.assertEqual(summary["count"], 4)
+        self.assertAlmostEqual(summary["avg"], 1.625)
+        self.assertAlmostEqual(summary["p50"], 1.5)  # 第2个样本位于(1, 2]桶的中点
+        self.assertAlmostEqual(histogram.summary()["p99"], 2.0 + 2.0 * 0.96)
+        self.assertEqual(Histogram("e", "e").summary()["p50"], 0.0)
+
+
+class TestInstrumentation(unittest.IsolatedAsyncioTestCase):
+    """测试埋点"""
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_metered_records_transfer(self):
+        """测试响应体发送完毕后记录字节数和次数"""
+        body = b"".join(metrics.metered(iter([b"abc", b"defg"])))
+        self.assertEqual(body, b"abcdefg")
+        self.assertEqual(metrics.transfer_bytes_total.value(direction="download"), 7)
+        self.assertEqual(metrics.transfer_seconds.summary(direction="download")["count"], 1)
+
+    def test_db_query_timing(self):
+        """测试数据库语句被计时"""
+        engine = create_engine("sqlite://")
+        metrics.instrument_engine(engine)
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        self.assertEqual(metrics.db_query_seconds.summary()["count"], 2)
+
+    async def test_middleware_counts_until_body_sent(self):
+        """测试响应体发送期间请求仍计为进行中"""
+        observed = []
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 201, "headers": []})
+            observed.append(metrics.http_requests_in_flight.total())
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        async def send(message):
+            pass
+
+        await MetricsMiddleware(app)({"type": "http", "method": "GET", "path": "/x"}, None, send)
+
+        self.assertEqual(observed, [1])
+        self.assertEqual(metrics.http_requests_in_flight.total(), 0)
+        self.assertEqual(metrics.http_requests_total.value(method="GET", route="unmatched", status=201), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Wenxi网盘 - 文件列表键集分页测试
+作者：Wenxi
+功能：验证各排序方式下逐页翻完与一次性排序结果一致，以及游标校验
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, User, File as FileModel
+from utils.pagination import CursorError, apply_keyset, decode_cursor, encode_cursor, page_with_cursor
+
+
+class TestKeysetPagination(unittest.IsolatedAsyncioTestCase):
+    """测试键集分页"""
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.db = async_sessionmaker(self.engine, expire_on_commit=False)()
+        user = User(username="wenxi", email="wenxi@example.com", hashed_password="x")
+        self.db.add(user)
+        await self.db.commit()
+        self.user_id = user.id
+
+        # 排序值有重复，验证按id打破并列
+        base_time = datetime(2025, 1, 1)
+        for index in range(23):
+            self.db.add(FileModel(
+                filename=f"f{index}", original_filename=f"name_{index % 5}.txt", file_path=f"uploads/f{index}",
+                file_size=(index * 7) % 4, owner_id=user.id, created_at=base_time + timedelta(minutes=index % 6)
+            ))
+        await self.db.commit()
+
+    async def asyncTearDown(self):
+        await self.db.close()
+        await self.engine.dispose()
+
+    async def collect_pages(self, sort, order, limit):
+        """逐页读取，返回id列表和页数"""
+        ids, cursor, pages = [], None, 0
+        while True:
+            query = select(FileModel.id, FileModel.created_at, FileModel.original_filename, FileModel.file_size).where(
+                FileModel.owner_id == self.user_id
+            )
+            rows = (await self.db.execute(apply_keyset(query, sort, order, cursor, limit))).mappings().all()
+            rows, cursor = page_with_cursor(rows, sort, order, limit)
+            ids.extend(row["id"] for row in rows)
+            pages += 1
+            if cursor is None:
+                return ids, pages
+
+    async def test_pages_match_full_sort(self):
+        """测试每种排序方式下翻页结果与完整排序一致且无重复"""
+        files = (await self.db.scalars(select(FileModel))).all()
+        keys = {"created_at": "created_at", "name": "original_filename", "size": "file_size"}
+        for sort, attribute in keys.items():
+            for order in ("asc", "desc"):
+                expected = [file.id for file in sorted(
+                    files, key=lambda file: (getattr(file, attribute), file.id), reverse=order == "desc"
+                )]
+                ids, pages = await self.collect_pages(sort, order, 5)
+                self.assertEqual(ids, expected, f"{sort} {order}")
+                self.assertEqual(pages, 5)
+
+    def test_cursor_round_trip(self):
+        """测试游标编码后可还原排序值"""
+        created = datetime(2025, 1, 1, 12, 30)
+        cursor = encode_cursor("created_at", "desc", created, 42)
+        self.assertEqual(decode_cursor(cursor, "created_at", "desc"), (created, 42))
+
+    def test_cursor_rejects_other_sort(self):
+        """测试游标不能用于其他排序方式"""
+        cursor = encode_cursor("size", "asc", 10, 1)
+        with self.assertRaises(CursorError):
+            decode_cursor(cursor, "size", "desc")
+        with self.assertRaises(CursorError):
+            decode_cursor("not-a-cursor", "size", "asc")
+
+
+if __name__ == '__main__':
+    unittest.main()
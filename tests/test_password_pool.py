@@ -0,0 +1,63 @@
+"""
+Wenxi网盘 - 密码哈希线程池测试
+作者：Wenxi
+功能：验证哈希与校验、低成本哈希透明升级以及排队已满时快速拒绝
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from passlib.context import CryptContext
+
+from utils.password_pool import HashPoolBusy, PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+    """测试密码哈希器（使用最低成本，避免测试耗时）"""
+
+    def setUp(self):
+        self.hasher = PasswordHasher(workers=1, queue_limit=4, rounds=5)
+
+    def tearDown(self):
+        self.hasher.shutdown()
+
+    async def test_hash_and_verify(self):
+        """测试哈希后可以校验"""
+        hashed = await self.hasher.hash("secret")
+        self.assertTrue(await self.hasher.verify("secret", hashed))
+        self.assertFalse(await self.hasher.verify("wrong", hashed))
+
+    async def test_weaker_hash_upgraded(self):
+        """测试成本低于配置的哈希在校验通过后升级，更高成本的哈希保持不变"""
+        weak = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+        strong = CryptContext(schemes=["bcrypt"], bcrypt__rounds=6).hash("secret")
+
+        valid, new_hash = await self.hasher.verify_and_update("secret", weak)
+        self.assertTrue(valid)
+        self.assertIn("$05$", new_hash)
+        self.assertEqual(await self.hasher.verify_and_update("wrong", weak), (False, None))
+        self.assertEqual(await self.hasher.verify_and_update("secret", strong), (True, None))
+        self.assertEqual(self.hasher.stats()["upgraded"], 1)
+
+    async def test_rejects_when_queue_full(self):
+        """测试排队已满时立即拒绝而不是等待"""
+        hasher = PasswordHasher(workers=1, queue_limit=2, rounds=10)
+        try:
+            running = [asyncio.ensure_future(hasher.hash("secret")) for _ in range(2)]
+            await asyncio.sleep(0)
+            with self.assertRaises(HashPoolBusy):
+                await hasher.hash("secret")
+            await asyncio.gather(*running)
+            self.assertEqual(hasher.stats()["rejected"], 1)
+            self.assertEqual(hasher.stats()["pending"], 0)
+        finally:
+            hasher.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Wenxi网盘 - Range请求解析测试
+作者：Wenxi
+功能：验证单区间与多区间解析、不可满足时返回416，以及区间数上限、重叠合并和覆盖整个文件时按完整文件响应
+"""
+
+import os
+import sys
+import unittest
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from fastapi import HTTPException
+
+from routers.files import MAX_RANGES, parse_range_header
+
+SIZE = 1000
+
+
+class TestParseRange(unittest.TestCase):
+    """测试Range请求头解析"""
+
+    def test_single_ranges(self):
+        """测试三种区间写法，结尾超出文件时截断，无效语法按完整文件响应"""
+        self.assertEqual(parse_range_header("bytes=0-99", SIZE), [(0, 100)])
+        self.assertEqual(parse_range_header("bytes=900-", SIZE), [(900, SIZE)])
+        self.assertEqual(parse_range_header("bytes=-100", SIZE), [(900, SIZE)])
+        self.assertEqual(parse_range_header("bytes=990-2000", SIZE), [(990, SIZE)])
+        self.assertEqual(parse_range_header("bytes=0-", SIZE), [(0, SIZE)])
+        for header in (None, "", "items=0-1", "bytes=5-1", "bytes=a-b", "bytes=1"):
+            self.assertIsNone(parse_range_header(header, SIZE), header)
+
+    def test_unsatisfiable(self):
+        """测试所有区间都不可满足时返回416"""
+        with self.assertRaises(HTTPException) as caught:
+            parse_range_header("bytes=1000-,2000-3000", SIZE)
+        self.assertEqual(caught.exception.status_code, 416)
+        self.assertEqual(caught.exception.headers["Content-Range"], f"bytes */{SIZE}")
+
+    def test_range_count_capped(self):
+        """测试区间数超过上限时忽略Range头"""
+        header = "bytes=" + ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(MAX_RANGES))
+        self.assertEqual(len(parse_range_header(header, SIZE)), MAX_RANGES)
+        self.assertIsNone(parse_range_header(header + ",500-501", SIZE))
+        self.assertIsNone(parse_range_header("bytes=" + ",".join(["0-0"] * (MAX_RANGES + 1)), SIZE))
+
+    def test_overlapping_ranges_merged(self):
+        """测试区间排序后合并重叠与相邻的部分，不重复发送同一段数据"""
+        self.assertEqual(parse_range_header("bytes=500-599,0-99,50-149", SIZE), [(0, 150), (500, 600)])
+        self.assertEqual(parse_range_header("bytes=0-99,100-199", SIZE), [(0, 200)])
+        self.assertEqual(parse_range_header("bytes=0-499,0-499,-10", SIZE), [(0, 500), (990, SIZE)])
+
+    def test_full_coverage_returns_whole_file(self):
+        """测试多个区间合并后覆盖整个文件时按完整文件响应"""
+        self.assertIsNone(parse_range_header("bytes=0-,0-,0-", SIZE))
+        self.assertIsNone(parse_range_header("bytes=0-599,500-", SIZE))
+        self.assertEqual(parse_range_header("bytes=0-599,601-", SIZE), [(0, 600), (601, SIZE)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Wenxi网盘 - 文件全文检索测试
+作者：Wenxi
+功能：验证FTS索引的重建与触发器同步、中日韩子串检索、短词回退、前缀查询和相关度排序
+"""
+
+import os
+import sys
+import unittest
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, User, File as FileModel
+from utils import search
+from utils.search import apply_search, ensure_search_index, split_terms
+
+
+class TestFileSearch(unittest.TestCase):
+    """测试文件全文检索"""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        user = User(username="wenxi", email="wenxi@example.com", hashed_password="x")
+        self.db.add(user)
+        self.db.commit()
+        self.user_id = user.id
+        # 建索引前已有的文件，验证首次创建时重建
+        self.add_file("年度报告2024.pdf")
+        self.assertTrue(ensure_search_index(self.engine))
+
+    def tearDown(self):
+        self.db.close()
+        self.engine.dispose()
+        search.fts_enabled = False
+
+    def add_file(self, name, description=None):
+        """添加一条文件记录"""
+        db_file = FileModel(
+            filename=name, original_filename=name, file_path=f"uploads/{name}",
+            file_size=1, owner_id=self.user_id, description=description
+        )
+        self.db.add(db_file)
+        self.db.commit()
+        return db_file
+
+    def search(self, term):
+        """执行检索，返回按相关度排序的文件名"""
+        query, rank = apply_search(
+            select(FileModel.original_filename).where(FileModel.owner_id == self.user_id), term
+        )
+        if rank is not None:
+            query = query.order_by(rank.desc(), FileModel.id)
+        return [row[0] for row in self.db.execute(query)]
+
+    def test_cjk_substring_and_existing_rows(self):
+        """测试中文子串命中建索引前已存在的文件"""
+        self.add_file("旅行照片.zip")
+        self.assertEqual(self.search("度报告"), ["年度报告2024.pdf"])
+
+    def test_description_and_ranking(self):
+        """测试描述可被检索，文件名命中排在描述命中之前"""
+        self.add_file("notes.txt", description="quarterly report draft")
+        self.add_file("report final.txt")
+        self.assertEqual(self.search("report"), ["report final.txt", "notes.txt"])
+
+    def test_prefix_and_case_insensitive(self):
+        """测试前缀查询忽略大小写"""
+        self.add_file("Reportage.md")
+        self.assertEqual(self.search("rep*"), ["Reportage.md"])
+
+    def test_short_terms_fall_back_to_like(self):
+        """测试少于3个字符的词仍能检索"""
+        self.add_file("报告模板.docx")
+        self.assertEqual(split_terms("报告 pdf"), (["pdf"], ["报告"]))
+        self.assertEqual(sorted(self.search("报告")), ["年度报告2024.pdf", "报告模板.docx"])
+        self.assertEqual(self.search("报告 pdf"), ["年度报告2024.pdf"])
+
+    def test_index_follows_rename_and_delete(self):
+        """测试重命名和删除后索引同步"""
+        db_file = self.add_file("draft.txt")
+        db_file.original_filename = "contract.txt"
+        self.db.commit()
+        self.assertEqual(self.search("draft"), [])
+        self.assertEqual(self.search("contract"), ["contract.txt"])
+
+        self.db.delete(db_file)
+        self.db.commit()
+        self.assertEqual(self.search("contract"), [])
+
+    def test_quotes_are_escaped(self):
+        """测试搜索词中的双引号不会破坏FTS查询语法"""
+        self.add_file('say "hello".txt')
+        self.assertEqual(self.search('"hello"'), ['say "hello".txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+Wenxi网盘 - 请求分阶段计时测试
+作者：Wenxi
+功能：验证阶段累加、线程池上下文传递、Server-Timing响应头与追踪文件
+"""
+
+import os
+import sys
+import json
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from utils import tracing
+from utils.tracing import Trace, TraceWriter, TracingMiddleware, bind_context, record_span, span, timed_iter
+
+
+class TestTrace(unittest.TestCase):
+    """测试阶段累加与输出格式"""
+
+    def test_server_timing_format(self):
+        """测试同名阶段累加并标注次数"""
+        trace = Trace()
+        trace.add("sql", 0.001)
+        trace.add("sql", 0.002)
+        trace.add("hash", 0.0105)
+        header = trace.server_timing()
+        self.assertTrue(header.startswith('sql;desc="2x";dur=3.00, hash;dur=10.50, total;dur='))
+
+    def test_span_outside_request_is_noop(self):
+        """测试不在请求中时span不报错也不记录"""
+        with span("x"):
+            pass
+        record_span("y", 1.0)
+        self.assertIsNone(tracing.current_trace())
+
+
+class TestPropagation(unittest.IsolatedAsyncioTestCase):
+    """测试跨协程与线程池计入同一请求"""
+
+    async def test_executor_needs_bind_context(self):
+        """测试run_in_executor只有经bind_context包装才计入当前请求"""
+        trace = Trace()
+        token = tracing._current.set(trace)
+        loop = asyncio.get_running_loop()
+        try:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                await loop.run_in_executor(executor, record_span, "plain", 0.1)
+                await loop.run_in_executor(executor, bind_context(record_span), "bound", 0.1)
+        finally:
+            tracing._current.reset(token)
+        self.assertEqual(list(trace.spans), ["bound"])
+
+    async def test_timed_iter(self):
+        """测试异步迭代的等待时间按次累加"""
+        async def source():
+            for item in (b"a", b"b"):
+                await asyncio.sleep(0)
+                yield item
+
+        trace = Trace()
+        token = tracing._current.set(trace)
+        try:
+            items = [item async for item in timed_iter(source(), "recv")]
+        finally:
+            tracing._current.reset(token)
+        self.assertEqual(items, [b"a", b"b"])
+        self.assertEqual(trace.spans["recv"][1], 3)  # 两项加上结束
+
+
+class TestMiddleware(unittest.IsolatedAsyncioTestCase):
+    """测试中间件"""
+
+    async def asyncSetUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "trace.jsonl")
+
+    async def asyncTearDown(self):
+        self.temp_dir.cleanup()
+
+    async def call(self, middleware):
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware({"type": "http", "method": "POST", "path": "/api/files/upload"}, None, send)
+        return sent
+
+    async def test_header_and_trace_file(self):
+        """测试响应头带Server-Timing，响应体之后的阶段写入追踪文件"""
+        async def app(scope, receive, send):
+            record_span("hash", 0.004)
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+            record_span("stream", 0.002)
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        writer = TraceWriter(self.path)
+        sent = await self.call(TracingMiddleware(app, server_timing=True, writer=writer))
+        writer.close()
+
+        headers = dict(sent[0]["headers"])
+        self.assertTrue(headers[b"server-timing"].startswith(b"hash;dur=4.00, total;dur="))
+        with open(self.path, encoding="utf-8") as f:
+            record = json.loads(f.readline())
+        self.assertEqual((record["method"], record["path"], record["status"]), ("POST", "/api/files/upload", 200))
+        self.assertEqual(set(record["spans"]), {"hash", "stream"})
+
+    async def test_min_ms_filters_fast_requests(self):
+        """测试快于阈值的请求不写入追踪文件，关闭响应头时不添加"""
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 204, "headers": []})
+
+        writer = TraceWriter(self.path, min_ms=10_000)
+        sent = await self.call(TracingMiddleware(app, server_timing=False, writer=writer))
+        writer.close()
+
+        self.assertEqual(sent[0]["headers"], [])
+        self.assertFalse(os.path.exists(self.path))
+
+
+    async def test_private_spans_and_auth_paths_hidden(self):
+        """测试bcrypt阶段只写入追踪文件，/api/auth/下的响应不附加Server-Timing"""
+        async def app(scope, receive, send):
+            record_span("bcrypt", 0.3)
+            record_span("db_query", 0.001)
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+
+        writer = TraceWriter(self.path)
+        middleware = TracingMiddleware(app, server_timing=True, writer=writer)
+        sent = await self.call(middleware)
+        header = dict(sent[0]["headers"])[b"server-timing"]
+        self.assertNotIn(b"bcrypt", header)
+        self.assertTrue(header.startswith(b"db_query;dur="))
+
+        login = []
+
+        async def send(message):
+            login.append(message)
+
+        await middleware({"type": "http", "method": "POST", "path": "/api/auth/login"}, None, send)
+        writer.close()
+        self.assertEqual(login[0]["headers"], [])
+        with open(self.path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([set(record["spans"]) for record in records], [{"bcrypt", "db_query"}] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
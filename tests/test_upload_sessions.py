@@ -0,0 +1,316 @@
+"""
+Wenxi网盘 - 断点续传上传会话测试
+作者：Wenxi
+功能：验证分块位图与缺失区间、超大声明在预分配前被拒绝、会话隔离与过期、分块校验、并发记录不丢失、
+      分块到达即加密写入预分配的密文文件，以及整体SHA256随分块到达累积、暂存明文受进程额度限制、
+      进度丢失或闲置时从数据文件补算，各加密块的Merkle叶子随加密写好
+"""
+
+import os
+import random
+import sys
+import asyncio
+import hashlib
+import tempfile
+import unittest
+from collections import namedtuple
+from datetime import timedelta
+from unittest.mock import patch
+
+# 添加backend目录到路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from models import Base, User, UploadSession
+from utils import upload_sessions
+from utils.crypto_engine import CryptoEngine
+from utils.encryption import DecryptStream
+from utils.upload_sessions import (
+    FileTooLarge, InsufficientStorage, PartBusy, PartError, bit_ranges, count_bits, create_session, data_path,
+    file_checksum, get_session, has_bit, mark_received, missing_ranges, part_lock, purge_expired_sessions,
+    read_leaves, receive_part, received_bytes, set_bit, write_part
+)
+
+CHUNK = 64 * 1024
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+
+async def body(*pieces):
+    for piece in pieces:
+        yield piece
+
+
+class TestBitmap(unittest.TestCase):
+    """测试分块位图"""
+
+    def test_set_bits_out_of_order(self):
+        """测试乱序、重复置位后计数与区间正确，位图按需补零"""
+        bitmap = b""
+        for index in (4, 1, 2, 7, 3, 2, 20):
+            bitmap = set_bit(bitmap, index)
+        self.assertEqual(len(bitmap), 3)
+        self.assertEqual(count_bits(bitmap), 6)
+        self.assertTrue(has_bit(bitmap, 7))
+        self.assertFalse(has_bit(bitmap, 5))
+        self.assertFalse(has_bit(bitmap, 100))
+        self.assertEqual(bit_ranges(bitmap, 24), [[1, 5], [7, 8], [20, 21]])
+        self.assertEqual(bit_ranges(bitmap, 22, value=False), [[0, 1], [5, 7], [8, 20], [21, 22]])
+
+    def test_ranges_limited_to_count(self):
+        """测试区间只统计前count位，全满与全空的边界"""
+        self.assertEqual(bit_ranges(b"\xff\xff", 10), [[0, 10]])
+        self.assertEqual(bit_ranges(b"\xff\xff", 10, value=False), [])
+        self.assertEqual(bit_ranges(b"", 3, value=False), [[0, 3]])
+        self.assertEqual(bit_ranges(b"", 0, value=False), [])
+
+    def test_ranges_match_bitwise_scan(self):
+        """测试按字节跳过全0/全1字节的扫描与逐位扫描结果一致，长位图整段跳过"""
+        def naive(bitmap, count, value):
+            ranges = []
+            for index in range(count):
+                if has_bit(bitmap, index) == value:
+                    if ranges and ranges[-1][1] == index:
+                        ranges[-1][1] += 1
+                    else:
+                        ranges.append([index, index + 1])
+            return ranges
+
+        rng = random.Random(7)
+        for _ in range(200):
+            bitmap = bytes(rng.choice((0, 0xFF, rng.randrange(256))) for _ in range(rng.randrange(8)))
+            count = rng.randrange(len(bitmap) * 8 + 12)
+            for value in (True, False):
+                self.assertEqual(bit_ranges(bitmap, count, value), naive(bitmap, count, value), (bitmap, count))
+
+        bitmap = set_bit(b"\xff" * 100000, 800003)
+        self.assertEqual(bit_ranges(bitmap, 800010), [[0, 800000], [800003, 800004]])
+        self.assertEqual(bit_ranges(bitmap, 800010, value=False), [[800000, 800003], [800004, 800010]])
+
+
+class TestUploadSessions(unittest.IsolatedAsyncioTestCase):
+    """测试会话读写"""
+
+    async def asyncSetUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.storage = os.environ.get("WENXI_FILE_STORAGE_PATH")
+        os.environ["WENXI_FILE_STORAGE_PATH"] = self.temp_dir.name
+        # 文件数据库：并发测试需要多个独立连接
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.temp_dir.name, 'test.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.db = self.Session()
+        self.user = User(username="wenxi", email="wenxi@example.com", hashed_password="x")
+        self.other = User(username="other", email="other@example.com", hashed_password="x")
+        self.db.add_all([self.user, self.other])
+        await self.db.commit()
+        upload_sessions.hash_states.clear()  # 进程级状态，各测试从零开始
+        upload_sessions.pending_budget.used = 0
+        self.engine_backup = upload_sessions.crypto_engine
+        upload_sessions.crypto_engine = CryptoEngine(workers=3, executor_type="thread")
+
+    async def asyncTearDown(self):
+        upload_sessions.crypto_engine.shutdown()
+        upload_sessions.crypto_engine = self.engine_backup
+        await self.db.close()
+        await self.engine.dispose()
+        if self.storage is None:
+            os.environ.pop("WENXI_FILE_STORAGE_PATH", None)
+        else:
+            os.environ["WENXI_FILE_STORAGE_PATH"] = self.storage
+        self.temp_dir.cleanup()
+
+    async def test_create_validates(self):
+        """测试分块大小越界与负数大小被拒绝"""
+        with self.assertRaises(ValueError):
+            await create_session(self.db, self.user.id, "a.bin", 100, chunk_size=1024)
+        with self.assertRaises(ValueError):
+            await create_session(self.db, self.user.id, "a.bin", -1)
+
+    async def test_create_rejects_oversized_before_allocating(self):
+        """测试超过上限或超过剩余空间的声明大小在预分配之前被拒绝"""
+        with self.assertRaises(FileTooLarge):
+            await create_session(self.db, self.user.id, "a.bin", 10 ** 15)
+        with patch.object(upload_sessions, "MAX_UPLOAD_SIZE", 10 ** 15), \
+                patch.object(upload_sessions.shutil, "disk_usage", return_value=DiskUsage(0, 0, CHUNK)):
+            with self.assertRaises(InsufficientStorage):
+                await create_session(self.db, self.user.id, "a.bin", 10 ** 15)
+            self.assertEqual(await self.db.scalar(select(func.count()).select_from(UploadSession)), 0)
+            self.assertEqual(os.listdir(upload_sessions.get_temp_chunks_path()), [])
+
+    async def test_session_isolated_and_expires(self):
+        """测试其他用户和过期会话视为不存在，过期会话被清理"""
+        session = await create_session(self.db, self.user.id, "a.bin", 3 * CHUNK, CHUNK)
+        self.assertIsNotNone(await get_session(self.db, session.id, self.user.id))
+        self.assertIsNone(await get_session(self.db, session.id, self.other.id))
+
+        await write_part(session, 0, body(b"a" * CHUNK))
+        await self.db.execute(update(UploadSession).where(UploadSession.id == session.id)
+                              .values(expires_at=upload_sessions.utcnow() - timedelta(seconds=1)))
+        await self.db.commit()
+        self.assertIsNone(await get_session(self.db, session.id, self.user.id))
+        self.assertEqual(await purge_expired_sessions(self.db), 1)
+        self.assertFalse(os.path.exists(data_path(session.id)))
+
+    async def test_write_part_validates(self):
+        """测试序号越界、大小不符、校验失败时报错，最后一块可以较短"""
+        session = await create_session(self.db, self.user.id, "a.bin", CHUNK + 10, CHUNK)
+        with self.assertRaises(PartError):
+            await write_part(session, 2, body(b"x"))
+        with self.assertRaises(PartError):
+            await write_part(session, 0, body(b"x" * 10))
+        with self.assertRaises(PartError):
+            await write_part(session, 1, body(b"y" * 10), expected_hash="0" * 64)
+
+        tail = b"y" * 10
+        self.assertEqual(await write_part(session, 1, body(tail[:4], tail[4:]), hashlib.sha256(tail).hexdigest()), 10)
+
+    async def test_rejected_part_writes_nothing(self):
+        """测试校验失败的分块不写入密文，已写入但未记录的分块只接受相同内容（同一nonce不加密两份明文）"""
+        session = await create_session(self.db, self.user.id, "a.bin", 2 * CHUNK, CHUNK)
+        with open(data_path(session.id), 'rb') as f:
+            before = f.read()
+        with self.assertRaises(PartError):
+            await write_part(session, 0, body(b"x" * CHUNK), expected_hash="0" * 64)
+        with open(data_path(session.id), 'rb') as f:
+            self.assertEqual(f.read(), before)
+
+        content = os.urandom(CHUNK)
+        await write_part(session, 0, body(content))
+        with self.assertRaises(PartError):
+            await write_part(session, 0, body(b"x" * CHUNK))
+        self.assertEqual(await write_part(session, 0, body(content)), CHUNK)
+
+    async def test_concurrent_marks_not_lost(self):
+        """测试多个连接同时记录分块时不丢失更新"""
+        session = await create_session(self.db, self.user.id, "a.bin", 40 * CHUNK, CHUNK)
+
+        async def mark(index):
+            async with self.Session() as db:
+                await mark_received(db, session.id, index)
+
+        await asyncio.gather(*(mark(index) for index in range(40)))
+        loaded = await get_session(self.db, session.id, self.user.id)
+        self.assertEqual(loaded.received, b"\xff" * 5)
+        self.assertEqual(loaded.version, 40)
+        self.assertEqual(received_bytes(loaded), 40 * CHUNK)
+        self.assertEqual(missing_ranges(loaded), [])
+
+    async def upload(self, session, content, order):
+        for index in order:
+            piece = content[index * session.chunk_size:(index + 1) * session.chunk_size]
+            await receive_part(self.db, session, index, body(piece[:3000], piece[3000:]))
+
+    async def test_parts_encrypted_in_place(self):
+        """测试数据文件创建时即为完整的v3密文，乱序到达的分块加密写入各自偏移，整体哈希与叶子随到达累积"""
+        upload_sessions.V3_CHUNK_SIZE, block = CHUNK, upload_sessions.V3_CHUNK_SIZE
+        upload_sessions.WRITE_BUFFER_SIZE, buffer = 1000, upload_sessions.WRITE_BUFFER_SIZE
+        try:
+            size = 4 * CHUNK + 5  # 每个分块含两个加密块，最后一块较短
+            session = await create_session(self.db, self.user.id, "a.bin", size, 2 * CHUNK)
+            self.assertEqual(session.block_size, CHUNK)
+            self.assertEqual(DecryptStream(data_path(session.id)).size, size)
+
+            content = os.urandom(size)
+            await self.upload(session, content, (2, 0, 1))  # 分块2暂存，轮到时直接计入
+        finally:
+            upload_sessions.V3_CHUNK_SIZE = block
+            upload_sessions.WRITE_BUFFER_SIZE = buffer
+
+        state = upload_sessions.hash_states[session.id]
+        self.assertEqual((state.next_index, state.pending, state.pending_bytes), (3, {}, 0))
+        session = await get_session(self.db, session.id, self.user.id)
+        self.assertEqual(missing_ranges(session), [])
+        self.assertEqual(received_bytes(session), size)
+        stream = DecryptStream(data_path(session.id))
+        self.assertEqual(b"".join(stream.iter_range(0, stream.size)), content)
+        self.assertEqual(await file_checksum(session), (hashlib.sha256(content).hexdigest(), size))
+        _, leaves = await upload_sessions.crypto_engine.block_hashes(data_path(session.id))
+        self.assertEqual(read_leaves(session.id, 5), leaves)
+
+    async def test_checksum_falls_back_to_data_file(self):
+        """测试未暂存的乱序分块和丢失的哈希进度从数据文件补算，结果一致"""
+        upload_sessions.HASH_PENDING_LIMIT, limit = 0, upload_sessions.HASH_PENDING_LIMIT
+        upload_sessions.READ_BUFFER_SIZE, read_size = CHUNK, upload_sessions.READ_BUFFER_SIZE
+        try:
+            size = 5 * CHUNK - 7
+            session = await create_session(self.db, self.user.id, "a.bin", size, CHUNK)
+            content = os.urandom(size)
+            await self.upload(session, content, (1, 2, 0, 4))
+            self.assertEqual(upload_sessions.hash_states[session.id].next_index, 3)
+            await self.upload(session, content, (3,))
+
+            session = await get_session(self.db, session.id, self.user.id)
+            expected = (hashlib.sha256(content).hexdigest(), size)
+            self.assertEqual(await file_checksum(session), expected)
+            del upload_sessions.hash_states[session.id]  # 模拟服务重启
+            self.assertEqual(await file_checksum(session), expected)
+        finally:
+            upload_sessions.HASH_PENDING_LIMIT = limit
+            upload_sessions.READ_BUFFER_SIZE = read_size
+
+    async def test_pending_limited_by_process_budget(self):
+        """测试进程额度用尽后乱序分块不再暂存，改从数据文件补算，额度在计入后全部归还"""
+        size = 4 * CHUNK
+        sessions = [await create_session(self.db, self.user.id, f"{i}.bin", size, CHUNK) for i in range(2)]
+        contents = [os.urandom(size) for _ in sessions]
+        with patch.object(upload_sessions.pending_budget, "limit", 2 * CHUNK):
+            for session, content in zip(sessions, contents):
+                await self.upload(session, content, (2, 3))
+            self.assertEqual(upload_sessions.pending_budget.used, 2 * CHUNK)
+            self.assertEqual(upload_sessions.hash_states[sessions[1].id].pending, {})
+
+            for session, content in zip(sessions, contents):
+                await self.upload(session, content, (0, 1))
+                session = await get_session(self.db, session.id, self.user.id)
+                self.assertEqual(await file_checksum(session), (hashlib.sha256(content).hexdigest(), size))
+        self.assertEqual(upload_sessions.pending_budget.used, 0)
+
+    async def test_idle_hash_state_evicted(self):
+        """测试超过会话有效期未收到分块的哈希进度在清理时丢弃并归还额度"""
+        session = await create_session(self.db, self.user.id, "a.bin", 2 * CHUNK, CHUNK)
+        await self.upload(session, os.urandom(2 * CHUNK), (1,))
+        state = upload_sessions.hash_states[session.id]
+        self.assertEqual(upload_sessions.pending_budget.used, CHUNK)
+
+        state.touched -= upload_sessions.SESSION_TTL + 1
+        await purge_expired_sessions(self.db)
+        self.assertNotIn(session.id, upload_sessions.hash_states)
+        self.assertEqual(upload_sessions.pending_budget.used, 0)
+
+    async def test_received_part_not_overwritten(self):
+        """测试已接收的分块重复上传时直接确认不覆盖，正在上传的分块拒绝并发写入"""
+        session = await create_session(self.db, self.user.id, "a.bin", 2 * CHUNK, CHUNK)
+        content = os.urandom(2 * CHUNK)
+        await self.upload(session, content, (0,))
+        size, bitmap = await receive_part(self.db, session, 0, body(b"z" * CHUNK))
+        self.assertEqual((size, count_bits(bitmap)), (CHUNK, 1))
+
+        with part_lock(session.id, 1):
+            with self.assertRaises(PartBusy):
+                await receive_part(self.db, session, 1, body(content[CHUNK:]))
+        await self.upload(session, content, (1,))
+
+        session = await get_session(self.db, session.id, self.user.id)
+        stream = DecryptStream(data_path(session.id))
+        self.assertEqual(b"".join(stream.iter_range(0, stream.size)), content)
+        self.assertEqual(await file_checksum(session), (hashlib.sha256(content).hexdigest(), 2 * CHUNK))
+
+    async def test_empty_file(self):
+        """测试空文件会话没有分块，数据文件即为可解密的空密文"""
+        session = await create_session(self.db, self.user.id, "empty.bin", 0, CHUNK)
+        self.assertEqual(missing_ranges(session), [])
+        self.assertEqual(await file_checksum(session), (hashlib.sha256(b"").hexdigest(), 0))
+
+    async def test_missing_ranges(self):
+        """测试缺失区间是已接收区间的补集"""
+        session = await create_session(self.db, self.user.id, "a.bin", 10 * CHUNK, CHUNK)
+        for index in (1, 2, 5):
+            await mark_received(self.db, session.id, index)
+        session = await get_session(self.db, session.id, self.user.id)
+        self.assertEqual(missing_ranges(session), [[0, 1], [3, 5], [6, 10]])
+
+if __name__ == '__main__':
+    unittest.main()